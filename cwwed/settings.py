@@ -143,14 +143,6 @@ CACHES = {
         'BACKEND': 'redis_cache.RedisCache',
         'LOCATION': '{}:6379'.format(os.environ.get('CELERY_BROKER', 'localhost')),
     },
-    'psa_contours': {
-        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
-        'LOCATION': 'cache_psa_contours',
-        'TIMEOUT': None,  # never expire, but this only applies to low level cache operations whereas cache_page() requires a timeout
-        'OPTIONS': {
-            'MAX_ENTRIES': 5000,
-        }
-    }
 }
 
 # Password validation
@@ -329,6 +321,9 @@ CWWED_NSEM_PASSWORD = os.environ.get('CWWED_NSEM_PASSWORD')
 CWWED_NSEM_GROUP = 'nsem'
 CWWED_DEM_GROUP = 'dem'
 CWWED_NSEM_TMP_USER_EXPORT_DIR_NAME = '.tmp_nsem_user_export'
+CWWED_NSEM_CACHE_DIR_NAME = '.cache'
+CWWED_NSEM_STORE_DIR_NAME = '.store'
+CWWED_NSEM_ARTIFACTS_DIR_NAME = '.psa_artifacts'
 CWWED_NSEM_S3_USER_EXPORT_DIR_NAME = 'User Exports'
 
 CWWED_ARCHIVES_ACCESS_KEY_ID = os.environ['CWWED_ARCHIVES_ACCESS_KEY_ID']
@@ -336,12 +331,29 @@ CWWED_ARCHIVES_SECRET_ACCESS_KEY = os.environ['CWWED_ARCHIVES_SECRET_ACCESS_KEY'
 
 CWWED_PSA_USER_DATA_EXPORT_DAYS = 1
 
-CWWED_CACHE_PSA_CONTOURS_DAYS = 365
-CWWED_CACHE_PSA_CONTOURS_SECONDS = 60 * 60 * 24 * CWWED_CACHE_PSA_CONTOURS_DAYS
-
 # separate queue to handle processing PSAs so they don't interfere with the default queue
 CWWED_QUEUE_PROCESS_PSA = 'process-psa'
 
+# number of psa dates each ingest task processes for a time-series variable (0 processes every date in a single task)
+CWWED_PSA_INGEST_DATES_PER_TASK = int(os.environ.get('CWWED_PSA_INGEST_DATES_PER_TASK', 0))
+# number of psa dates to commit at a time while ingesting a time-series variable
+CWWED_PSA_INGEST_BATCH_SIZE = int(os.environ.get('CWWED_PSA_INGEST_BATCH_SIZE', 10))
+# number of mesh node values (nodes x dates for time-series) read, clipped and copied into the database at a time while ingesting psa data.
+# peak ingest memory is roughly one full date of a variable (needed for contouring) plus ~40 bytes per value in a chunk
+CWWED_PSA_INGEST_CHUNK_SIZE = int(os.environ.get('CWWED_PSA_INGEST_CHUNK_SIZE', 1000000))
+# number of threads used to build a psa variable's contour levels concurrently
+CWWED_PSA_CONTOUR_WORKERS = int(os.environ.get('CWWED_PSA_CONTOUR_WORKERS', 1))
+# number of psa dataset node indexes (KD-trees) each web worker keeps in memory
+CWWED_PSA_NODE_INDEX_CACHE_SIZE = int(os.environ.get('CWWED_PSA_NODE_INDEX_CACHE_SIZE', 8))
+# psa contour simplification tolerances (degrees) of the levels of detail pre-rendered in addition to full resolution
+CWWED_PSA_CONTOUR_TOLERANCES = [float(t) for t in os.environ.get('CWWED_PSA_CONTOUR_TOLERANCES', '0.0005,0.002,0.008').split(',') if t]
+# number of threads rendering a psa's contour artifacts (variables/dates/levels of detail) concurrently
+CWWED_PSA_CONTOUR_ARTIFACT_WORKERS = int(os.environ.get('CWWED_PSA_CONTOUR_ARTIFACT_WORKERS', 4))
+# psa wind barb decimation levels (grid cell sizes in degrees) precomputed once a psa is ingested
+CWWED_PSA_WIND_BARB_CELL_SIZES = [float(c) for c in os.environ.get('CWWED_PSA_WIND_BARB_CELL_SIZES', '0.01,0.04,0.16').split(',') if c]
+# maximum zoom level of psa contour vector tiles pre-seeded over the storm's extent once a psa is ingested (0 disables seeding)
+CWWED_PSA_CONTOUR_TILE_SEED_MAX_ZOOM = int(os.environ.get('CWWED_PSA_CONTOUR_TILE_SEED_MAX_ZOOM', 0))
+
 OPENDAP_URL = 'http://{}:9000/opendap/'.format(os.environ.get('OPENDAP_HOST', 'localhost'))
 
 SLACK_BOT_TOKEN = os.environ['SLACK_BOT_TOKEN']
@@ -1,4 +1,8 @@
+from django.contrib import messages
 from django.contrib.gis import admin
+from named_storms.api.viewsets import NsemPsaViewSet
+from named_storms.psa.artifacts import PsaContourArtifacts
+from named_storms.sql import create_psa_staging_tables_query, drop_psa_staging_tables_query
 from named_storms.models import (
     NamedStorm, CoveredData, CoveredDataProvider, NamedStormCoveredData, NsemPsa,
     NamedStormCoveredDataLog, NsemPsaContour,
@@ -75,6 +79,41 @@ class NSEMAdmin(admin.GeoModelAdmin):
     list_filter = ('named_storm__name', 'date_created', 'extracted', 'validated', 'processed',)
     readonly_fields = ('date_created',)
     inlines = (NsemPsaVariableInline, NsemPsaManifestDatasetInline,)
+    actions = ('reingest', 'full_reingest',)
+
+    def reingest(self, request, queryset):
+        # reingest into staging tables which are swapped in once complete so the current psa data is served until then
+        queryset = queryset.filter(extracted=True, validated=True)
+        # migrated nodes aren't in mesh order so they can't be partially reingested
+        legacy = queryset.filter(nsempsamanifestdataset__legacy_nodes=True).distinct()
+        if legacy.exists():
+            self.message_user(
+                request, 'PSA(s) {} have migrated nodes and require a full reingest'.format(
+                    ', '.join(str(nsem_psa.id) for nsem_psa in legacy)), level=messages.WARNING)
+        queryset = queryset.exclude(id__in=legacy)
+        for nsem_psa in queryset:
+            create_psa_staging_tables_query(nsem_psa.id)
+            NsemPsaViewSet.get_ingest_psa_chain(nsem_psa.id)()
+        self.message_user(request, 'Reingesting {} PSA(s)'.format(queryset.count()))
+    reingest.short_description = 'Reingest selected PSAs'
+
+    def full_reingest(self, request, queryset):
+        # reingest in place which takes the psa offline (unprocessed) until it's complete
+        queryset = queryset.filter(extracted=True, validated=True)
+        for nsem_psa in queryset:
+            drop_psa_staging_tables_query(nsem_psa.id)
+            nsem_psa.processed = False
+            nsem_psa.save()
+            # the psa's contour artifacts will be stale
+            PsaContourArtifacts(nsem_psa.named_storm_id, nsem_psa.id).delete()
+            NsemPsaViewSet.get_ingest_psa_chain(nsem_psa.id)()
+        self.message_user(request, 'Fully reingesting {} PSA(s)'.format(queryset.count()))
+    full_reingest.short_description = 'Fully reingest selected PSAs (offline until complete)'
+
+    def delete_queryset(self, request, queryset):
+        # delete individually so every psa's nodes are bulk deleted (see NsemPsa.delete())
+        for nsem_psa in queryset:
+            nsem_psa.delete()
 
 
 @admin.register(NsemPsaVariable)
@@ -94,7 +133,7 @@ class NsemPsaVariableAdmin(admin.GeoModelAdmin):
 @admin.register(NsemPsaContour)
 class NsemPsaContourAdmin(admin.GeoModelAdmin):
     list_display = ('nsem_psa_variable', 'value', 'date')
-    list_filter = ('nsem_psa_variable__nsem__named_storm',)
+    list_filter = ('nsem__named_storm',)
 
 
 @admin.register(NsemPsaUserExport)
@@ -0,0 +1,105 @@
+import tempfile
+from typing import IO, Iterable, Iterator
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# rows per record batch built from query results
+ARROW_BATCH_SIZE = 50000
+
+PSA_DATA_SCHEMA = pa.schema([
+    ('node', pa.int64()),
+    ('name', pa.string()),
+    ('date', pa.timestamp('s', tz='UTC')),
+    ('value', pa.float64()),
+    ('lon', pa.float64()),
+    ('lat', pa.float64()),
+])
+
+PSA_TIME_SERIES_SCHEMA = pa.schema([
+    ('point', pa.int32()),  # position of the requested point
+    ('lon', pa.float64()),
+    ('lat', pa.float64()),
+    ('name', pa.string()),
+    ('date', pa.timestamp('s', tz='UTC')),
+    ('value', pa.float64()),
+])
+
+
+class _StreamSink:
+    """
+    write-only file which collects what's been written since it was last drained so an arrow stream
+    can be yielded as each record batch is written
+    """
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def record_batches(rows: Iterable[tuple], schema: pa.Schema, batch_size: int = None) -> Iterator[pa.RecordBatch]:
+    """
+    Builds record batches of a schema's columns from (query result) rows a batch at a time
+    """
+    batch_size = batch_size or ARROW_BATCH_SIZE
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield _record_batch(batch, schema)
+            batch = []
+    if batch:
+        yield _record_batch(batch, schema)
+
+
+def _record_batch(rows: list, schema: pa.Schema) -> pa.RecordBatch:
+    return pa.RecordBatch.from_arrays([pa.array(column, field.type) for column, field in zip(zip(*rows), schema)], schema=schema)
+
+
+def iter_arrow_stream(schema: pa.Schema, batches: Iterable[pa.RecordBatch]) -> Iterator[bytes]:
+    """
+    Yields an arrow (ipc) stream of record batches as each one is written
+    """
+    sink = _StreamSink()
+    writer = pa.ipc.new_stream(pa.PythonFile(sink, mode='w'), schema)
+    for batch in batches:
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def write_parquet(schema: pa.Schema, batches: Iterable[pa.RecordBatch]) -> IO[bytes]:
+    """
+    Writes record batches to a temporary parquet file (a row group per batch) and returns it ready to be read
+    """
+    f = tempfile.TemporaryFile()
+    writer = pq.ParquetWriter(f, schema, compression='snappy')
+    try:
+        for batch in batches:
+            writer.write_table(pa.Table.from_batches([batch], schema=schema))
+    finally:
+        writer.close()
+    f.seek(0)
+    return f
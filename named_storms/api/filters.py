@@ -1,7 +1,10 @@
 from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.geos import GEOSGeometry, GEOSException
 from django.db.models.functions import Cast
 from django_filters import rest_framework as filters
-from named_storms.models import NsemPsaContour, NsemPsaVariable, NsemPsaData
+from rest_framework import exceptions
+from named_storms.models import NsemPsaContour, NsemPsaContourLevel, NsemPsaVariable, NsemPsaData, NsemPsaManifestDataset
+from named_storms.psa.node_index import PsaNodeIndex
 
 
 class NsemPsaDataFilterBase(filters.FilterSet):
@@ -26,15 +29,44 @@ class NsemPsaContourFilter(NsemPsaDataFilterBase):
         }
 
 
+class NsemPsaContourLevelFilter(NsemPsaContourFilter):
+    class Meta(NsemPsaContourFilter.Meta):
+        model = NsemPsaContourLevel
+
+
 class NsemPsaDataFilter(NsemPsaDataFilterBase):
     point = filters.CharFilter(method='filter_point')
 
+    # tolerance (meters) of a node matching the point when using the psa datasets' node indexes
+    POINT_TOLERANCE = 1
+
     def filter_point(self, queryset, name, value):
-        # cast point to geometry then test equality
+        try:
+            point = GEOSGeometry(value)
+        except (TypeError, ValueError, GEOSException) as e:
+            raise exceptions.ValidationError({name: ['invalid point ({})'.format(e)]})
+        if point.geom_type != 'Point':
+            raise exceptions.ValidationError({name: ['expected a Point but received a {}'.format(point.geom_type)]})
+
+        # match the point's nodes using the psa datasets' node indexes if they've all been built
+        node_ids = []
+        for psa_manifest_dataset in NsemPsaManifestDataset.objects.filter(nsem__in=queryset.values('nsem')[:1]):
+            node_index = PsaNodeIndex.load(psa_manifest_dataset)
+            if node_index is None:
+                break
+            positions, found = node_index.nearest([point.x], [point.y], self.POINT_TOLERANCE)
+            node_ids.extend(node_index.ids[positions[found]].tolist())
+        else:
+            # there aren't any nodes at the point
+            if not node_ids:
+                return queryset.none()
+            return queryset.filter(node__in=node_ids)
+
+        # cast node's point to geometry then test equality
         return queryset.annotate(
-            point_geom=Cast('point', GeometryField()),
+            point_geom=Cast('node__point', GeometryField()),
         ).filter(
-            point_geom__equals=value,
+            point_geom__equals=point,
         )
 
     class Meta:
@@ -0,0 +1,123 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.db.models import QuerySet
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class PsaDataKeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination of a single psa variable's data ordered by (date, id) which seeks straight to the next
+    page using the (nsem_psa_variable, date, id) index instead of scanning an offset, and doesn't count the results.
+
+    The opaque cursor is the last result's (date, id).  "max-values" variables don't have dates so their
+    data is only ordered by id.
+    """
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+    default_limit = 100
+    max_limit = 10000
+    invalid_cursor_message = 'Invalid cursor'
+
+    ordering = ('date', 'id')
+
+    def paginate_queryset(self, queryset: QuerySet, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+
+        queryset = queryset.order_by(*self.ordering)
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            date, last_id = cursor
+            if date is None:
+                queryset = queryset.filter(date__isnull=True, id__gt=last_id)
+            else:
+                # row comparison so postgres seeks the index to the cursor's position
+                queryset = queryset.extra(
+                    where=['({table}.date, {table}.id) > (%s, %s)'.format(table=queryset.model._meta.db_table)],
+                    params=[date, last_id],
+                )
+
+        # fetch an extra result to know if there's a next page
+        results = list(queryset[:self.limit + 1])
+        self.has_next = len(results) > self.limit
+        self.results = results[:self.limit]
+        return self.results
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.results[-1]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(last.date, last.id))
+
+    def get_limit(self, request) -> int:
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return self.default_limit
+        return max(1, min(limit, self.max_limit))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            date, last_id = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            if date is not None:
+                date = parse_datetime(date)
+                if date is None:
+                    raise ValueError
+            return date, int(last_id)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def encode_cursor(date, last_id: int) -> str:
+        return urlsafe_b64encode(json.dumps([date.isoformat() if date else None, last_id]).encode('utf-8')).decode('ascii')
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {
+                    'type': 'string',
+                },
+            },
+            {
+                'name': self.limit_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {
+                    'type': 'integer',
+                },
+            },
+        ]
@@ -0,0 +1,13 @@
+from rest_framework.permissions import DjangoModelPermissionsOrAnonReadOnly
+
+
+class DjangoModelPermissionsOrAnonReadOnlyBatch(DjangoModelPermissionsOrAnonReadOnly):
+    """
+    The default model permissions which also allow anyone to POST to the (read-only) batch action, i.e
+    many points' time-series in a single request, while every other write still requires the model permissions
+    """
+
+    def has_permission(self, request, view):
+        if request.method == 'POST' and getattr(view, 'action', None) == 'batch':
+            return True
+        return super().has_permission(request, view)
@@ -0,0 +1,44 @@
+from rest_framework.renderers import JSONRenderer
+
+
+class GeoJSONRenderer(JSONRenderer):
+    """
+    GeoJSON format which views stream directly (i.e `?format=geojson`) and is otherwise rendered as json (i.e errors)
+    """
+    media_type = 'application/geo+json'
+    format = 'geojson'
+
+
+class NDJSONRenderer(JSONRenderer):
+    """
+    Newline delimited GeoJSON features format which views stream directly (i.e `?format=ndjson`) and is otherwise
+    rendered as json (i.e errors)
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+class CSVRenderer(JSONRenderer):
+    """
+    CSV format which views stream directly (i.e `?format=csv`) and is otherwise rendered as json (i.e errors)
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class ArrowStreamRenderer(JSONRenderer):
+    """
+    Apache Arrow (ipc) stream format which views stream directly (i.e `?format=arrow`) and is otherwise rendered as
+    json (i.e errors)
+    """
+    media_type = 'application/vnd.apache.arrow.stream'
+    format = 'arrow'
+
+
+class ParquetRenderer(JSONRenderer):
+    """
+    Apache Parquet format which views return as a download (i.e `?format=parquet`) and is otherwise rendered as
+    json (i.e errors)
+    """
+    media_type = 'application/vnd.apache.parquet'
+    format = 'parquet'
@@ -220,6 +220,7 @@ class NsemPsaDataSerializer(serializers.ModelSerializer):
     """
     Named Storm Event Model PSA Data Serializer
     """
+    point = serializers.CharField(source='node.point.ewkt', read_only=True)
 
     class Meta:
         model = NsemPsaData
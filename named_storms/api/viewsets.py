@@ -1,44 +1,69 @@
 import csv
+import gzip
+import json
 import logging
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pyarrow as pa
+import pytz
 
 import geojson
 from celery import chain, group, chord
-from django.contrib.gis.db.models.functions import Distance
-from django.db.models.functions import Cast
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, FileResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.http.response import HttpResponseBase
 from django.utils.dateparse import parse_datetime
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
 from django.utils.decorators import method_decorator
 from django.conf import settings
 from django.contrib.gis import geos
+from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.db.models.functions import AsGeoJSON
+from django.db.models import FloatField, Func
+from django.db.models.functions import Cast
 from django.views.decorators.gzip import gzip_page
-from django.views.decorators.cache import cache_control, cache_page
-from django.contrib.gis.db.models import Collect, GeometryField
+from django.views.decorators.cache import cache_control
 from rest_framework import viewsets, mixins
 from rest_framework import exceptions
 from rest_framework.decorators import action
 from rest_framework.permissions import DjangoModelPermissionsOrAnonReadOnly
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.viewsets import GenericViewSet
 
-from named_storms.api.filters import NsemPsaContourFilter, NsemPsaDataFilter
+from named_storms.api.filters import NsemPsaContourFilter, NsemPsaContourLevelFilter, NsemPsaDataFilter
+from named_storms.api.arrow import PSA_DATA_SCHEMA, PSA_TIME_SERIES_SCHEMA, record_batches, iter_arrow_stream, write_parquet
+from named_storms.api.renderers import GeoJSONRenderer, NDJSONRenderer, CSVRenderer, ArrowStreamRenderer, ParquetRenderer
+from named_storms.api.pagination import PsaDataKeysetPagination
+from named_storms.api.permissions import DjangoModelPermissionsOrAnonReadOnlyBatch
 from named_storms.api.mixins import UserReferenceViewSetMixin
-from named_storms.sql import wind_barbs_query
+from named_storms.psa.artifacts import PsaContourArtifacts
+from named_storms.psa.node_index import PsaNodeIndex
+from named_storms.psa.store import PsaStore
+from named_storms.sql import wind_barbs_query, nearest_psa_nodes_query, wind_barbs_expand_distance, psa_contour_tile_query
 from named_storms.tasks import (
     create_named_storm_covered_data_snapshot_task, extract_nsem_psa_task, email_nsem_user_covered_data_complete_task,
     extract_named_storm_covered_data_snapshot_task, create_psa_user_export_task,
     email_psa_user_export_task, validate_nsem_psa_task,
-    postprocess_psa_ingest_task, cache_psa_contour_task,
+    postprocess_psa_ingest_task, write_psa_contour_artifacts_task, seed_psa_contour_tiles_task,
     ingest_nsem_psa_dataset_variable_task, postprocess_psa_validated_task,
+    ingest_nsem_psa_dataset_variable_dates_task, ingest_nsem_psa_statistics_task, ingest_nsem_psa_nodes_task,
+    ingest_nsem_psa_dataset_variable_time_series_task, swap_nsem_psa_staging_task, ingest_nsem_psa_wind_barbs_task,
 )
 from named_storms.models import (
-    NamedStorm, CoveredData, NsemPsa, NsemPsaVariable, NsemPsaContour, NsemPsaUserExport, NamedStormCoveredDataSnapshot,
-    NsemPsaData, NsemPsaManifestDataset,
+    NamedStorm, CoveredData, NsemPsa, NsemPsaVariable, NsemPsaContour, NsemPsaContourLevel, NsemPsaUserExport, NamedStormCoveredDataSnapshot,
+    NsemPsaData, NsemPsaManifestDataset, NsemPsaNodeTimeSeries,
 )
 from named_storms.api.serializers import (
     NamedStormSerializer, CoveredDataSerializer, NamedStormDetailSerializer, NsemPsaSerializer, NsemPsaVariableSerializer, NsemPsaUserExportSerializer,
     NamedStormCoveredDataSnapshotSerializer, NsemPsaDataSerializer, NsemPsaTimeSeriesSerializer, NsemPsaManifestDatasetSerializer, NsemPsaWindBarbsSerializer,
     NsemPsaContourSerializer)
-from named_storms.utils import get_geojson_feature_collection_from_psa_qs
+from named_storms.utils import (
+    iter_geojson_feature_collection_from_psa_qs, iter_geojson_feature_collection, iter_ndjson, iter_chunks, get_psa_contour_qs,
+    get_psa_contour_tolerance, MAX_ZOOM,
+)
 
 logger = logging.getLogger('cwwed')
 
@@ -110,45 +135,76 @@ class NsemPsaViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.
         """
 
         nsem_psa = NsemPsa.objects.get(id=nsem_psa_id)
+        dates = sorted(nsem_psa.dates)
+        # time-series variables are ingested in groups of dates per task (defaults to every date in a single task)
+        dates_per_task = settings.CWWED_PSA_INGEST_DATES_PER_TASK or len(dates) or 1
         tasks = []
-        # create tasks to process each variable for each date in each dataset
+        # create tasks to process each variable for each group of dates in each dataset
         for dataset in nsem_psa.nsempsamanifestdataset_set.all():  # type: NsemPsaManifestDataset
             for variable in dataset.variables:
                 # max-values data type so there's no date
                 if NsemPsaVariable.get_variable_attribute(variable, 'data_type') == NsemPsaVariable.DATA_TYPE_MAX_VALUES:
                     tasks.append(ingest_nsem_psa_dataset_variable_task.si(dataset.id, variable))
                 else:
-                    for date in sorted(nsem_psa.dates):
-                        tasks.append(ingest_nsem_psa_dataset_variable_task.si(dataset.id, variable, date))
+                    for i in range(0, len(dates), dates_per_task):
+                        tasks.append(ingest_nsem_psa_dataset_variable_dates_task.si(dataset.id, variable, dates[i:i + dates_per_task]))
+                    # every node's full time-series for point queries
+                    if NsemPsaVariable.get_variable_attribute(variable, 'geo_type') == NsemPsaVariable.GEO_TYPE_POLYGON:
+                        tasks.append(ingest_nsem_psa_dataset_variable_time_series_task.si(dataset.id, variable))
         return tasks
 
-    def perform_create(self, serializer):
-        # save the instance first so we can create a task to extract and validate the model output
-        nsem_psa = serializer.save()  # type: NsemPsa
+    @classmethod
+    def get_ingest_psa_chain(cls, nsem_psa_id):
+        """
+        Creates the chain of tasks to ingest a validated NSEM PSA into CWWED (or to reingest it into staging tables)
+        """
 
-        chain(
-            # extract the psa
-            extract_nsem_psa_task.s(nsem_psa.id),
-            # validate once extracted
-            validate_nsem_psa_task.si(nsem_psa.id),
-            # post-process the validation and email validation result
-            postprocess_psa_validated_task.si(nsem_psa.id),
-            # ingest the psa in parallel by creating tasks for each dataset/variable/date
+        nsem_psa = NsemPsa.objects.get(id=nsem_psa_id)
+
+        return chain(
+            # compute every variable's global statistics once
+            ingest_nsem_psa_statistics_task.si(nsem_psa.id),
+            # save every dataset's mesh nodes once
+            ingest_nsem_psa_nodes_task.si(nsem_psa.id),
+            # ingest the psa in parallel by creating tasks for each dataset/variable/group of dates
             chord(
-                header=self.get_ingest_psa_dataset_tasks(nsem_psa.id),
+                header=cls.get_ingest_psa_dataset_tasks(nsem_psa.id),
                 # then run the following sequentially
                 body=chain(
+                    # precompute the decimated wind barbs from the ingested wind data
+                    ingest_nsem_psa_wind_barbs_task.si(nsem_psa.id),
+                    # swap in the staging tables if the psa was reingested
+                    swap_nsem_psa_staging_task.si(nsem_psa.id),
                     # save psa as processed and send confirmation email
                     postprocess_psa_ingest_task.si(nsem_psa.id, True),  # success
                     # execute these final tasks in parallel
                     group(
-                        # cache geo json for this psa
-                        cache_psa_contour_task.si(nsem_psa.named_storm_id),
+                        chain(
+                            # pre-render the contour geo json for this psa
+                            write_psa_contour_artifacts_task.si(nsem_psa.id),
+                            # then (optionally) pre-seed it's contour vector tiles
+                            seed_psa_contour_tiles_task.si(nsem_psa.id),
+                        ),
                         # download and extract covered data snapshot into file storage so they're available for discovery (i.e opendap)
                         extract_named_storm_covered_data_snapshot_task.si(nsem_psa.id),
                     ),
                 )
-            ).on_error(postprocess_psa_ingest_task.si(nsem_psa.id, False))  # header failure (ingestion failed)
+            ),
+        ).on_error(postprocess_psa_ingest_task.si(nsem_psa.id, False))  # any failure, including before the chord (ingestion failed)
+
+    def perform_create(self, serializer):
+        # save the instance first so we can create a task to extract and validate the model output
+        nsem_psa = serializer.save()  # type: NsemPsa
+
+        chain(
+            # extract the psa
+            extract_nsem_psa_task.s(nsem_psa.id),
+            # validate once extracted
+            validate_nsem_psa_task.si(nsem_psa.id),
+            # post-process the validation and email validation result
+            postprocess_psa_validated_task.si(nsem_psa.id),
+            # ingest the psa
+            self.get_ingest_psa_chain(nsem_psa.id),
         )()
 
 
@@ -179,6 +235,29 @@ class NsemPsaBaseViewSet(viewsets.ReadOnlyModelViewSet):
 
         return super().dispatch(request, *args, **kwargs)
 
+    def columnar_response(self, schema: pa.Schema, batches: Iterable[pa.RecordBatch], filename: str) -> Optional[HttpResponseBase]:
+        """
+        returns the record batches as a streamed arrow response or parquet download if either format was requested
+        """
+        if self.request.accepted_renderer.format == ArrowStreamRenderer.format:
+            return StreamingHttpResponse(iter_arrow_stream(schema, batches), content_type=ArrowStreamRenderer.media_type)
+        elif self.request.accepted_renderer.format == ParquetRenderer.format:
+            return FileResponse(
+                write_parquet(schema, batches), as_attachment=True, filename='{}.parquet'.format(filename), content_type=ParquetRenderer.media_type)
+        return None
+
+    def get_node_indexes(self) -> Optional[List[Tuple[NsemPsaManifestDataset, PsaNodeIndex]]]:
+        """
+        returns every psa dataset's node index, or None if any of them haven't been built (i.e ingested before they existed)
+        """
+        node_indexes = []
+        for psa_manifest_dataset in self.nsem.nsempsamanifestdataset_set.all():
+            node_index = PsaNodeIndex.load(psa_manifest_dataset)
+            if node_index is None:
+                return None
+            node_indexes.append((psa_manifest_dataset, node_index))
+        return node_indexes
+
 
 class NsemPsaVariableViewSet(NsemPsaBaseViewSet):
     # Named Storm Event Model PSA Variable ViewSet
@@ -193,32 +272,67 @@ class NsemPsaVariableViewSet(NsemPsaBaseViewSet):
 class NsemPsaTimeSeriesViewSet(NsemPsaBaseViewSet):
     """
     #### PSA Time Series
+
+    A single point's time-series via GET, or many points' time-series in a single request via POST with either a list
+    of `[lon, lat]` coordinates or a GeoJSON Point, MultiPoint or LineString (transect) geometry/feature, i.e
+
+        {"type": "LineString", "coordinates": [[-74.1, 39.5], [-73.9, 39.7]], "samples": 50}
+
+    A transect's `samples` evenly spaced points are used along the line (defaults to it's vertices).
+    Include `?export=csv` for csv results, `?format=arrow` (or `Accept: application/vnd.apache.arrow.stream`) for an
+    arrow stream or `?format=parquet` for a parquet download.
     """
     queryset = NsemPsaData.objects.all()  # defined in list()
     pagination_class = None
     serializer_class = NsemPsaTimeSeriesSerializer
+    renderer_classes = tuple(api_settings.DEFAULT_RENDERER_CLASSES) + (ArrowStreamRenderer, ParquetRenderer)
+    permission_classes = (DjangoModelPermissionsOrAnonReadOnlyBatch,)  # batches are read-only even though they're posted
 
     POINT_DISTANCE = 500  # meters
+    MAX_POINTS = 1000  # maximum points per batch
 
-    def _as_csv(self, results, lat, lon):
+    def _as_csv(self, point_results: List[Tuple[float, float, list]]):
         response = HttpResponse(content_type='text/csv')
         response['Content-Disposition'] = 'attachment; filename="{}-time-series.csv"'.format(self.nsem.named_storm)
 
         writer = csv.writer(response)
         writer.writerow(['date', 'lat', 'lon', 'name', 'units', 'value'])
-        for result in results:
-            for i, value in enumerate(result['values']):
-                writer.writerow([
-                    self.nsem.dates[i],
-                    lat,
-                    lon,
-                    result['variable'].name,
-                    result['variable'].units,
-                    value,
-                ])
+        for lat, lon, results in point_results:
+            for result in results:
+                for i, value in enumerate(result['values']):
+                    writer.writerow([
+                        self.nsem.dates[i],
+                        lat,
+                        lon,
+                        result['variable'].name,
+                        result['variable'].units,
+                        value,
+                    ])
 
         return response
 
+    def _as_columnar(self, point_results: List[Tuple[float, float, list]]) -> Optional[HttpResponseBase]:
+        # arrow/parquet columns built from every point's time-series arrays
+        return self.columnar_response(
+            PSA_TIME_SERIES_SCHEMA, self._record_batches(point_results), '{}-time-series'.format(self.nsem.named_storm))
+
+    def _record_batches(self, point_results: List[Tuple[float, float, list]]) -> Iterator[pa.RecordBatch]:
+        # a record batch per point
+        dates = pa.array(self.nsem.dates, PSA_TIME_SERIES_SCHEMA.field('date').type)
+        for position, (lat, lon, results) in enumerate(point_results):
+            if not results:
+                continue
+            values = np.concatenate([np.asarray(result['values'], dtype=np.float64) for result in results])
+            counts = [len(result['values']) for result in results]
+            yield pa.RecordBatch.from_arrays([
+                pa.array(np.full(len(values), position, dtype=np.int32)),
+                pa.array(np.full(len(values), lon, dtype=np.float64)),
+                pa.array(np.full(len(values), lat, dtype=np.float64)),
+                pa.array(np.repeat([result['variable'].name for result in results], counts).astype(object), pa.string()),
+                dates.take(pa.array(np.concatenate([np.arange(count) for count in counts]))),
+                pa.array(values),
+            ], schema=PSA_TIME_SERIES_SCHEMA)
+
     def list(self, request, *args, lat=None, lon=None, **kwargs):
 
         # validate supplied coordinates
@@ -228,29 +342,126 @@ class NsemPsaTimeSeriesViewSet(NsemPsaBaseViewSet):
         except ValueError:
             raise exceptions.ValidationError('lat & lon should be floats')
 
-        point = geos.Point(x=lon, y=lat, srid=4326)
-
-        fields_order = ['nsem_psa_variable__name', 'date']
-        fields_values = ('nsem_psa_variable__name', 'value', 'date')
-
-        # time-series data nearest supplied point per variable/date
-        time_series_query = NsemPsaData.objects.annotate(
-            distance=Distance('point', point),
-        ).distinct(
-            *fields_order
-        ).filter(
-            point__dwithin=(point, self.POINT_DISTANCE),
-            nsem_psa_variable__nsem=self.nsem,
-        ).order_by(
-            # sort by ascending distance to get the first result in each group (i.e the nearest to supplied point)
-            *fields_order + ['distance']
-        ).only(
-            *fields_values
-        ).values(
-            *fields_values
-        )
+        results = self._time_series([geos.Point(x=lon, y=lat, srid=4326)])[0]
 
-        results = []
+        # csv export
+        if request.query_params.get('export') == 'csv':
+            return self._as_csv([(lat, lon, results)])
+
+        # arrow/parquet
+        response = self._as_columnar([(lat, lon, results)])
+        if response is not None:
+            return response
+
+        return Response(self.serializer_class(results, many=True).data)
+
+    def batch(self, request, *args, **kwargs):
+
+        points = self._batch_points(request.data)
+
+        point_results = [(point.y, point.x, results) for point, results in zip(points, self._time_series(points))]
+
+        # csv export
+        if request.query_params.get('export') == 'csv':
+            return self._as_csv(point_results)
+
+        # arrow/parquet
+        response = self._as_columnar(point_results)
+        if response is not None:
+            return response
+
+        return Response([
+            {
+                'lat': lat,
+                'lon': lon,
+                'time_series': self.serializer_class(results, many=True).data,
+            } for lat, lon, results in point_results
+        ])
+
+    def _batch_points(self, data) -> List[geos.Point]:
+        # validate and parse the batch's points from coordinates or a geojson geometry/feature
+
+        if isinstance(data, dict) and data.get('type') == 'Feature':
+            data = dict(data.get('geometry') or {}, samples=data.get('samples'))
+
+        try:
+            if isinstance(data, list):
+                points = [geos.Point(x=float(lon), y=float(lat), srid=4326) for lon, lat in data]
+            elif isinstance(data, dict) and data.get('type') in ('Point', 'MultiPoint', 'LineString'):
+                geometry = geos.GEOSGeometry(json.dumps({'type': data['type'], 'coordinates': data.get('coordinates')}), srid=4326)
+                if data['type'] == 'Point':
+                    points = [geometry]
+                elif data['type'] == 'MultiPoint':
+                    points = list(geometry)
+                elif data.get('samples') is not None:
+                    # evenly spaced points along the transect (validated before interpolating so it's bounded)
+                    samples = int(data['samples'])
+                    if not 1 <= samples <= self.MAX_POINTS:
+                        raise exceptions.ValidationError('samples must be between 1 and {}'.format(self.MAX_POINTS))
+                    points = [geometry.interpolate_normalized(i / max(samples - 1, 1)) for i in range(samples)]
+                else:
+                    points = [geos.Point(coords, srid=4326) for coords in geometry.coords]
+            else:
+                raise ValueError('unknown format')
+        except (TypeError, ValueError, geos.GEOSException) as e:
+            raise exceptions.ValidationError(
+                'expected a list of [lon, lat] coordinates or a geojson Point, MultiPoint or LineString ({})'.format(e))
+
+        if not points:
+            raise exceptions.ValidationError('at least one point is required')
+        if len(points) > self.MAX_POINTS:
+            raise exceptions.ValidationError('a maximum of {} points is allowed'.format(self.MAX_POINTS))
+        # validated before the nearest node lookups (which would otherwise error in the database)
+        if not all(-180 <= point.x <= 180 and -90 <= point.y <= 90 for point in points):
+            raise exceptions.ValidationError('coordinates must be within [-180, 180] longitude and [-90, 90] latitude')
+
+        return points
+
+    def _nearest_nodes(self, points: List[geos.Point]) -> List[Tuple[int, int, int, int]]:
+        # (point position, node id, psa dataset id, node index) of the nearest node to every point in each psa dataset
+        # using the datasets' in-memory node indexes, falling back to the database
+
+        node_indexes = self.get_node_indexes()
+        if node_indexes is None:
+            return nearest_psa_nodes_query(self.nsem.id, points, self.POINT_DISTANCE)
+
+        nodes = []
+        for psa_manifest_dataset, node_index in node_indexes:
+            positions, found = node_index.nearest([p.x for p in points], [p.y for p in points], self.POINT_DISTANCE)
+            for i in np.flatnonzero(found):
+                nodes.append((int(i), int(node_index.ids[positions[i]]), psa_manifest_dataset.id, int(node_index.indexes[positions[i]])))
+        return sorted(nodes)
+
+    def _time_series(self, points: List[geos.Point]) -> List[list]:
+        """
+        every time-series variable's values at the nearest nodes to each point, which are resolved and retrieved
+        for all points at once
+        """
+
+        # nearest node to every point in each psa dataset
+        nodes = self._nearest_nodes(points)
+        node_ids = list({node_id for _, node_id, _, _ in nodes})
+        datasets = self.nsem.nsempsamanifestdataset_set.in_bulk({dataset_id for _, _, dataset_id, _ in nodes})
+
+        # full time-series (a single row per variable/node) at the nearest nodes
+        time_series = {
+            (node_id, variable_name): values for node_id, variable_name, values in NsemPsaNodeTimeSeries.objects.filter(
+                node__in=node_ids,
+                nsem_psa_variable__nsem=self.nsem,
+            ).values_list(
+                'node_id', 'nsem_psa_variable__name', 'values',
+            )
+        }
+
+        # prefer the full time-series from each dataset's columnar store (a single read per dataset/variable)
+        for dataset_id, dataset in datasets.items():
+            store = PsaStore(dataset)
+            dataset_nodes = {index: node_id for _, node_id, node_dataset_id, index in nodes if node_dataset_id == dataset_id}
+            for variable_name in dataset.variables:
+                stored = store.read_time_series_nodes(variable_name, dataset_nodes.keys()) or {}
+                for index, values in stored.items():
+                    if values:
+                        time_series[(dataset_nodes[index], variable_name)] = values
 
         # time-series variables
         variables = self.nsem.nsempsavariable_set.filter(
@@ -258,34 +469,66 @@ class NsemPsaTimeSeriesViewSet(NsemPsaBaseViewSet):
             geo_type=NsemPsaVariable.GEO_TYPE_POLYGON,
         )
 
-        # include data grouped by variable
-        for variable in variables:
-            result = {
-                'variable': variable,
-                'values': [],
+        # time-series data at the nearest nodes per variable/date for psas ingested without full time-series
+        missing_variables = [variable.id for variable in variables if not any(name == variable.name for _, name in time_series)]
+        time_series_values = {}
+        if missing_variables and node_ids:
+            time_series_values = {
+                (node_id, variable_name, date): value for node_id, variable_name, date, value in NsemPsaData.objects.filter(
+                    nsem=self.nsem,
+                    nsem_psa_variable__in=missing_variables,
+                    node__in=node_ids,
+                ).values_list(
+                    'node_id', 'nsem_psa_variable__name', 'date', 'value',
+                )
             }
-            for date in self.nsem.dates:
-                # find matching record if it exists
-                value = next((v['value'] for v in time_series_query if v['nsem_psa_variable__name'] == variable.name and v['date'] == date), 0)
-                result['values'].append(value)
-            results.append(result)
 
-        # csv export
-        if request.query_params.get('export') == 'csv':
-            return self._as_csv(results, lat, lon)
+        # nearest nodes per point
+        point_nodes = [[] for _ in points]
+        for position, node_id, _, _ in nodes:
+            point_nodes[position].append(node_id)
+
+        point_results = []
+
+        # include data grouped by variable for each point
+        for node_ids in point_nodes:
+            results = []
+            for variable in variables:
+                # a variable belongs to a single dataset so only one of the point's nodes will have it's values
+                node_time_series = next((time_series[(n, variable.name)] for n in node_ids if (n, variable.name) in time_series), None)
+                if node_time_series is not None:
+                    values = [0 if value is None else value for value in node_time_series]
+                else:
+                    values = [
+                        next((time_series_values[(n, variable.name, date)] for n in node_ids if (n, variable.name, date) in time_series_values), 0)
+                        for date in self.nsem.dates
+                    ]
+                results.append({
+                    'variable': variable,
+                    'values': values,
+                })
+            point_results.append(results)
 
-        return Response(self.serializer_class(results, many=True).data)
+        return point_results
 
 
+@method_decorator(gzip_page, name='dispatch')
 class NsemPsaWindBarbsViewSet(NsemPsaBaseViewSet):
     """
     #### Named Storm PSA Wind Barbs
+
+    **optional params:**
+
+    - `zoom` to return evenly spaced wind barbs for the map's zoom level
     """
     # Named Storm Event Model PSA Wind Barbs ViewSet
     # - expects to be nested under a NamedStormViewSet detail
     # - returns geojson results
     queryset = NsemPsaData.objects.all()  # defined in list()
 
+    # minimum spacing (pixels) of the wind barbs at a zoom level
+    WIND_BARB_SPACING = 24
+
     def get_serializer_class(self):
         # dummy serializer class
         return NsemPsaWindBarbsSerializer
@@ -298,8 +541,9 @@ class NsemPsaWindBarbsViewSet(NsemPsaBaseViewSet):
 
         try:
             step = int(request.query_params.get('step') or 1)
+            zoom = int(request.query_params['zoom']) if request.query_params.get('zoom') else None
         except ValueError:
-            raise exceptions.ValidationError({'step': ['step must be an integer']})
+            raise exceptions.ValidationError({'step': ['step and zoom must be integers']})
 
         try:
             center = geos.fromstr(request.query_params.get('center'))
@@ -307,31 +551,82 @@ class NsemPsaWindBarbsViewSet(NsemPsaBaseViewSet):
             logger.warning('Invalid center {}'.format(request.query_params.get('center')))
             raise exceptions.ValidationError({'center': ['center point must be WKT']})
 
-        results = wind_barbs_query(self.nsem.id, date=date, center=center, step=step)
+        # the (legacy) step is 1 when zoomed in past level 11
+        if zoom is None:
+            zoom = 12 if step == 1 else 9
+        else:
+            step = 1 if zoom > 11 else 10
+
+        expand_distance = wind_barbs_expand_distance(step)
+        bbox = (center.x - expand_distance, center.y - expand_distance, center.x + expand_distance, center.y + expand_distance)
+
+        # precomputed wind barbs (lon, lat, direction, speed) falling back to pairing the psa's data
+        results = self._decimated_wind_barbs(date, zoom, bbox)
+        if results is None:
+            results = [(point.x, point.y, direction, speed) for point, direction, speed in self._wind_barbs(date, center, step, bbox)]
 
-        # build geojson features
-        features = []
-        for result in results:
-            point = geos.fromstr(result[0])  # type: geos.Point
-            features.append(
+        # stream geojson features
+        wind_direction_units = NsemPsaVariable.get_variable_attribute(NsemPsaVariable.VARIABLE_DATASET_WIND_DIRECTION, 'units')
+        wind_speed_units = NsemPsaVariable.get_variable_attribute(NsemPsaVariable.VARIABLE_DATASET_WIND_SPEED, 'units')
+        features = (
+            json.dumps(
                 geojson.Feature(
-                    geometry=geojson.Point((point.x, point.y)),
+                    geometry=geojson.Point((result[0], result[1])),
                     properties={
                         'name': 'wind_direction',
-                        'wind_direction_value': result[1],
-                        'wind_direction_units': NsemPsaVariable.get_variable_attribute(NsemPsaVariable.VARIABLE_DATASET_WIND_DIRECTION, 'units'),
-                        'wind_speed_value': result[2],
-                        'wind_speed_units': NsemPsaVariable.get_variable_attribute(NsemPsaVariable.VARIABLE_DATASET_WIND_SPEED, 'units'),
+                        'wind_direction_value': result[2],
+                        'wind_direction_units': wind_direction_units,
+                        'wind_speed_value': result[3],
+                        'wind_speed_units': wind_speed_units,
                     },
                 )
             )
+            for result in results
+        )
+
+        return StreamingHttpResponse(iter_geojson_feature_collection(features), content_type='application/json')
+
+    def _decimated_wind_barbs(self, date, zoom: int, bbox: tuple) -> Optional[list]:
+        # wind barbs from the psa datasets' store at the finest decimation level that's at least the spacing at the zoom level,
+        # or None if they haven't been precomputed
+
+        cell_sizes = sorted(settings.CWWED_PSA_WIND_BARB_CELL_SIZES)
+        if not cell_sizes:
+            return None
+        spacing = self.WIND_BARB_SPACING * 360 / (256 * 2 ** zoom)
+        cell_size = next((c for c in cell_sizes if c >= spacing), cell_sizes[-1])
 
-        return Response(geojson.FeatureCollection(features=features))
+        results = []
+        found = False
+        for psa_manifest_dataset in self.nsem.nsempsamanifestdataset_set.all():
+            if NsemPsaVariable.VARIABLE_DATASET_WIND_DIRECTION not in psa_manifest_dataset.variables:
+                continue
+            wind_barbs = PsaStore(psa_manifest_dataset).read_wind_barbs(cell_size, date, bbox)
+            if wind_barbs is None:
+                return None
+            found = True
+            results.extend(zip(*[values.tolist() for values in wind_barbs]))
+        return results if found else None
+
+    def _wind_barbs(self, date, center: geos.Point, step: int, bbox: tuple) -> List[Tuple[geos.Point, float, float]]:
+        # pairs the psa's wind direction & speed data around the center
+
+        # nodes around the center from the psa datasets' node indexes (if they exist)
+        node_ids = None
+        node_indexes = self.get_node_indexes()
+        if node_indexes is not None:
+            node_ids = []
+            for _, node_index in node_indexes:
+                positions = node_index.within_bbox(*bbox)
+                node_ids.extend(node_index.ids[positions].tolist())
+
+        results = wind_barbs_query(self.nsem.id, date=date, center=center, step=step, node_ids=node_ids)
+
+        return [(geos.fromstr(point), direction, speed) for point, direction, speed in results]
 
 
 @method_decorator(gzip_page, name='dispatch')
 @method_decorator(cache_control(public=True, max_age=3600), name='dispatch')
-@method_decorator(cache_page(settings.CWWED_CACHE_PSA_CONTOURS_SECONDS, cache="psa_contours"), name='dispatch')
 class NsemPsaContourViewSet(NsemPsaBaseViewSet):
     """
     #### Named Storm PSA Contour
@@ -340,6 +635,10 @@ class NsemPsaContourViewSet(NsemPsaBaseViewSet):
 
     - `nsem_psa_variable`
     - `date`
+
+    **optional params:**
+
+    - `zoom` or `tolerance` (degrees) to return a simplified level of detail
     """
     # Named Storm Event Model PSA Geo ViewSet
     #   - expects to be nested under a NamedStormViewSet detail
@@ -349,22 +648,33 @@ class NsemPsaContourViewSet(NsemPsaBaseViewSet):
     filterset_class = NsemPsaContourFilter
     pagination_class = None
 
+    # query parameters the pre-rendered contours can be served for (the psa id is only a cache busting parameter)
+    ARTIFACT_QUERY_PARAMS = {'nsem_psa_variable', 'date', 'zoom', 'tolerance', '_cacheId', 'format'}
+
     def get_serializer_class(self):
         # dummy serializer class
         return NsemPsaContourSerializer
 
+    def dispatch(self, request, *args, **kwargs):
+        # serve the storm's last valid psa's pre-rendered contours (if they exist) without querying it's contours
+        nsem = NsemPsa.get_last_valid_psa(storm_id=kwargs['storm_id'])
+        if nsem is not None:
+            response = self._artifact_response(request, PsaContourArtifacts(kwargs['storm_id'], nsem.id), **kwargs)
+            if response is not None:
+                return response
+        return super().dispatch(request, *args, **kwargs)
+
     def get_queryset(self):
-        """
-        - group all geometries together (st_collect) by same variable & value
-        """
-        qs = NsemPsaContour.objects.filter(nsem_psa_variable__nsem=self.nsem)
-        qs = qs.values(*[
-            'value', 'color', 'date', 'nsem_psa_variable__name', 'nsem_psa_variable__data_type',
-            'nsem_psa_variable__display_name', 'nsem_psa_variable__units',
-        ])
-        qs = qs.annotate(geom=Collect(Cast('geo', GeometryField())))
-        qs = qs.order_by('nsem_psa_variable__name')
-        return qs
+        tolerance = self._artifact_tolerance(self.request.query_params)
+        if tolerance is False:
+            raise exceptions.ValidationError({'zoom': ['invalid zoom or tolerance']})
+        return get_psa_contour_qs(self.nsem, tolerance)
+
+    def filter_queryset(self, queryset):
+        # contours at a level of detail saved at ingest are filtered the same way
+        if queryset.model is NsemPsaContourLevel:
+            self.filterset_class = NsemPsaContourLevelFilter
+        return super().filter_queryset(queryset)
 
     def list(self, request, *args, **kwargs):
 
@@ -377,10 +687,63 @@ class NsemPsaContourViewSet(NsemPsaBaseViewSet):
 
         queryset = self.filter_queryset(self.get_queryset())
 
-        # get geo json from queryset
-        geo_json = get_geojson_feature_collection_from_psa_qs(queryset)
+        # the pre-rendered contours don't exist (they're only written by write_psa_contour_artifacts_task) so stream the geo json response
+        return StreamingHttpResponse(iter_geojson_feature_collection_from_psa_qs(queryset), content_type='application/json')
+
+    def _artifact_response(self, request, artifacts: PsaContourArtifacts, **kwargs) -> Optional[HttpResponseBase]:
+        # returns the pre-rendered contours' response or None if they don't exist for the request
+
+        variable = request.GET.get('nsem_psa_variable')
+        if variable not in NsemPsaVariable.VARIABLE_DATASETS or not set(request.GET).issubset(self.ARTIFACT_QUERY_PARAMS):
+            return None
+        date = self._artifact_date(request.GET)
+        tolerance = self._artifact_tolerance(request.GET)
+        if date is False or tolerance is False:
+            return None
+
+        artifact = artifacts.read(variable, date, request.META.get('HTTP_ACCEPT_ENCODING', ''), tolerance)
+        if artifact is None:
+            return None
+        path, encoding, etag = artifact
+
+        if etag in [tag.strip() for tag in request.META.get('HTTP_IF_NONE_MATCH', '').split(',')]:
+            response = HttpResponseNotModified()
+        elif encoding in PsaContourArtifacts.accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            response = FileResponse(open(path, 'rb'), content_type='application/json')
+            response['Content-Encoding'] = encoding
+        else:
+            # the client doesn't accept compressed responses
+            with gzip.open(path, 'rb') as f:
+                response = HttpResponse(f.read(), content_type='application/json')
+        response['ETag'] = etag
+        response['X-Contour-Tolerance'] = str(tolerance or 0)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
 
-        return HttpResponse(geo_json, content_type='application/json')
+    @staticmethod
+    def _artifact_date(query_params) -> Union[datetime, None, bool]:
+        # returns the requested date, None if there isn't one or False if it's invalid
+        if not query_params.get('date'):
+            return None
+        try:
+            date = parse_datetime(query_params['date'])
+        except ValueError:
+            return False
+        if date is None:
+            return False
+        return date if timezone.is_aware(date) else timezone.make_aware(date, pytz.utc)
+
+    @staticmethod
+    def _artifact_tolerance(query_params) -> Union[float, None, bool]:
+        # returns the level of detail's tolerance for the requested zoom or tolerance, None for full resolution or False if it's invalid
+        try:
+            zoom = int(query_params['zoom']) if query_params.get('zoom') else None
+            tolerance = float(query_params['tolerance']) if query_params.get('tolerance') else None
+        except ValueError:
+            return False
+        if (zoom is not None and not 0 <= zoom <= MAX_ZOOM) or (tolerance is not None and tolerance < 0):
+            return False
+        return get_psa_contour_tolerance(zoom, tolerance)
 
     def _validate(self):
 
@@ -394,6 +757,71 @@ class NsemPsaContourViewSet(NsemPsaBaseViewSet):
             raise exceptions.ValidationError({'date': ['required for this type of variable']})
 
 
+@method_decorator(gzip_page, name='dispatch')
+@method_decorator(cache_control(public=True, max_age=3600), name='dispatch')
+class NsemPsaContourTileViewSet(NsemPsaContourViewSet):
+    """
+    #### Named Storm PSA Contour Vector Tile
+
+    **required params:**
+
+    - `nsem_psa_variable`
+    - `date`
+    """
+    # Named Storm Event Model PSA Contour Mapbox Vector Tile ViewSet
+    #   - expects to be nested under a NamedStormViewSet detail
+    #   - returns pre-seeded tiles or renders them from the contours
+
+    MAX_ZOOM = MAX_ZOOM
+    CONTENT_TYPE = 'application/vnd.mapbox-vector-tile'
+
+    def list(self, request, *args, z=None, x=None, y=None, **kwargs):
+        z, x, y = self._tile(z, x, y)
+
+        if 'nsem_psa_variable' not in request.query_params:
+            raise exceptions.ValidationError({'nsem_psa_variable': ['required']})
+
+        self._validate()
+
+        nsem_psa_variable = self.nsem.nsempsavariable_set.get(name=request.query_params['nsem_psa_variable'])
+
+        # "max-values" variables don't have a date
+        date = None
+        if nsem_psa_variable.data_type == NsemPsaVariable.DATA_TYPE_TIME_SERIES:
+            date = self._artifact_date(request.query_params)
+            if not date:
+                raise exceptions.ValidationError({'date': ['invalid date']})
+
+        tile = psa_contour_tile_query(self.nsem.id, nsem_psa_variable.id, date, z, x, y)
+
+        return HttpResponse(tile, content_type=self.CONTENT_TYPE)
+
+    def _artifact_response(self, request, artifacts: PsaContourArtifacts, z=None, x=None, y=None, **kwargs) -> Optional[HttpResponseBase]:
+        # returns the pre-seeded tile's response or None if it doesn't exist for the request
+
+        variable = request.GET.get('nsem_psa_variable')
+        if variable not in NsemPsaVariable.VARIABLE_DATASETS or not set(request.GET).issubset(self.ARTIFACT_QUERY_PARAMS):
+            return None
+        date = self._artifact_date(request.GET)
+        if date is False:
+            return None
+        try:
+            z, x, y = self._tile(z, x, y)
+        except exceptions.NotFound:
+            return None
+
+        tile = artifacts.read_tile(variable, date, z, x, y)
+        if tile is None:
+            return None
+        return HttpResponse(tile, content_type=self.CONTENT_TYPE)
+
+    def _tile(self, z, x, y) -> Tuple[int, int, int]:
+        z, x, y = int(z), int(x), int(y)
+        if z > self.MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+            raise exceptions.NotFound('Tile {}/{}/{} does not exist'.format(z, x, y))
+        return z, x, y
+
+
 @method_decorator(gzip_page, name='dispatch')
 class NsemPsaDataViewSet(NsemPsaBaseViewSet):
     """
@@ -402,24 +830,154 @@ class NsemPsaDataViewSet(NsemPsaBaseViewSet):
     **required params:**
 
     - `nsem_psa_variable`
+
+    **optional params:**
+
+    - `limit` results per page (cursor paginated by date & id, follow `next` for the following page)
+    - `format=geojson` or `format=ndjson` to stream every result (unpaginated) as geojson features
+    - `format=csv` to stream every result (unpaginated) as csv rows
+    - `format=arrow` (or `Accept: application/vnd.apache.arrow.stream`) to stream every result (unpaginated) as an
+      arrow stream or `format=parquet` to download them as parquet
+
+    Streamed results are identified by their mesh node's id (the geojson feature `id` and the csv/arrow `node` column).
     """
     # Named Storm Event Model PSA Data ViewSet
     #   - expects to be nested under a NamedStormViewSet detail
 
     filterset_class = NsemPsaDataFilter
     serializer_class = NsemPsaDataSerializer
+    renderer_classes = tuple(api_settings.DEFAULT_RENDERER_CLASSES) + (
+        GeoJSONRenderer, NDJSONRenderer, CSVRenderer, ArrowStreamRenderer, ParquetRenderer)
+    pagination_class = PsaDataKeysetPagination
+
+    # rows fetched at a time by the server-side cursor when streaming
+    STREAM_CHUNK_SIZE = 2000
 
     def get_queryset(self):
         # filter by nested nsem
-        return NsemPsaData.objects.filter(nsem_psa_variable__nsem=self.nsem)
+        return NsemPsaData.objects.filter(nsem=self.nsem).select_related('node')
 
     def list(self, request, *args, **kwargs):
         # return an empty list if no variable filter is supplied because
         # the query is too expensive and we can benefit from the DRF filter being presented in the API view
         if 'nsem_psa_variable' not in request.query_params:
             return Response([])
+
+        # stream every result (in the same order as the pages) with a server-side cursor rather than paginating
+        if request.accepted_renderer.format == GeoJSONRenderer.format:
+            features = self._iter_features(self._stream_queryset())
+            return StreamingHttpResponse(iter_geojson_feature_collection(features), content_type=GeoJSONRenderer.media_type)
+        elif request.accepted_renderer.format == NDJSONRenderer.format:
+            features = self._iter_features(self._stream_queryset())
+            return StreamingHttpResponse(iter_ndjson(features), content_type=NDJSONRenderer.media_type)
+        elif request.accepted_renderer.format == CSVRenderer.format:
+            response = StreamingHttpResponse(iter_chunks(self._iter_csv(self._stream_queryset())), content_type=CSVRenderer.media_type)
+            response['Content-Disposition'] = 'attachment; filename="{}-psa-data.csv"'.format(self.nsem.named_storm)
+            return response
+
+        # arrow/parquet
+        response = self.columnar_response(PSA_DATA_SCHEMA, self._record_batches(), '{}-psa-data'.format(self.nsem.named_storm))
+        if response is not None:
+            return response
+
         return super().list(request, *args, **kwargs)
 
+    def _stream_queryset(self):
+        return self.filter_queryset(self.get_queryset()).order_by(*PsaDataKeysetPagination.ordering)
+
+    def _record_batches(self) -> Iterator[pa.RecordBatch]:
+        # columns read straight from the psa's store when it holds everything requested, otherwise built from the query results.
+        # a generator so nothing is read unless a columnar format was requested
+        batch = self._store_record_batch()
+        if batch is not None:
+            yield batch
+            return
+        point = Cast('node__point', GeometryField())
+        queryset = self._stream_queryset().annotate(
+            lon=Func(point, function='ST_X', output_field=FloatField()),
+            lat=Func(point, function='ST_Y', output_field=FloatField()),
+        ).values_list('node_id', 'nsem_psa_variable__name', 'date', 'value', 'lon', 'lat')
+        yield from record_batches(queryset.iterator(chunk_size=self.STREAM_CHUNK_SIZE), PSA_DATA_SCHEMA)
+
+    def _store_record_batch(self) -> Optional[pa.RecordBatch]:
+        """
+        a variable's values at a single date (or it's max values) from the psa's store with the nodes' ids and
+        coordinates from it's node index, or None if other filters were requested or they haven't been built
+        """
+        params = set(self.request.query_params) - {'nsem_psa_variable', 'date', 'format', 'cursor', 'limit'}
+        if params:
+            return None
+        name = self.request.query_params['nsem_psa_variable']
+        date = None
+        if 'date' in self.request.query_params:
+            try:
+                date = parse_datetime(self.request.query_params['date'])
+            except ValueError:
+                return None
+            # invalid dates are left to the filter
+            if date is None or date.tzinfo is None:
+                return None
+
+        # max-values variables don't have a date while time-series variables require one
+        variable = self.nsem.nsempsavariable_set.filter(name=name).first()
+        if variable is None or (date is None) != (variable.data_type == NsemPsaVariable.DATA_TYPE_MAX_VALUES):
+            return None
+
+        psa_manifest_dataset = next((d for d in self.nsem.nsempsamanifestdataset_set.all() if name in d.variables), None)
+        if psa_manifest_dataset is None:
+            return None
+        node_index = PsaNodeIndex.load(psa_manifest_dataset)
+        stored = PsaStore(psa_manifest_dataset).read_date(name, date)
+        if node_index is None or stored is None:
+            return None
+
+        # only the store's nodes which were saved with the psa and have values
+        indexes, values = stored
+        positions, found = node_index.positions(indexes)
+        found &= ~np.isnan(values)
+        positions, values = positions[found], values[found]
+
+        date_type = PSA_DATA_SCHEMA.field('date').type
+        return pa.RecordBatch.from_arrays([
+            pa.array(node_index.ids[positions]),
+            pa.array(np.full(len(values), name, dtype=object), pa.string()),
+            pa.array(np.full(len(values), np.datetime64(int(date.timestamp()), 's')), date_type) if date else pa.nulls(len(values), date_type),
+            pa.array(values),
+            pa.array(node_index.lons[positions], pa.float64()),
+            pa.array(node_index.lats[positions], pa.float64()),
+        ], schema=PSA_DATA_SCHEMA)
+
+    def _iter_csv(self, queryset) -> Iterator[str]:
+        # csv rows (strings) written to a pseudo buffer which just returns them
+        class Echo:
+            def write(self, value):
+                return value
+
+        writer = csv.writer(Echo())
+        # the same columns as the arrow/parquet formats
+        yield writer.writerow(PSA_DATA_SCHEMA.names)
+        queryset = queryset.values_list('node_id', 'nsem_psa_variable__name', 'date', 'value', 'node__point')
+        for node_id, name, date, value, point in queryset.iterator(chunk_size=self.STREAM_CHUNK_SIZE):
+            yield writer.writerow([node_id, name, date.isoformat() if date else '', value, point.x, point.y])
+
+    def _iter_features(self, queryset) -> Iterator[str]:
+        # geojson point features (json strings) with the node's geojson swapped in rather than deserializing it.
+        # features are identified by their node like every other streamed format
+        queryset = queryset.annotate(point_geojson=AsGeoJSON('node__point')).values_list(
+            'node_id', 'nsem_psa_variable__name', 'date', 'value', 'point_geojson')
+        for node_id, name, date, value, point_geojson in queryset.iterator(chunk_size=self.STREAM_CHUNK_SIZE):
+            feature = json.dumps({
+                'type': 'Feature',
+                'id': node_id,
+                'properties': {
+                    'name': name,
+                    'date': date.isoformat() if date else None,
+                    'value': value,
+                },
+                'geometry': '@@geometry@@',
+            })
+            yield feature.replace('"@@geometry@@"', point_geojson)
+
 
 class NsemPsaUserExportViewSet(UserReferenceViewSetMixin, viewsets.ModelViewSet):
     serializer_class = NsemPsaUserExportSerializer
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.3 on 2020-12-10 15:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('named_storms', '0118_auto_20201208_1755'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nsempsavariable',
+            name='statistics',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 3.1.3 on 2020-12-11 14:31
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('named_storms', '0119_nsempsavariable_statistics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NsemPsaNode',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.IntegerField()),
+                ('point', django.contrib.gis.db.models.fields.PointField(geography=True, srid=4326)),
+                ('nsem_psa_manifest_dataset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='named_storms.NsemPsaManifestDataset')),
+            ],
+            options={
+                'unique_together': {('nsem_psa_manifest_dataset', 'index')},
+            },
+        ),
+        migrations.AddField(
+            model_name='nsempsamanifestdataset',
+            name='legacy_nodes',
+            field=models.BooleanField(default=False, help_text='Whether the nodes were migrated from point data (so they are not in mesh order) which requires a full reingest'),
+        ),
+        migrations.AddField(
+            model_name='nsempsadata',
+            name='node',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='named_storms.NsemPsaNode'),
+        ),
+        # populate nodes from the distinct points of every existing psa dataset and reference them from the data.
+        # the mesh isn't available here so the nodes' "index" is only unique per dataset (not their mesh index) and the
+        # datasets are flagged as legacy so the processor refuses partial ingests until they've been fully reingested
+        migrations.RunSQL(
+            sql=[
+                '''
+                INSERT INTO named_storms_nsempsanode (nsem_psa_manifest_dataset_id, "index", point)
+                SELECT p.dataset_id, row_number() OVER (PARTITION BY p.dataset_id ORDER BY p.geom) - 1, p.geom::geography
+                FROM (
+                    SELECT DISTINCT ds.id AS dataset_id, d.point::geometry AS geom
+                    FROM named_storms_nsempsadata d
+                        INNER JOIN named_storms_nsempsavariable v ON v.id = d.nsem_psa_variable_id
+                        INNER JOIN named_storms_nsempsamanifestdataset ds ON ds.nsem_id = v.nsem_id AND v.name = ANY(ds.variables)
+                ) p
+                ''',
+                '''
+                UPDATE named_storms_nsempsadata d
+                SET node_id = n.id
+                FROM named_storms_nsempsavariable v, named_storms_nsempsamanifestdataset ds, named_storms_nsempsanode n
+                WHERE v.id = d.nsem_psa_variable_id AND
+                    ds.nsem_id = v.nsem_id AND
+                    v.name = ANY(ds.variables) AND
+                    n.nsem_psa_manifest_dataset_id = ds.id AND
+                    n.point::geometry = d.point::geometry
+                ''',
+                # data that doesn't belong to any psa dataset
+                'DELETE FROM named_storms_nsempsadata WHERE node_id IS NULL',
+                '''
+                UPDATE named_storms_nsempsamanifestdataset
+                SET legacy_nodes = true
+                WHERE id IN (SELECT DISTINCT nsem_psa_manifest_dataset_id FROM named_storms_nsempsanode)
+                ''',
+            ],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.RemoveIndex(
+            model_name='nsempsadata',
+            name='named_storm_nsem_ps_74649d_idx',
+        ),
+        migrations.RemoveField(
+            model_name='nsempsadata',
+            name='point',
+        ),
+        migrations.AlterField(
+            model_name='nsempsadata',
+            name='node',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='named_storms.NsemPsaNode'),
+        ),
+        migrations.AddIndex(
+            model_name='nsempsadata',
+            index=models.Index(fields=['nsem_psa_variable', 'date', 'node'], name='named_storm_nsem_ps_b341e8_idx'),
+        ),
+    ]
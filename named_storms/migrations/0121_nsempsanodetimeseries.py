@@ -0,0 +1,27 @@
+# Generated by Django 3.1.3 on 2020-12-14 16:02
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('named_storms', '0120_nsempsanode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NsemPsaNodeTimeSeries',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('values', django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(null=True), size=None)),
+                ('node', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='named_storms.NsemPsaNode')),
+                ('nsem_psa_variable', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='named_storms.NsemPsaVariable')),
+            ],
+            options={
+                'unique_together': {('nsem_psa_variable', 'node')},
+            },
+        ),
+    ]
@@ -0,0 +1,114 @@
+# Generated by Django 3.1.3 on 2020-12-16 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# rebuilds a table as a list partitioned table by psa (nsem) with a partition per existing psa and copies it's rows over.
+# the primary key has to include the partition key so it's (id, nsem_id) in the database while django continues using id.
+# constraints and indexes are created once the rows have been copied and the original table (and it's names) are gone
+PARTITION_TABLE_SQL = '''
+DO $$
+DECLARE
+    psa_id integer;
+    id_sequence text := pg_get_serial_sequence('{table}', 'id');
+BEGIN
+    -- keep the id sequence when the original table is dropped
+    EXECUTE format('ALTER SEQUENCE %s OWNED BY NONE', id_sequence);
+
+    ALTER TABLE {table} RENAME TO {table}_unpartitioned;
+
+    EXECUTE format('CREATE TABLE {table} (id integer NOT NULL DEFAULT nextval(%L::regclass), {columns}) PARTITION BY LIST (nsem_id)', id_sequence);
+
+    FOR psa_id IN SELECT id FROM named_storms_nsempsa LOOP
+        EXECUTE format('CREATE TABLE {table}_psa_%s PARTITION OF {table} FOR VALUES IN (%s)', psa_id, psa_id);
+    END LOOP;
+
+    INSERT INTO {table} (id, nsem_id, {copy_columns})
+    SELECT t.id, v.nsem_id, {copy_columns_source}
+    FROM {table}_unpartitioned t
+        INNER JOIN named_storms_nsempsavariable v ON v.id = t.nsem_psa_variable_id;
+
+    DROP TABLE {table}_unpartitioned;
+
+    EXECUTE format('ALTER SEQUENCE %s OWNED BY {table}.id', id_sequence);
+
+    ALTER TABLE {table} ADD PRIMARY KEY (id, nsem_id);
+    ALTER TABLE {table} ADD CONSTRAINT {table}_nsem_id_fk
+        FOREIGN KEY (nsem_id) REFERENCES named_storms_nsempsa (id) DEFERRABLE INITIALLY DEFERRED;
+    ALTER TABLE {table} ADD CONSTRAINT {table}_nsem_psa_variable_id_fk
+        FOREIGN KEY (nsem_psa_variable_id) REFERENCES named_storms_nsempsavariable (id) DEFERRABLE INITIALLY DEFERRED;
+    {extra}
+END $$;
+'''
+
+
+def partition_table_sql(table: str, columns: list, extra: list) -> str:
+    copy_columns = [column.split()[0] for column in columns]
+    return PARTITION_TABLE_SQL.format(
+        table=table,
+        columns=', '.join(['nsem_id integer NOT NULL'] + columns),
+        copy_columns=', '.join(copy_columns),
+        copy_columns_source=', '.join('t.{}'.format(column) for column in copy_columns),
+        extra='\n    '.join(extra),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('named_storms', '0121_nsempsanodetimeseries'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql=[
+                        partition_table_sql(
+                            'named_storms_nsempsadata',
+                            [
+                                'nsem_psa_variable_id integer NOT NULL',
+                                'node_id integer NOT NULL',
+                                'date timestamp with time zone NULL',
+                                'value double precision NOT NULL',
+                            ],
+                            [
+                                '''ALTER TABLE named_storms_nsempsadata ADD CONSTRAINT named_storms_nsempsadata_node_id_fk
+        FOREIGN KEY (node_id) REFERENCES named_storms_nsempsanode (id) DEFERRABLE INITIALLY DEFERRED;''',
+                                'CREATE INDEX named_storms_nsempsadata_node_id_idx ON named_storms_nsempsadata (node_id);',
+                                'CREATE INDEX named_storm_nsem_ps_b341e8_idx ON named_storms_nsempsadata (nsem_psa_variable_id, date, node_id);',
+                            ],
+                        ),
+                        partition_table_sql(
+                            'named_storms_nsempsacontour',
+                            [
+                                'nsem_psa_variable_id integer NOT NULL',
+                                'date timestamp with time zone NULL',
+                                'geo geography(GEOMETRY, 4326) NOT NULL',
+                                'value double precision NOT NULL',
+                                'color varchar(7) NOT NULL',
+                            ],
+                            [
+                                'CREATE INDEX named_storms_nsempsacontour_geo_id ON named_storms_nsempsacontour USING GIST (geo);',
+                                'CREATE INDEX named_storm_nsem_ps_8cc90b_idx ON named_storms_nsempsacontour (nsem_psa_variable_id, date, value);',
+                            ],
+                        ),
+                    ],
+                    reverse_sql=migrations.RunSQL.noop,
+                ),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='nsempsadata',
+                    name='nsem',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='named_storms.NsemPsa'),
+                ),
+                migrations.AddField(
+                    model_name='nsempsacontour',
+                    name='nsem',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='named_storms.NsemPsa'),
+                ),
+            ],
+        ),
+    ]
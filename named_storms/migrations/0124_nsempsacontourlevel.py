@@ -0,0 +1,78 @@
+# Generated by Django 3.1.3 on 2020-12-22 09:41
+
+from django.db import migrations, models
+import django.contrib.gis.db.models.fields
+import django.db.models.deletion
+
+
+# created as a list partitioned table by psa (nsem) like the contours (see 0122_psa_partitions) with a partition per existing psa.
+# the primary key has to include the partition key so it's (id, nsem_id) in the database while django continues using id
+CREATE_PARTITIONED_TABLE_SQL = '''
+CREATE SEQUENCE named_storms_nsempsacontourlevel_id_seq;
+
+CREATE TABLE named_storms_nsempsacontourlevel (
+    id integer NOT NULL DEFAULT nextval('named_storms_nsempsacontourlevel_id_seq'::regclass),
+    nsem_id integer NOT NULL,
+    nsem_psa_variable_id integer NOT NULL,
+    date timestamp with time zone NULL,
+    tolerance double precision NOT NULL,
+    geo geography(GEOMETRY, 4326) NOT NULL,
+    value double precision NOT NULL,
+    color varchar(7) NOT NULL,
+    PRIMARY KEY (id, nsem_id)
+) PARTITION BY LIST (nsem_id);
+
+ALTER SEQUENCE named_storms_nsempsacontourlevel_id_seq OWNED BY named_storms_nsempsacontourlevel.id;
+
+ALTER TABLE named_storms_nsempsacontourlevel ADD CONSTRAINT named_storms_nsempsacontourlevel_nsem_id_fk
+    FOREIGN KEY (nsem_id) REFERENCES named_storms_nsempsa (id) DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE named_storms_nsempsacontourlevel ADD CONSTRAINT named_storms_nsempsacontourlevel_nsem_psa_variable_id_fk
+    FOREIGN KEY (nsem_psa_variable_id) REFERENCES named_storms_nsempsavariable (id) DEFERRABLE INITIALLY DEFERRED;
+CREATE INDEX named_storm_nsem_ps_6f0d2e_idx ON named_storms_nsempsacontourlevel (nsem_psa_variable_id, date, tolerance);
+
+DO $$
+DECLARE
+    psa_id integer;
+BEGIN
+    FOR psa_id IN SELECT id FROM named_storms_nsempsa LOOP
+        EXECUTE format('CREATE TABLE named_storms_nsempsacontourlevel_psa_%s PARTITION OF named_storms_nsempsacontourlevel FOR VALUES IN (%s)', psa_id, psa_id);
+    END LOOP;
+END $$;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('named_storms', '0123_nsempsadata_keyset_index'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql=CREATE_PARTITIONED_TABLE_SQL,
+                    reverse_sql='DROP TABLE named_storms_nsempsacontourlevel',
+                ),
+            ],
+            state_operations=[
+                migrations.CreateModel(
+                    name='NsemPsaContourLevel',
+                    fields=[
+                        ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('date', models.DateTimeField(blank=True, null=True)),
+                        ('tolerance', models.FloatField()),
+                        ('geo', django.contrib.gis.db.models.fields.GeometryField(geography=True, srid=4326)),
+                        ('value', models.FloatField()),
+                        ('color', models.CharField(blank=True, max_length=7)),
+                        ('nsem', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='named_storms.NsemPsa')),
+                        ('nsem_psa_variable', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='named_storms.NsemPsaVariable')),
+                    ],
+                ),
+                migrations.AddIndex(
+                    model_name='nsempsacontourlevel',
+                    index=models.Index(fields=['nsem_psa_variable', 'date', 'tolerance'], name='named_storm_nsem_ps_6f0d2e_idx'),
+                ),
+            ],
+        ),
+    ]
@@ -2,6 +2,7 @@ from datetime import datetime
 from django.contrib.auth.models import User
 from django.contrib.gis.db import models
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.db.models import Index
 from django.utils import timezone
 from django.contrib.postgres import fields
@@ -179,6 +180,16 @@ class NsemPsa(models.Model):
     def __str__(self):
         return '{} ({})'.format(self.named_storm, self.id)
 
+    def delete(self, *args, **kwargs):
+        from named_storms.sql import drop_psa_partitions_query, delete_psa_nodes_query  # import locally to prevent circular references
+        # drop the psa's partitions and bulk delete it's nodes (and their time-series) before django collects the
+        # cascading delete, otherwise it loads every node to cascade to their data
+        with transaction.atomic():
+            drop_psa_partitions_query(self.id)
+            for psa_manifest_dataset_id in self.nsempsamanifestdataset_set.values_list('id', flat=True):
+                delete_psa_nodes_query(self.id, psa_manifest_dataset_id)
+            return super().delete(*args, **kwargs)
+
     @classmethod
     def get_last_valid_psa(cls, storm_id: int):
         qs = cls.objects.filter(
@@ -201,6 +212,7 @@ class NsemPsaManifestDataset(models.Model):
     meta_time = models.JSONField(default=dict, blank=True)  # psa time variable attributes
     meta_lon = models.JSONField(default=dict, blank=True)  # psa lon variable attributes
     meta_lat = models.JSONField(default=dict, blank=True)  # psa lat variable attributes
+    legacy_nodes = models.BooleanField(default=False, help_text='Whether the nodes were migrated from point data (so they are not in mesh order) which requires a full reingest')
 
     def __str__(self):
         return '{}: {}'.format(self.nsem, self.path)
@@ -347,6 +359,7 @@ class NsemPsaVariable(models.Model):
     element_type = models.CharField(choices=zip(ELEMENTS, ELEMENTS), max_length=20)  # i.e "water"
     units = models.CharField(choices=zip(UNITS, UNITS), max_length=20)  # i.e "m/s"
     meta = models.JSONField(default=dict, blank=True)  # psa variable attributes from dataset
+    statistics = models.JSONField(default=dict, blank=True)  # global min, max, percentiles and null counts across every date
 
     class Meta:
         unique_together = ('nsem', 'name')
@@ -381,9 +394,28 @@ class NsemPsaVariable(models.Model):
         return self.name
 
 
+class NsemPsaNode(models.Model):
+    """
+    A psa dataset's mesh node which is stored once and referenced by all of it's variables/dates
+    """
+    nsem_psa_manifest_dataset = models.ForeignKey(NsemPsaManifestDataset, on_delete=models.CASCADE)
+    index = models.IntegerField()  # node's position in the dataset's flattened mesh
+    point = models.PointField(geography=True)
+
+    def __str__(self):
+        return '{} <node {}>'.format(self.nsem_psa_manifest_dataset, self.index)
+
+    class Meta:
+        unique_together = ('nsem_psa_manifest_dataset', 'index')
+
+
 class NsemPsaData(models.Model):
+    """
+    A variable's value at a node/date which is partitioned by psa (see sql.PSA_PARTITIONED_TABLES)
+    """
+    nsem = models.ForeignKey(NsemPsa, on_delete=models.CASCADE, db_index=False)  # partition key
     nsem_psa_variable = models.ForeignKey(NsemPsaVariable, on_delete=models.CASCADE)
-    point = models.PointField(geography=True)
+    node = models.ForeignKey(NsemPsaNode, on_delete=models.CASCADE)
     date = models.DateTimeField(null=True, blank=True)  # note: variable data types of "max-values" will have empty date values
     value = models.FloatField()
 
@@ -392,11 +424,32 @@ class NsemPsaData(models.Model):
 
     class Meta:
         indexes = [
-            Index(fields=['nsem_psa_variable', 'date', 'point']),
+            Index(fields=['nsem_psa_variable', 'date', 'node']),
+            Index(fields=['nsem_psa_variable', 'date', 'id']),  # keyset pagination
         ]
 
 
+class NsemPsaNodeTimeSeries(models.Model):
+    """
+    A time-series variable's values for every psa date at a single node which is stored alongside NsemPsaData
+    so point queries only read a single row per variable
+    """
+    nsem_psa_variable = models.ForeignKey(NsemPsaVariable, on_delete=models.CASCADE)
+    node = models.ForeignKey(NsemPsaNode, on_delete=models.CASCADE)
+    values = fields.ArrayField(base_field=models.FloatField(null=True))  # ordered by the psa's dates (null for absent values)
+
+    def __str__(self):
+        return '{} <time-series>'.format(self.nsem_psa_variable)
+
+    class Meta:
+        unique_together = ('nsem_psa_variable', 'node')
+
+
 class NsemPsaContour(models.Model):
+    """
+    A variable's contour polygon at a date which is partitioned by psa (see sql.PSA_PARTITIONED_TABLES)
+    """
+    nsem = models.ForeignKey(NsemPsa, on_delete=models.CASCADE, db_index=False)  # partition key
     nsem_psa_variable = models.ForeignKey(NsemPsaVariable, on_delete=models.CASCADE)
     date = models.DateTimeField(null=True, blank=True)  # note: variable data types of "max-values" will have empty date values
     geo = models.GeometryField(geography=True)  # can be Polygon or MultiPolygon
@@ -412,6 +465,28 @@ class NsemPsaContour(models.Model):
         ]
 
 
+class NsemPsaContourLevel(models.Model):
+    """
+    A contour polygon simplified (topology preserving) to a level of detail at ingest which is partitioned by psa
+    (see sql.PSA_PARTITIONED_TABLES)
+    """
+    nsem = models.ForeignKey(NsemPsa, on_delete=models.CASCADE, db_index=False)  # partition key
+    nsem_psa_variable = models.ForeignKey(NsemPsaVariable, on_delete=models.CASCADE)
+    date = models.DateTimeField(null=True, blank=True)  # note: variable data types of "max-values" will have empty date values
+    tolerance = models.FloatField()  # simplification tolerance (degrees), see settings.CWWED_PSA_CONTOUR_TOLERANCES
+    geo = models.GeometryField(geography=True)  # can be Polygon or MultiPolygon
+    value = models.FloatField()
+    color = models.CharField(max_length=7, blank=True)  # rgb hex, i.e "#ffffff"
+
+    def __str__(self):
+        return '{} <contour level {}>'.format(self.nsem_psa_variable, self.tolerance)
+
+    class Meta:
+        indexes = [
+            Index(fields=['nsem_psa_variable', 'date', 'tolerance']),
+        ]
+
+
 class NsemPsaUserExport(models.Model):
     FORMAT_NETCDF = 'netcdf'
     FORMAT_SHAPEFILE = 'shapefile'
@@ -0,0 +1,200 @@
+import os
+import gzip
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+from datetime import datetime
+from typing import Iterable, Optional, Tuple, Union
+
+import brotli
+from django.conf import settings
+
+from named_storms.models import NsemPsa, NsemPsaVariable
+from named_storms.psa.store import PsaStore
+from named_storms.utils import root_data_path, create_directory, get_psa_contour_qs, iter_geojson_feature_collection_from_psa_qs
+
+
+logger = logging.getLogger('cwwed')
+
+ARTIFACTS_TILES = 'tiles'
+ARTIFACTS_BROTLI_QUALITY = 9  # 10-11 are considerably slower for large geojson for marginal gains
+ARTIFACTS_GZIP_LEVEL = 9
+
+
+class PsaContourArtifacts:
+    """
+    Pre-rendered GeoJSON of a psa's contours for every variable/date stored pre-compressed (brotli & gzip) with it's
+    strong ETag so the contour endpoint can serve them as static files.
+
+    Artifacts are stored by storm and psa, i.e `<storm id>/<psa id>/<variable>/<date>.geojson.br`, and requests are
+    served the artifacts of the storm's last valid psa.
+    Contour vector tiles can optionally be pre-seeded, i.e `<storm id>/<psa id>/tiles/<variable>/<date>/<z>/<x>/<y>.mvt`.
+    """
+
+    # content encodings in order of preference
+    ENCODINGS = (
+        ('br', '.br'),
+        ('gzip', '.gz'),
+    )
+
+    def __init__(self, storm_id: int, nsem_id: int):
+        self.storm_path = os.path.join(root_data_path(), settings.CWWED_NSEM_ARTIFACTS_DIR_NAME, str(storm_id))
+        self.path = os.path.join(self.storm_path, str(nsem_id))
+        self.nsem_id = nsem_id
+
+    def geojson_path(self, variable: str, date: datetime = None, tolerance: float = None) -> str:
+        # simplified levels of detail are named by their tolerance
+        name = PsaStore.date_key(date)
+        if tolerance:
+            name = '{}.tolerance-{}'.format(name, tolerance)
+        return os.path.join(self.path, variable, '{}.geojson'.format(name))
+
+    def write(self, variable: str, date: Optional[datetime], geojson: Union[str, Iterable[str]], tolerance: float = None,
+              source: str = None) -> Tuple[str, bool, int]:
+        """
+        writes a variable/date's (level of detail) geojson (or it's streamed chunks) compressed as it's streamed, unless
+        it's identical to the existing artifact, and returns it's etag, whether it was written and it's uncompressed size.
+        The (optional) source key identifies what the artifact was rendered from so it can be skipped without rendering.
+        """
+        if isinstance(geojson, str):
+            geojson = [geojson]
+        path = self.geojson_path(variable, date, tolerance)
+        create_directory(os.path.dirname(path))
+
+        sha256 = hashlib.sha256()
+        size = 0
+        brotli_fd, brotli_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        gzip_fd, gzip_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            brotli_compressor = brotli.Compressor(quality=ARTIFACTS_BROTLI_QUALITY)
+            with os.fdopen(brotli_fd, 'wb') as brotli_file, os.fdopen(gzip_fd, 'wb') as gzip_raw_file, \
+                    gzip.GzipFile(fileobj=gzip_raw_file, mode='wb', compresslevel=ARTIFACTS_GZIP_LEVEL, mtime=0) as gzip_file:
+                for chunk in geojson:
+                    content = chunk.encode('utf-8')
+                    sha256.update(content)
+                    size += len(content)
+                    brotli_file.write(brotli_compressor.process(content))
+                    gzip_file.write(content)
+                brotli_file.write(brotli_compressor.finish())
+
+            etag = sha256.hexdigest()
+            written = etag != self.etag(variable, date, tolerance)
+            if written:
+                os.replace(brotli_path, path + '.br')
+                os.replace(gzip_path, path + '.gz')
+                # the etag is written last since it identifies the complete artifact
+                self._write_file(path + '.etag', etag.encode('utf-8'))
+            self._write_file(path + '.source', json.dumps({'source': source, 'size': size}).encode('utf-8'))
+        finally:
+            for tmp_path in (brotli_path, gzip_path):
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+        return etag, written, size
+
+    def sizes(self, variable: str, date: datetime = None, tolerance: float = None) -> dict:
+        """
+        returns the payload size (bytes) of a variable/date's (level of detail) geojson for each content encoding
+        """
+        path = self.geojson_path(variable, date, tolerance)
+        return {encoding: os.path.getsize(path + extension) for encoding, extension in self.ENCODINGS if os.path.exists(path + extension)}
+
+    def render(self, nsem_psa: NsemPsa, nsem_psa_variable: NsemPsaVariable, date: Optional[datetime], tolerance: float = None) -> Tuple[bool, bool, dict]:
+        """
+        renders a variable/date's (level of detail) contours from the database and writes them, unless the existing
+        artifact was already rendered from this psa's ingest (a hit which skips rendering entirely), and returns
+        whether it was a hit, whether it was written (i.e it's content changed) and it's payload sizes
+        """
+        source = self.source_key(nsem_psa)
+        rendered = self.source(nsem_psa_variable.name, date, tolerance)
+        if rendered is not None and rendered['source'] == source and self.etag(nsem_psa_variable.name, date, tolerance) is not None:
+            return True, False, dict(self.sizes(nsem_psa_variable.name, date, tolerance), geojson=rendered['size'])
+        qs = get_psa_contour_qs(nsem_psa, tolerance).filter(nsem_psa_variable=nsem_psa_variable, date=date)
+        _, written, size = self.write(nsem_psa_variable.name, date, iter_geojson_feature_collection_from_psa_qs(qs), tolerance, source)
+        return False, written, dict(self.sizes(nsem_psa_variable.name, date, tolerance), geojson=size)
+
+    @staticmethod
+    def source_key(nsem_psa: NsemPsa) -> str:
+        # a psa's contours only change when it's (re)ingested
+        return '{}:{}'.format(nsem_psa.id, nsem_psa.date_processed.isoformat() if nsem_psa.date_processed else '')
+
+    def source(self, variable: str, date: datetime = None, tolerance: float = None) -> Optional[dict]:
+        try:
+            with open(self.geojson_path(variable, date, tolerance) + '.source') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def etag(self, variable: str, date: datetime = None, tolerance: float = None) -> Optional[str]:
+        try:
+            with open(self.geojson_path(variable, date, tolerance) + '.etag') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def read(self, variable: str, date: datetime = None, accept_encoding: str = '', tolerance: float = None) -> Optional[Tuple[str, str, str]]:
+        """
+        returns the (path, content encoding, etag) of a variable/date's (level of detail) compressed geojson in the
+        encoding preferred by the client (falling back to gzip) or None if it doesn't exist
+        """
+        path = self.geojson_path(variable, date, tolerance)
+        etag = self.etag(variable, date, tolerance)
+        if etag is None:
+            return None
+        accepted = self.accepted_encodings(accept_encoding)
+        for encoding, extension in self.ENCODINGS:
+            if encoding in accepted and os.path.exists(path + extension):
+                # strong etags must be unique per encoding
+                return path + extension, encoding, '"{}-{}"'.format(etag, encoding)
+        if os.path.exists(path + '.gz'):
+            return path + '.gz', 'gzip', '"{}-gzip"'.format(etag)
+        return None
+
+    def tile_path(self, variable: str, date: Optional[datetime], z: int, x: int, y: int) -> str:
+        return os.path.join(self.path, ARTIFACTS_TILES, variable, PsaStore.date_key(date), str(z), str(x), '{}.mvt'.format(y))
+
+    def write_tile(self, variable: str, date: Optional[datetime], z: int, x: int, y: int, tile: bytes):
+        path = self.tile_path(variable, date, z, x, y)
+        create_directory(os.path.dirname(path))
+        self._write_file(path, tile)
+
+    def read_tile(self, variable: str, date: Optional[datetime], z: int, x: int, y: int) -> Optional[bytes]:
+        """
+        returns a pre-seeded vector tile or None if it doesn't exist
+        """
+        try:
+            with open(self.tile_path(variable, date, z, x, y), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def delete_tiles(self):
+        shutil.rmtree(os.path.join(self.path, ARTIFACTS_TILES), ignore_errors=True)
+
+    def delete_other_psas(self):
+        """
+        removes the storm's other psas' artifacts once this psa's have been written
+        """
+        if not os.path.exists(self.storm_path):
+            return
+        for name in os.listdir(self.storm_path):
+            if name.isdigit() and name != str(self.nsem_id):
+                shutil.rmtree(os.path.join(self.storm_path, name), ignore_errors=True)
+
+    def delete(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    @staticmethod
+    def accepted_encodings(accept_encoding: str) -> set:
+        # content encodings of an Accept-Encoding header (ignoring quality values)
+        return {encoding.split(';')[0].strip() for encoding in accept_encoding.split(',') if encoding.strip()}
+
+    @staticmethod
+    def _write_file(path: str, content: bytes):
+        # write to a temporary file and then move it into place so readers never see a partial artifact
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
@@ -0,0 +1,152 @@
+import logging
+from concurrent.futures import Executor
+from typing import List, Union
+
+import numpy as np
+import numpy.ma as ma
+import matplotlib.colors
+from matplotlib import _contour, _tri, ticker
+from matplotlib.path import Path
+from matplotlib.tri import Triangulation
+
+
+logger = logging.getLogger('cwwed')
+
+
+class FilledContours:
+    """
+    filled contour results for every level without any matplotlib figures or artists
+    """
+    levels: np.ndarray  # contour level boundaries
+    norm: matplotlib.colors.Normalize  # normalizes level values for color maps
+    paths: List[List[Path]]  # paths for each level (lower boundary) in the same order as the levels
+
+    def __init__(self, levels: np.ndarray, paths: List[List[Path]]):
+        self.levels = levels
+        self.norm = matplotlib.colors.Normalize(vmin=levels[0], vmax=levels[-1])
+        self.paths = paths
+
+
+class ContourEngine:
+    """
+    Builds filled contours directly from matplotlib's (C++) contour generators, i.e what pyplot's contourf/tricontourf do
+    internally, but without touching pyplot's global figure state so it's safe for long-lived workers and threads.
+
+    Levels are split into one chunk per executor worker and every chunk creates it's own generator, so the
+    executor can be a thread or process pool.
+    """
+
+    def __init__(self, levels: Union[int, np.ndarray], executor: Executor = None, workers: int = 1):
+        self.levels = levels
+        self.executor = executor
+        self.workers = workers if executor else 1
+
+    def contour_grid(self, x: np.ndarray, y: np.ndarray, z: np.ndarray) -> FilledContours:
+        """
+        filled contours for a structured grid where z has the shape (y, x) and nulls are masked
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if x.ndim == 1:
+            x, y = np.meshgrid(x, y)
+        z = ma.masked_invalid(np.asarray(z, dtype=np.float64), copy=False)
+        mask = ma.getmask(z)
+        if mask is ma.nomask or not mask.any():
+            mask = None
+        # every value is null
+        elif mask.all():
+            return self._empty()
+        return self._contour(_contour_grid_levels, (x, y, z.filled(), mask), float(z.min()), float(z.max()))
+
+    def contour_triangulation(self, triangulation: Triangulation, z: np.ndarray) -> FilledContours:
+        """
+        filled contours for an unstructured grid where triangles with null values are expected to be masked
+        """
+        z = np.asarray(z, dtype=np.float64)
+        # only consider the nodes that are part of the (unmasked) triangulation
+        z_check = z[np.unique(triangulation.get_masked_triangles())]
+        # every triangle is masked (i.e every value is null)
+        if not z_check.size:
+            return self._empty()
+        # the generator requires finite values so nulls are filled (they're excluded by the triangulation's mask)
+        z = np.where(np.isnan(z), z_check.min(), z)
+        args = (triangulation.x, triangulation.y, triangulation.triangles, triangulation.mask, z)
+        return self._contour(_contour_triangulation_levels, args, float(z_check.min()), float(z_check.max()))
+
+    def _contour(self, func, args: tuple, z_min: float, z_max: float) -> FilledContours:
+        levels = self.get_levels(z_min, z_max)
+        lowers, uppers = self.get_lowers_and_uppers(levels, z_min)
+
+        # one chunk of levels per worker
+        chunks = [c for c in np.array_split(np.arange(len(lowers)), self.workers) if len(c)]
+
+        if self.executor is not None and len(chunks) > 1:
+            results = self.executor.map(func, *zip(*[(*args, lowers[c], uppers[c]) for c in chunks]))
+        else:
+            results = [func(*args, lowers[c], uppers[c]) for c in chunks]
+
+        paths = [level_paths for result in results for level_paths in result]
+
+        return FilledContours(levels, paths)
+
+    def _empty(self) -> FilledContours:
+        # no contours for any level (the range is arbitrary when only the number of levels is given)
+        levels = self.get_levels(0, 1)
+        return FilledContours(levels, [[] for _ in levels[:-1]])
+
+    def get_levels(self, z_min: float, z_max: float) -> np.ndarray:
+        """
+        returns the level boundaries using the same approach as matplotlib's contourf when only the number of levels is given
+        """
+        if not isinstance(self.levels, int):
+            return np.asarray(self.levels).astype(np.float64)
+
+        levels = ticker.MaxNLocator(self.levels + 1, min_n_ticks=1).tick_values(z_min, z_max)
+
+        # trim excess levels the locator may have supplied
+        under = np.nonzero(levels < z_min)[0]
+        i0 = under[-1] if len(under) else 0
+        over = np.nonzero(levels > z_max)[0]
+        i1 = over[0] + 1 if len(over) else len(levels)
+        if i1 - i0 < 3:
+            i0, i1 = 0, len(levels)
+
+        return levels[i0:i1]
+
+    @staticmethod
+    def get_lowers_and_uppers(levels: np.ndarray, z_min: float):
+        lowers = levels[:-1]
+        if z_min == lowers[0]:
+            # include minimum values in lowest interval
+            lowers = lowers.copy()
+            lowers[0] -= 1
+        uppers = levels[1:]
+        return lowers, uppers
+
+
+def _contour_grid_levels(x, y, z, mask, lowers, uppers) -> List[List[Path]]:
+    # each path is an exterior ring followed by it's interior rings
+    generator = _contour.QuadContourGenerator(x, y, z, mask, True, 0)
+    results = []
+    for lower, upper in zip(lowers, uppers):
+        vertices, codes = generator.create_filled_contour(lower, upper)
+        results.append([_path(v, c) for v, c in zip(vertices, codes)])
+    return results
+
+
+def _contour_triangulation_levels(x, y, triangles, mask, z, lowers, uppers) -> List[List[Path]]:
+    # each level is a single path of unordered rings (or nothing when the level is outside the data's range)
+    triangulation = Triangulation(x, y, triangles=triangles, mask=mask)
+    generator = _tri.TriContourGenerator(triangulation.get_cpp_triangulation(), z)
+    results = []
+    for lower, upper in zip(lowers, uppers):
+        vertices, codes = generator.create_filled_contour(lower, upper)
+        results.append([_path(vertices, codes)] if len(vertices) else [])
+    return results
+
+
+def _path(vertices: np.ndarray, codes: np.ndarray) -> Path:
+    path = Path(vertices, codes=codes)
+    # don't simplify the paths
+    path.should_simplify = False
+    return path
@@ -0,0 +1,159 @@
+import os
+import shutil
+import hashlib
+import logging
+import tempfile
+from typing import Iterator, Tuple
+
+import numpy as np
+import xarray as xr
+import matplotlib.tri as tri
+from shapely import wkt
+from shapely import vectorized
+
+from named_storms.models import NsemPsaManifestDataset
+from named_storms.utils import named_storm_nsem_version_cache_path, named_storm_nsem_version_path, create_directory
+
+
+logger = logging.getLogger('cwwed')
+
+
+class PsaMesh:
+    """
+    A psa dataset's mesh (node coordinates, storm mask and triangulation) which doesn't change between
+    variables or dates.  It's built once per manifest dataset and persisted next to the psa as individual
+    .npy arrays so every worker can memory-map them instead of re-reading and re-deriving the topology.
+
+    The persisted mesh is keyed by the dataset file and the storm's geo so it's rebuilt if either of them change
+    (i.e a reingest after the storm's geo was updated).
+    """
+
+    ARRAYS = ('dims', 'lons', 'lats', 'storm_mask', 'triangles')
+
+    dims: tuple = None  # node dimensions, i.e ('node',) for unstructured grids and ('lon', 'lat') for structured grids (as broadcast)
+    lons: np.ndarray = None  # flattened longitudes of every node
+    lats: np.ndarray = None  # flattened latitudes of every node
+    storm_mask: np.ndarray = None  # whether each node is within the storm's geo
+    triangles: np.ndarray = None  # zero-based triangle node indexes (unstructured grids only)
+
+    def __init__(self, **arrays):
+        for name, value in arrays.items():
+            setattr(self, name, value)
+        self.dims = tuple(str(dim) for dim in self.dims)
+
+    @classmethod
+    def path(cls, psa_manifest_dataset: NsemPsaManifestDataset) -> str:
+        return os.path.join(
+            named_storm_nsem_version_cache_path(psa_manifest_dataset.nsem),
+            'mesh',
+            str(psa_manifest_dataset.id),
+        )
+
+    @classmethod
+    def key(cls, psa_manifest_dataset: NsemPsaManifestDataset) -> str:
+        # the dataset file's modified time & size and the storm's geo which the mesh is derived from
+        stat = os.stat(os.path.join(named_storm_nsem_version_path(psa_manifest_dataset.nsem), psa_manifest_dataset.path))
+        key = hashlib.sha1('{}:{}:'.format(stat.st_mtime_ns, stat.st_size).encode())
+        key.update(bytes(psa_manifest_dataset.nsem.named_storm.geo.wkb))
+        return key.hexdigest()
+
+    @classmethod
+    def load_or_build(cls, psa_manifest_dataset: NsemPsaManifestDataset, dataset: xr.Dataset) -> 'PsaMesh':
+        dataset_path = cls.path(psa_manifest_dataset)
+        key = cls.key(psa_manifest_dataset)
+        path = os.path.join(dataset_path, key)
+        if not os.path.exists(path):
+            cls.build(psa_manifest_dataset, dataset).save(path)
+            # remove any stale meshes (workers which already loaded them keep their memory-mapped arrays)
+            for name in os.listdir(dataset_path):
+                stale_path = os.path.join(dataset_path, name)
+                # skip meshes other workers are still saving
+                if name == key or name.startswith(tempfile.gettempprefix()):
+                    continue
+                if os.path.isdir(stale_path):
+                    shutil.rmtree(stale_path, ignore_errors=True)
+                else:
+                    os.remove(stale_path)
+        return cls.load(path)
+
+    @classmethod
+    def load(cls, path: str) -> 'PsaMesh':
+        arrays = {}
+        for name in cls.ARRAYS:
+            array_path = os.path.join(path, '{}.npy'.format(name))
+            if os.path.exists(array_path):
+                arrays[name] = np.load(array_path, mmap_mode='r')
+        return cls(**arrays)
+
+    @classmethod
+    def build(cls, psa_manifest_dataset: NsemPsaManifestDataset, dataset: xr.Dataset) -> 'PsaMesh':
+
+        logger.info('{}: building mesh'.format(psa_manifest_dataset))
+
+        # lon/lat broadcast against each other so structured grids have coordinates for every node
+        lons, lats = xr.broadcast(dataset['lon'], dataset['lat'])
+
+        arrays = dict(
+            dims=np.array(lons.dims),
+            lons=lons.values.ravel(),
+            lats=lats.values.ravel(),
+        )
+
+        # vectorized point-in-polygon test against the storm's geo
+        storm_geo = wkt.loads(psa_manifest_dataset.nsem.named_storm.geo.wkt)
+        arrays['storm_mask'] = vectorized.contains(storm_geo, arrays['lons'], arrays['lats'])
+
+        if not psa_manifest_dataset.structured:
+            # adjust mesh topology indexing if this is 0-based or 1-based indexing
+            # see https://github.com/ugrid-conventions/ugrid-conventions
+            # subtract n from the topology/mesh using "start_index" metadata
+            topology = dataset[psa_manifest_dataset.topology_name]
+            arrays['triangles'] = np.subtract(topology.values, topology.attrs['start_index']).astype(np.int32)
+
+        return cls(**arrays)
+
+    def save(self, path: str):
+        # write to a temporary directory and then move it into place so concurrent workers never see a partial mesh
+        create_directory(os.path.dirname(path))
+        tmp_path = tempfile.mkdtemp(dir=os.path.dirname(path))
+        for name in self.ARRAYS:
+            value = getattr(self, name)
+            if value is not None:
+                np.save(os.path.join(tmp_path, '{}.npy'.format(name)), np.asarray(value))
+        try:
+            os.rename(tmp_path, path)
+        # another worker already saved the mesh
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def flatten(self, da: xr.DataArray) -> np.ndarray:
+        # flatten a (date-specific) data array into the same node order as the mesh coordinates
+        return da.transpose(*self.dims).values.ravel()
+
+    def flatten_time_series(self, da: xr.DataArray) -> np.ndarray:
+        # flatten a time-series data array into a (time, node) array with the same node order as the mesh coordinates
+        return da.transpose('time', *self.dims).values.reshape(da.sizes['time'], -1)
+
+    def iter_chunks(self, da: xr.DataArray, chunk_size: int) -> Iterator[Tuple[slice, np.ndarray]]:
+        """
+        lazily reads a data array in chunks of roughly `chunk_size` values along the first node dimension and yields
+        each chunk's flattened values along with the slice of mesh nodes they correspond to.
+        time-series data arrays (with a time dimension) yield (time, node) values for every date
+        """
+        time_size = da.sizes.get('time', 1)
+        # number of nodes per step along the first node dimension
+        inner_size = int(np.prod([da.sizes[dim] for dim in self.dims[1:]]))
+        rows = max(1, chunk_size // (inner_size * time_size))
+        for i in range(0, da.sizes[self.dims[0]], rows):
+            chunk = da.isel({self.dims[0]: slice(i, i + rows)})
+            values = self.flatten_time_series(chunk) if 'time' in da.dims else self.flatten(chunk)
+            yield slice(i * inner_size, i * inner_size + values.shape[-1]), values
+
+    def triangulation(self, z: np.ndarray) -> tri.Triangulation:
+        """
+        builds a triangulation from the cached mesh with a mask for the triangles that have null values
+        (the only thing that varies between dates)
+        """
+        # whether any of the nodes in each triangle are null
+        mask = np.any(np.isnan(z[self.triangles]), axis=1)
+        return tri.Triangulation(self.lons, self.lats, triangles=self.triangles, mask=mask)
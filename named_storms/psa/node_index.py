@@ -0,0 +1,122 @@
+import os
+import pickle
+import logging
+import tempfile
+from functools import lru_cache
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from scipy.spatial import cKDTree
+
+from named_storms.models import NsemPsaManifestDataset
+from named_storms.utils import named_storm_nsem_version_cache_path, create_directory
+
+
+logger = logging.getLogger('cwwed')
+
+EARTH_RADIUS = 6371008.8  # mean earth radius in meters
+
+
+class PsaNodeIndex:
+    """
+    KD-tree of a psa dataset's nodes (those saved within the storm's geo) for nearest node and bounding box lookups
+    without querying the database's node table.
+
+    Nodes are indexed as points on the unit sphere so the tree's (chord) distances order the nodes the same as their
+    great-circle distances.  The index is built when the nodes are ingested, persisted next to the psa's cache and
+    loaded lazily by web workers which keep the most recently used indexes in memory.
+    """
+
+    ids: np.ndarray  # database node ids
+    indexes: np.ndarray  # mesh indexes
+    lons: np.ndarray
+    lats: np.ndarray
+    tree: cKDTree
+
+    def __init__(self, ids: np.ndarray, indexes: np.ndarray, lons: np.ndarray, lats: np.ndarray, tree: cKDTree = None):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.indexes = np.asarray(indexes, dtype=np.int32)
+        # the same (double precision) coordinates as the saved nodes' points
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.tree = tree if tree is not None else cKDTree(self.to_xyz(lons, lats), balanced_tree=False)
+
+    @classmethod
+    def path(cls, psa_manifest_dataset: NsemPsaManifestDataset) -> str:
+        return os.path.join(
+            named_storm_nsem_version_cache_path(psa_manifest_dataset.nsem),
+            'node-index',
+            '{}.pickle'.format(psa_manifest_dataset.id),
+        )
+
+    @classmethod
+    def load(cls, psa_manifest_dataset: NsemPsaManifestDataset) -> Optional['PsaNodeIndex']:
+        """
+        returns the dataset's (cached) node index or None if it hasn't been built
+        """
+        path = cls.path(psa_manifest_dataset)
+        try:
+            modified = os.path.getmtime(path)
+        except OSError:
+            return None
+        # the modified time is part of the cache key so a rebuilt index is reloaded
+        return _load_node_index(path, modified)
+
+    def save(self, path: str):
+        # write to a temporary file and then move it into place so readers never see a partial index
+        create_directory(os.path.dirname(path))
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def nearest(self, lons: Iterable[float], lats: Iterable[float], distance: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        returns the positions (into the index's arrays) of the nearest node to every point and whether it's within
+        a distance (meters) of the point
+        """
+        chord, positions = self.tree.query(self.to_xyz(lons, lats), distance_upper_bound=self.to_chord(distance))
+        found = np.isfinite(chord)
+        return np.where(found, positions, 0), found
+
+    def positions(self, indexes: Iterable[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        returns the positions (into the index's arrays) of mesh indexes and whether each node was indexed
+        (i.e saved with the psa)
+        """
+        indexes = np.asarray(indexes, dtype=np.int64)
+        if not len(self.indexes):
+            return np.zeros(len(indexes), dtype=np.int64), np.zeros(len(indexes), dtype=bool)
+        order = np.argsort(self.indexes)
+        positions = order[np.searchsorted(self.indexes, indexes, sorter=order).clip(max=len(order) - 1)]
+        return positions, self.indexes[positions] == indexes
+
+    def within_bbox(self, west: float, south: float, east: float, north: float) -> np.ndarray:
+        """
+        returns the positions (into the index's arrays) of every node within a bounding box
+        """
+        # candidates within the sphere around the box's center which contains it's corners, then exactly within the box
+        center = self.to_xyz([(west + east) / 2], [(south + north) / 2])[0]
+        corners = self.to_xyz([west, west, east, east], [south, north, south, north])
+        candidates = np.asarray(self.tree.query_ball_point(center, np.linalg.norm(corners - center, axis=1).max()), dtype=np.int64)
+        lons, lats = self.lons[candidates], self.lats[candidates]
+        return np.sort(candidates[(lons >= west) & (lons <= east) & (lats >= south) & (lats <= north)])
+
+    @staticmethod
+    def to_xyz(lons: Iterable[float], lats: Iterable[float]) -> np.ndarray:
+        lons = np.radians(np.asarray(lons, dtype=np.float64))
+        lats = np.radians(np.asarray(lats, dtype=np.float64))
+        return np.column_stack([np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)])
+
+    @staticmethod
+    def to_chord(distance: float) -> float:
+        # unit sphere chord length of a great-circle distance (meters)
+        return 2 * np.sin(distance / (2 * EARTH_RADIUS))
+
+
+@lru_cache(maxsize=settings.CWWED_PSA_NODE_INDEX_CACHE_SIZE)
+def _load_node_index(path: str, modified: float) -> PsaNodeIndex:
+    logger.info('loading node index {}'.format(path))
+    with open(path, 'rb') as f:
+        return pickle.load(f)
@@ -1,51 +1,334 @@
 import os
-import time
 import logging
-import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Tuple
+from typing import Iterator, List, Optional, Tuple
 
-import geopandas
-from shapely import wkt
 from shapely import geometry
+from shapely.prepared import prep
+from shapely.strtree import STRtree
 import matplotlib.colors
-import matplotlib.pyplot as plt
-import matplotlib.tri as tri
 import matplotlib.cm
 import pytz
 import xarray as xr
 import numpy as np
+import pyarrow as pa
 from django.contrib.gis import geos
-from django.db import connections
-
-from named_storms.models import NsemPsaManifestDataset, NsemPsaVariable, NsemPsaContour, NsemPsaData
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Max
+
+from named_storms.models import (
+    NsemPsaManifestDataset, NsemPsaVariable, NsemPsaNode, NsemPsaData, NsemPsaContour, NsemPsaContourLevel, NsemPsaNodeTimeSeries,
+)
+from named_storms.psa.contour import ContourEngine, FilledContours
+from named_storms.psa.mesh import PsaMesh
+from named_storms.psa.node_index import PsaNodeIndex
+from named_storms.psa.store import PsaStore, PsaStoreWriter
+from named_storms.psa.writer import PsaDataCopyWriter, PsaNodeCopyWriter, PsaNodeTimeSeriesCopyWriter
+from named_storms.sql import (
+    save_contours_query, save_contour_levels_query, delete_psa_nodes_query, reserve_ids_query, create_psa_partitions_query, delete_psa_variable_date_query,
+    delete_psa_variable_query, psa_partition_table, psa_staging_table, psa_staging_tables_exist_query, PSA_PARTITIONED_TABLES,
+)
 from named_storms.utils import named_storm_nsem_version_path
 
 
 logger = logging.getLogger('cwwed')
 
-NULL_FILL_VALUE = -9999
 CONTOUR_LEVELS = 25  # number of contour levels
 COLOR_STEPS = 10  # number of color bar steps
-NULL_REPRESENT = r'\N'
+STATISTICS_TIME_CHUNK = 10  # number of dates to read at a time when computing variable statistics
+STATISTICS_SAMPLE_SIZE = 1000000  # approximate number of values sampled to estimate percentiles
+STATISTICS_PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+VARIABLE_ATTRIBUTES = ('statistics', 'color_bar', 'meta')  # psa variable attributes derived from the ingested data
 
 
 class PsaDatasetProcessor:
     dataset: xr.Dataset
     psa_manifest_dataset: NsemPsaManifestDataset
+    _mesh: PsaMesh = None
+    _node_ids: np.ndarray = None
+    _store: PsaStore = None
+    _staging: bool = None
+    _contour_executor: ThreadPoolExecutor = None
 
     def __init__(self, psa_manifest_dataset: NsemPsaManifestDataset):
         self.psa_manifest_dataset = psa_manifest_dataset
         self.dataset = xr.open_dataset(os.path.join(
             named_storm_nsem_version_path(self.psa_manifest_dataset.nsem),
-            self.psa_manifest_dataset.path)
+            self.psa_manifest_dataset.path),
+            # don't keep loaded values in memory since variables are read a date/chunk at a time
+            cache=False,
         )
+        if settings.CWWED_PSA_CONTOUR_WORKERS > 1:
+            self._contour_executor = ThreadPoolExecutor(max_workers=settings.CWWED_PSA_CONTOUR_WORKERS)
 
     def __del__(self):
         # cleanup
         self.dataset.close()
+        if self._contour_executor is not None:
+            self._contour_executor.shutdown()
+
+    @property
+    def mesh(self) -> PsaMesh:
+        # the mesh is shared by every variable and date so it's loaded from (or built into) the psa cache once
+        if self._mesh is None:
+            self._mesh = PsaMesh.load_or_build(self.psa_manifest_dataset, self.dataset)
+        return self._mesh
+
+    @property
+    def staging(self) -> bool:
+        """
+        whether the psa is being reingested, in which case data is written to staging tables (and a staging store) which
+        are swapped in once the whole psa has been ingested so readers never see a partially reingested psa
+        """
+        if self._staging is None:
+            self._staging = psa_staging_tables_exist_query(self.psa_manifest_dataset.nsem_id)
+        return self._staging
+
+    @property
+    def store(self) -> PsaStore:
+        # columnar sidecar of the data which is written alongside the database
+        if self._store is None:
+            self._store = PsaStore(self.psa_manifest_dataset, staging=self.staging)
+        return self._store
+
+    @property
+    def node_ids(self) -> np.ndarray:
+        """
+        node ids for every mesh node (in mesh order) which are derived from the first node's id since the nodes
+        within the storm's geo are saved with a contiguous block of ids
+        """
+        if self._node_ids is None:
+            self._node_ids = self._first_node_id() + np.cumsum(self.mesh.storm_mask) - 1
+        return self._node_ids
+
+    def finish_reingest(self):
+        """
+        replaces the store with it's staging store once the psa's staging tables have been swapped in
+        """
+        PsaStore(self.psa_manifest_dataset).swap_staging()
+
+    def apply_staged_variable_attributes(self):
+        """
+        applies the variable attributes saved while reingesting, which should happen in the same transaction as
+        swapping in the psa's staging tables so the attributes always match the data being served
+        """
+        store = PsaStore(self.psa_manifest_dataset, staging=True)
+        for variable in self.psa_manifest_dataset.variables:
+            attributes = store.read_variable_attributes(variable)
+            if attributes is not None:
+                self.psa_manifest_dataset.nsem.nsempsavariable_set.filter(name=variable).update(**attributes)
+
+    def ingest_nodes(self):
+        """
+        saves the mesh nodes within the storm's geo once so every variable/date can reference them by id
+        """
+
+        indexes = np.flatnonzero(self.mesh.storm_mask)
+
+        # legacy nodes have to be replaced along with all of the psa's data so they can't be reused by a reingest
+        if self.staging and self.psa_manifest_dataset.legacy_nodes:
+            raise Exception('{}: nodes were migrated from point data so the psa requires a full reingest'.format(self.psa_manifest_dataset))
+
+        with transaction.atomic():
+            # make sure the psa's partitions exist before any of it's data is saved
+            create_psa_partitions_query(self.psa_manifest_dataset.nsem_id)
+
+            # the psa's current data references the existing nodes so they're kept while reingesting
+            if self.staging:
+                # nodes are unique per mesh index so they can only be replaced along with the current data, i.e a full reingest
+                if not self._nodes_match(indexes):
+                    raise Exception('{}: nodes no longer match the mesh so the psa requires a full reingest'.format(self.psa_manifest_dataset))
+                logger.info('{}: reusing {} existing nodes'.format(self.psa_manifest_dataset, len(indexes)))
+                if not len(indexes):
+                    return
+            else:
+                # remove any existing nodes (and their data) in case we're reprocessing this psa
+                delete_psa_nodes_query(self.psa_manifest_dataset.nsem_id, self.psa_manifest_dataset.id)
+
+                # the replacement nodes are in mesh order
+                if self.psa_manifest_dataset.legacy_nodes:
+                    self.psa_manifest_dataset.legacy_nodes = False
+                    self.psa_manifest_dataset.save(update_fields=['legacy_nodes'])
+
+                if not len(indexes):
+                    logger.warning('{}: no nodes within the storm'.format(self.psa_manifest_dataset))
+                    return
+
+                first_id = reserve_ids_query(NsemPsaNode._meta.db_table, len(indexes))
+
+                PsaNodeCopyWriter().write(
+                    self.psa_manifest_dataset.id,
+                    first_id + np.arange(len(indexes)),
+                    indexes,
+                    self.mesh.lons[indexes],
+                    self.mesh.lats[indexes],
+                )
+
+                logger.info('{}: saved {} nodes'.format(self.psa_manifest_dataset, len(indexes)))
+
+        # spatial index of the nodes for nearest node and bounding box lookups
+        PsaNodeIndex(
+            self.node_ids[indexes],
+            indexes,
+            self.mesh.lons[indexes],
+            self.mesh.lats[indexes],
+        ).save(PsaNodeIndex.path(self.psa_manifest_dataset))
 
     def ingest_variable(self, variable: str, date: datetime = None):
+        """
+        ingest a single variable for a single date (or no date for "max-values" variables)
+        """
+
+        psa_variable = self._get_or_create_psa_variable(variable)
+
+        data_array = self._ingest_variable_date(psa_variable, date)
+
+        self._save_psa_variable(psa_variable, data_array)
+
+    def ingest_variable_dates(self, variable: str, dates: List[datetime], batch_size: int = None):
+        """
+        ingest a time-series variable for many dates in a single pass using the already-opened dataset,
+        committing the results in batches of dates
+        """
+
+        batch_size = batch_size or settings.CWWED_PSA_INGEST_BATCH_SIZE
+
+        psa_variable = self._get_or_create_psa_variable(variable)
+
+        assert psa_variable.data_type == NsemPsaVariable.DATA_TYPE_TIME_SERIES, 'expected time-series variable for {}'.format(psa_variable)
+
+        data_array = None
+        for i in range(0, len(dates), batch_size):
+            batch_dates = dates[i:i + batch_size]
+            with transaction.atomic():
+                for date in batch_dates:
+                    data_array = self._ingest_variable_date(psa_variable, date)
+            logger.info('{}: committed {} for {} of {} dates'.format(
+                self.psa_manifest_dataset, psa_variable, i + len(batch_dates), len(dates)))
+
+        if data_array is not None:
+            self._save_psa_variable(psa_variable, data_array)
+
+    def ingest_variable_statistics(self, variable: str) -> dict:
+        """
+        computes a variable's global statistics across every date and saves them on the psa variable so
+        contour levels and the color bar don't have to re-scan the whole variable for every date
+        """
+
+        psa_variable = self._get_or_create_psa_variable(variable)
+        psa_variable.statistics = self.variable_statistics(self.dataset[variable])
+        self._save_variable_attributes(psa_variable)
+
+        logger.info('{}: saved statistics for {}: {}'.format(self.psa_manifest_dataset, psa_variable, psa_variable.statistics))
+
+        return psa_variable.statistics
+
+    def ingest_variable_time_series(self, variable: str):
+        """
+        saves every node's full time-series (ordered by the psa's dates) for a time-series variable as a single row
+        """
+
+        psa_variable = self._get_or_create_psa_variable(variable)
+
+        assert psa_variable.data_type == NsemPsaVariable.DATA_TYPE_TIME_SERIES, 'expected time-series variable for {}'.format(psa_variable)
+
+        # select the psa's dates (the dataset's time index is naive utc)
+        dates = np.array([d.astimezone(pytz.utc).replace(tzinfo=None) for d in self.psa_manifest_dataset.nsem.dates], dtype='datetime64[ns]')
+        time_indexes = self.dataset.indexes['time'].get_indexer(dates)
+        # get_indexer returns -1 for missing dates which would otherwise silently select the last date
+        if (time_indexes == -1).any():
+            missing_dates = [str(date) for date in dates[time_indexes == -1]]
+            raise Exception('{}: {} is missing dates {}'.format(self.psa_manifest_dataset, variable, ', '.join(missing_dates)))
+        data_array = self.dataset[variable].isel(time=time_indexes)
+
+        with transaction.atomic(), self.store.time_series_writer(variable, len(dates)) as store_writer:
+            # delete any existing time-series in case we're reprocessing this psa (directly from the table or staging table)
+            delete_psa_variable_query(self._table(NsemPsaNodeTimeSeries), psa_variable.id)
+            rows, elapsed_time_copy = PsaNodeTimeSeriesCopyWriter(table=self._table(NsemPsaNodeTimeSeries)).write_chunks(
+                psa_variable.id, self._psa_time_series_chunks(data_array, store_writer))
+
+        logger.info('{dataset}: finished saving time-series for {variable} (rows={rows}, copy time={time_copy:.2f}s)'.format(
+            dataset=self.psa_manifest_dataset, variable=psa_variable, rows=rows, time_copy=elapsed_time_copy))
+
+    def ingest_wind_barbs(self):
+        """
+        precomputes paired wind direction & speed at every decimation level (grid cell size) for every date by keeping
+        the node nearest each grid cell's center, so wind barbs are evenly spaced and don't require pairing the data
+        """
+
+        direction, speed = NsemPsaVariable.VARIABLE_DATASET_WIND_DIRECTION, NsemPsaVariable.VARIABLE_DATASET_WIND_SPEED
+        if direction not in self.psa_manifest_dataset.variables or speed not in self.psa_manifest_dataset.variables:
+            return
+
+        for date in self.psa_manifest_dataset.nsem.dates:
+            directions = self.store.read_date(direction, date)
+            speeds = self.store.read_date(speed, date)
+            if directions is None or speeds is None:
+                logger.warning('{}: wind data is missing from the store at {}'.format(self.psa_manifest_dataset, date))
+                continue
+
+            # nodes with both a direction and speed
+            indexes, direction_positions, speed_positions = np.intersect1d(directions[0], speeds[0], assume_unique=True, return_indices=True)
+            lons, lats = self.mesh.lons[indexes], self.mesh.lats[indexes]
+
+            for cell_size in settings.CWWED_PSA_WIND_BARB_CELL_SIZES:
+                positions = self.decimate_points(lons, lats, cell_size)
+                with self.store.wind_barbs_writer(cell_size, date) as store_writer:
+                    store_writer.write([
+                        pa.array(lons[positions], pa.float32()),
+                        pa.array(lats[positions], pa.float32()),
+                        pa.array(directions[1][direction_positions[positions]], pa.float32()),
+                        pa.array(speeds[1][speed_positions[positions]], pa.float32()),
+                    ])
+
+        logger.info('{}: saved wind barbs for {} decimation levels'.format(self.psa_manifest_dataset, len(settings.CWWED_PSA_WIND_BARB_CELL_SIZES)))
+
+    def _table(self, model) -> str:
+        # the psa's staging table when reingesting, otherwise it's partition (or the table itself when it isn't partitioned), of a psa staged model
+        if self.staging:
+            return psa_staging_table(model._meta.db_table, self.psa_manifest_dataset.nsem_id)
+        if model._meta.db_table in PSA_PARTITIONED_TABLES:
+            return psa_partition_table(model._meta.db_table, self.psa_manifest_dataset.nsem_id)
+        return model._meta.db_table
+
+    def _save_variable_attributes(self, psa_variable: NsemPsaVariable):
+        # reingested attributes are saved with the staging store and applied once the psa is swapped in
+        if self.staging:
+            self.store.write_variable_attributes(psa_variable.name, {name: getattr(psa_variable, name) for name in VARIABLE_ATTRIBUTES})
+        else:
+            psa_variable.save()
+
+    def _first_node_id(self) -> int:
+        # nodes are saved as a single contiguous block of ids in mesh order (unlike legacy nodes which are refused so
+        # a partial ingest doesn't attach values to the wrong nodes)
+        assert not self.psa_manifest_dataset.legacy_nodes, '{}: nodes were migrated from point data so the psa requires a full reingest'.format(
+            self.psa_manifest_dataset)
+        last_id = self.psa_manifest_dataset.nsempsanode_set.order_by('-id').values_list('id', flat=True).first()
+        assert last_id is not None, '{}: nodes have not been ingested'.format(self.psa_manifest_dataset)
+        return last_id - int(self.mesh.storm_mask.sum()) + 1
+
+    def _nodes_match(self, indexes: np.ndarray) -> bool:
+        # whether the existing nodes are a single block of ids for exactly the supplied mesh indexes (in mesh order)
+        nodes = self.psa_manifest_dataset.nsempsanode_set.aggregate(
+            count=Count('id'), min_index=Min('index'), max_index=Max('index'), min_id=Min('id'), max_id=Max('id'))
+        if nodes['count'] != len(indexes):
+            return False
+        if not len(indexes):
+            return True
+        if not (
+            nodes['min_index'] == indexes[0] and nodes['max_index'] == indexes[-1] and
+            nodes['max_id'] - nodes['min_id'] + 1 == nodes['count']
+        ):
+            return False
+        # the node ids are derived from the mesh's storm mask so every node's index has to be in id order
+        existing_indexes = np.fromiter(
+            self.psa_manifest_dataset.nsempsanode_set.order_by('id').values_list('index', flat=True).iterator(),
+            dtype=indexes.dtype, count=nodes['count'])
+        return np.array_equal(existing_indexes, indexes)
+
+    def _get_or_create_psa_variable(self, variable: str) -> NsemPsaVariable:
 
         assert variable in NsemPsaVariable.VARIABLES, 'unknown variable "{}"'.format(variable)
 
@@ -61,9 +344,22 @@ class PsaDatasetProcessor:
             )
         )
 
-        # delete any existing psa variable data in case we're reprocessing this psa
-        psa_variable.nsempsacontour_set.filter(date=date).delete()
-        psa_variable.nsempsadata_set.filter(date=date).delete()
+        # use the attributes already saved by this reingest rather than the psa's current attributes
+        if self.staging:
+            for name, value in (self.store.read_variable_attributes(variable) or {}).items():
+                setattr(psa_variable, name, value)
+
+        return psa_variable
+
+    def _ingest_variable_date(self, psa_variable: NsemPsaVariable, date: datetime = None) -> xr.DataArray:
+        # contours and raw data for a variable at a specific date
+
+        variable = psa_variable.name
+
+        # delete any existing psa variable data in case we're reprocessing this psa (directly from the psa's partition or staging table)
+        delete_psa_variable_date_query(self._table(NsemPsaContour), psa_variable.id, date)
+        delete_psa_variable_date_query(self._table(NsemPsaContourLevel), psa_variable.id, date)
+        delete_psa_variable_date_query(self._table(NsemPsaData), psa_variable.id, date)
 
         # contours
         if psa_variable.geo_type == NsemPsaVariable.GEO_TYPE_POLYGON:
@@ -93,8 +389,6 @@ class PsaDatasetProcessor:
                 # save raw data
                 self._save_psa_data(psa_variable, data_array, date)
 
-            psa_variable.color_bar = self._color_bar_values(psa_variable, self.dataset[variable].min(), self.dataset[variable].max())
-
         # wind barbs - only saving point data with wind directions
         elif psa_variable.name == NsemPsaVariable.VARIABLE_DATASET_WIND_DIRECTION:
             assert date is not None, 'date must be supplied for time-series variable {}'.format(psa_variable)
@@ -104,8 +398,27 @@ class PsaDatasetProcessor:
         else:
             raise Exception('{}: Unknown variable type {}'.format(self.psa_manifest_dataset, variable))
 
+        return data_array
+
+    def _save_psa_variable(self, psa_variable: NsemPsaVariable, data_array: xr.DataArray):
+        # save the variable's color bar and metadata once its data has been ingested
+
+        if psa_variable.geo_type == NsemPsaVariable.GEO_TYPE_POLYGON:
+            variable_range = self._variable_range(psa_variable)
+            # a variable without any values doesn't have a color bar
+            psa_variable.color_bar = self._color_bar_values(psa_variable, *variable_range) if variable_range else []
+
         psa_variable.meta = self._to_python_values(data_array.attrs)
-        psa_variable.save()
+        self._save_variable_attributes(psa_variable)
+
+    def _variable_range(self, psa_variable: NsemPsaVariable) -> Optional[Tuple[float, float]]:
+        # statistics are computed once per psa after validation but compute them here if they're missing
+        if not psa_variable.statistics:
+            psa_variable.statistics = self.variable_statistics(self.dataset[psa_variable.name])
+        # every value is null
+        if psa_variable.statistics['min'] is None or psa_variable.statistics['max'] is None:
+            return None
+        return psa_variable.statistics['min'], psa_variable.statistics['max']
 
     def get_metadata(self):
         # return dataset metadata in python native types
@@ -119,50 +432,51 @@ class PsaDatasetProcessor:
 
         logger.info('{}: building contours for {} at {}'.format(self.psa_manifest_dataset, nsem_psa_variable, dt))
 
+        # every date uses the same levels across the variable's global range so they match the color bar
+        variable_range = self._variable_range(nsem_psa_variable)
+        if variable_range is None:
+            logger.warning('{}: skipping contours for {} since it does not have any values'.format(self.psa_manifest_dataset, nsem_psa_variable))
+            return
+        z_min, z_max = variable_range
+
         # structured grid
         if self.psa_manifest_dataset.structured:
-            contourf = plt.contourf(self.dataset['lon'], self.dataset['lat'], z, cmap=self._get_color_map(nsem_psa_variable), levels=CONTOUR_LEVELS)
-            self._process_contours_gridded(nsem_psa_variable, contourf, dt)
+            engine = self._contour_engine(ContourEngine(CONTOUR_LEVELS).get_levels(z_min, z_max))
+            filled_contours = engine.contour_grid(self.dataset['lon'].values, self.dataset['lat'].values, z.values)
+            contours = self._process_contours_gridded(nsem_psa_variable, filled_contours)
 
         # unstructured grid - use provided triangulation to contour
         else:
 
-            # adjust mesh topology indexing if this is 0-based or 1-based indexing
-            # see https://github.com/ugrid-conventions/ugrid-conventions
-            # subtract n from the topology/mesh using "start_index" metadata
-            topology = self.dataset[self.psa_manifest_dataset.topology_name]
-            topology = np.subtract(
-                topology,
-                topology.attrs['start_index'],
-            )
+            # build triangulation using the cached mesh connectivity and a mask of the triangles with null values
+            triangulation = self.mesh.triangulation(z.values)
 
-            # create mask to identify triangles with null values
-            tri_nulls = z[topology].isnull()
-            # convert to single dimension result of whether any the points in each triangle/row are null
-            tri_mask = np.any(tri_nulls, axis=1)
+            # only contour valid levels (nulls are excluded by the triangulation's mask)
+            engine = self._contour_engine(np.linspace(z_min, z_max, num=CONTOUR_LEVELS))
+            filled_contours = engine.contour_triangulation(triangulation, z.values)
 
-            # build triangulation using supplied mesh connectivity and tri mask
-            triangulation = tri.Triangulation(self.dataset.lon, self.dataset.lat, triangles=topology, mask=tri_mask)
+            contours = self._process_contours_triangulation(nsem_psa_variable, filled_contours)
 
-            # replace nulls with an arbitrary fill value and then only contour valid levels
-            levels = np.linspace(z.min(), z.max(), num=CONTOUR_LEVELS)
-            tricontourf = plt.tricontourf(triangulation, z.fillna(NULL_FILL_VALUE), levels=levels, cmap=self._get_color_map(nsem_psa_variable))
+        self._save_contours(nsem_psa_variable, dt, contours)
 
-            self._process_contours_triangulation(nsem_psa_variable, tricontourf, dt)
+    def _contour_engine(self, levels) -> ContourEngine:
+        return ContourEngine(levels, executor=self._contour_executor, workers=settings.CWWED_PSA_CONTOUR_WORKERS)
 
-    def _process_contours_gridded(self, nsem_psa_variable: NsemPsaVariable, contourf, dt):
-        # the polygons that come out of matplotlib's contourf are nicely ordered exteriors with interior rings so
+    def _process_contours_gridded(self, nsem_psa_variable: NsemPsaVariable, filled_contours: FilledContours) -> List[Tuple[geos.Polygon, float, str]]:
+        # the polygons that come out of matplotlib's contour generator are nicely ordered exteriors with interior rings so
         # it's very straightforward to build the resulting polygons
 
-        # process matplotlib contourf results
-        for i, collection in enumerate(contourf.collections):
+        contours = []
+
+        # process filled contour results
+        for i, paths in enumerate(filled_contours.paths):
 
             # contour level value and color
-            value = contourf.levels[i]
-            color = matplotlib.colors.to_hex(self._get_color_map(nsem_psa_variable)(contourf.norm(value)))
+            value = filled_contours.levels[i]
+            color = matplotlib.colors.to_hex(self._get_color_map(nsem_psa_variable)(filled_contours.norm(value)))
 
             # loop through all polygons that have the same intensity level
-            for path in collection.get_paths():
+            for path in paths:
 
                 polygons = path.to_polygons()
 
@@ -173,24 +487,25 @@ class PsaDatasetProcessor:
                 # the first polygon of the path is the exterior ring while the following are interior rings (holes)
                 polygon = geos.Polygon(polygons[0], *polygons[1:])
 
-                self._save_contour(nsem_psa_variable, dt, polygon, value, color)
+                contours.append((polygon, value, color))
 
-    def _process_contours_triangulation(self, nsem_psa_variable: NsemPsaVariable, tricontourf, dt):
-        # the polygons that come out of matplotlib's tricontourf are unordered and unidentified (exterior vs interior)
+        return contours
+
+    def _process_contours_triangulation(self, nsem_psa_variable: NsemPsaVariable, filled_contours: FilledContours) -> List[Tuple[geos.Polygon, float, str]]:
+        # the polygons that come out of matplotlib's triangulation contour generator are unordered and unidentified (exterior vs interior)
         # so we have to calculate which are exterior rings and which interior rings are contained within each exterior
 
+        contours = []
+
         # process contour results
-        for collection_idx, collection in enumerate(tricontourf.collections):
+        for i, paths in enumerate(filled_contours.paths):
 
             # contour level value and color
-            value = tricontourf.levels[collection_idx]
-            color = matplotlib.colors.to_hex(self._get_color_map(nsem_psa_variable)(tricontourf.norm(value)))
+            value = filled_contours.levels[i]
+            color = matplotlib.colors.to_hex(self._get_color_map(nsem_psa_variable)(filled_contours.norm(value)))
 
             # loop through all polygons that have the same intensity level
-            for path in collection.get_paths():
-
-                # don't simplify the paths
-                path.should_simplify = False
+            for path in paths:
 
                 path_polygons = path.to_polygons()
 
@@ -198,134 +513,79 @@ class PsaDatasetProcessor:
                     logger.warning('{}: skipping path with empty polygons for {}'.format(self.psa_manifest_dataset, nsem_psa_variable))
                     continue
 
-                # classify exterior and interior polygons
-                exterior_polygons, interior_rings = self.classify_polygons(path_polygons)
+                # build polygons by assigning the interior rings (holes) to their exteriors
+                for polygon in self.build_polygons(path_polygons):
+                    contours.append((polygon, value, color))
 
-                # build all polygons for this path using the calculated interior rings/holes
-                for exterior_idx, exterior in enumerate(exterior_polygons):
+        return contours
 
-                    interior_indexes = []
+    def _save_contours(self, nsem_psa_variable: NsemPsaVariable, dt: datetime, contours: List[Tuple[geos.Polygon, float, str]]):
+        # save all the contour results for a variable/date in a single bulk insert which
+        # fixes invalid polygons and trims them to the storm's geo in one batched database operation
 
-                    # sort interiors by size so we add the right ones first and skip nested ones
-                    interior_rings.sort(key=lambda x: geos.Polygon(x).area, reverse=True)
-
-                    # assign interior rings (holes)
-                    exterior_interior_rings = []
-                    for interior_idx, interior in enumerate(interior_rings):
-                        # exterior contains this interior
-                        if exterior.contains(interior):
-                            # avoid nested rings (i.e. an interior that belongs to another exterior)
-                            for exterior_interior_ring in exterior_interior_rings:
-                                # skip since an existing hole for this exterior contains this interior so it must be for another exterior
-                                if geos.Polygon(exterior_interior_ring).contains(interior):
-                                    break
-                            # include this interior
-                            else:  # for/else
-                                interior_indexes.append(interior_idx)
-                                exterior_interior_rings.append(interior)
-
-                    # remove used interiors
-                    interior_rings = [interior for i, interior in enumerate(interior_rings) if i not in interior_indexes]
-
-                    # build final result polygon
-                    polygon = geos.Polygon(exterior[0], *exterior_interior_rings)
-
-                    self._save_contour(nsem_psa_variable, dt, polygon, value, color)
-
-    def _save_contour(self, nsem_psa_variable: NsemPsaVariable, dt: datetime, polygon: geos.Polygon, value: float, color: str):
-        # save a contour result
-
-        storm_geo = self.psa_manifest_dataset.nsem.named_storm.geo  # type: geos.GEOSGeometry
-
-        # fix any self-intersecting "bow ties"
-        if not polygon.valid:
-            polygon = polygon.buffer(0)
-
-        # trim to storm's geo
-        polygon = storm_geo.intersection(polygon)
-
-        # skip empty results
-        if polygon.empty:
+        if not contours:
             return
 
-        # create psa result from contour result
-        NsemPsaContour.objects.create(
-            nsem_psa_variable=nsem_psa_variable,
+        polygons, values, colors = zip(*contours)
+
+        rows = save_contours_query(
+            nsem_id=nsem_psa_variable.nsem_id,
+            nsem_psa_variable_id=nsem_psa_variable.id,
             date=dt,
-            geo=polygon,
-            value=value,
-            color=color,
+            named_storm_id=self.psa_manifest_dataset.nsem.named_storm_id,
+            polygons=polygons,
+            values=values,
+            colors=colors,
+            table=self._table(NsemPsaContour),
         )
 
+        logger.info('{}: saved {} of {} contours for {} at {}'.format(
+            self.psa_manifest_dataset, rows, len(contours), nsem_psa_variable, dt))
+
+        # simplified levels of detail for zoomed out views
+        if settings.CWWED_PSA_CONTOUR_TOLERANCES:
+            rows = save_contour_levels_query(
+                nsem_psa_variable_id=nsem_psa_variable.id,
+                date=dt,
+                tolerances=settings.CWWED_PSA_CONTOUR_TOLERANCES,
+                contour_table=self._table(NsemPsaContour),
+                table=self._table(NsemPsaContourLevel),
+            )
+            logger.info('{}: saved {} simplified contours for {} at {}'.format(self.psa_manifest_dataset, rows, nsem_psa_variable, dt))
+
     def _save_psa_data(self, psa_variable: NsemPsaVariable, da: xr.DataArray, date=None):
         """
         perform a low level data copy into postgres via it's COPY mechanism which is much more
-        efficient than using django's orm (even bulk_create) since it has to serialize every object
-        https://www.postgresql.org/docs/9.4/sql-copy.html
-        https://www.psycopg.org/docs/cursor.html#cursor.copy_from
+        efficient than using django's orm (even bulk_create) since it has to serialize every object.
+        rows are streamed straight from the numpy arrays and reference their mesh nodes by id
         """
 
         logger.info('{}: saving psa data for {} at {}'.format(self.psa_manifest_dataset, psa_variable, date))
 
-        # define database columns to copy to
-        columns = [
-            NsemPsaData.nsem_psa_variable.field.attname,
-            NsemPsaData.point.field.attname,
-            NsemPsaData.value.field.attname,
-            NsemPsaData.date.field.attname,
-        ]
-
-        # create pandas dataframe for csv output
-        df = da.to_dataframe()
+        # "max-values" variables don't have a date
+        dt = self.datetime64_to_datetime(da['time'].values) if date is not None else None
 
-        # drop nulls
-        df = df.dropna()
+        with self.store.date_writer(psa_variable.name, dt) as store_writer:
+            rows, elapsed_time_copy = PsaDataCopyWriter(table=self._table(NsemPsaData)).write_chunks(psa_variable, self._psa_data_chunks(da, store_writer), dt)
 
-        # include empty date column placeholder if it doesn't exist
-        if date is None:
-            df['time'] = None
+        logger.info('{dataset}: finished saving psa data for {variable} at {date} (rows={rows}, copy time={time_copy:.2f}s)'.format(
+            dataset=self.psa_manifest_dataset, variable=psa_variable, date=date, rows=rows, time_copy=elapsed_time_copy))
 
-        # add psa variable column
-        df['psa_variable_id'] = psa_variable.id
+    def _psa_data_chunks(self, da: xr.DataArray, store_writer: PsaStoreWriter) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        # lazily read the data array in chunks of nodes so only a single chunk is held in memory while copying
+        for nodes, values in self.mesh.iter_chunks(da, settings.CWWED_PSA_INGEST_CHUNK_SIZE):
+            # only include non-null values within the storm's geo
+            mask = self.mesh.storm_mask[nodes] & ~np.isnan(values)
+            store_writer.write(self.store.date_arrays(np.arange(nodes.start, nodes.stop)[mask], values[mask]))
+            yield self.node_ids[nodes][mask], values[mask]
 
-        # add point column in wkt format using the lat/lon coordinates and handle
-        # cases where the lat/lon are either indexes or column values
-
-        # coordinates are individual columns so zip them together
-        if set(df.columns).issuperset(['lat', 'lon']):
-            df['point'] = list(map(lambda p: geometry.Point(p[1], p[0]), list(zip(df['lat'], df['lon']))))
-        # coordinates are a pandas MultiIndex so we can directly map them to points
-        elif set(df.index.names).issuperset(['lat', 'lon']):
-            df['point'] = df.index.map(lambda p: geometry.Point(p[1], p[0]))
-        else:
-            raise Exception('Expected lat and lon coordinates either as index or columns')
-
-        # create geopandas dataframe and filter to storm's geo
-        gdf = geopandas.GeoDataFrame(df)
-        gdf = gdf.set_geometry('point')
-        gdf = gdf[gdf.within(wkt.loads(self.psa_manifest_dataset.nsem.named_storm.geo.wkt))]
-
-        # reorder gdf columns
-        gdf = gdf[['psa_variable_id', 'point', psa_variable.name, 'time']]
-
-        with tempfile.NamedTemporaryFile() as f:
-
-            # write csv results to file-like object
-            gdf.to_csv(f.name, header=False, index=False, na_rep=NULL_REPRESENT)
-            f.seek(0)  # set file read position back to beginning
-
-            # use default database connection
-            with connections['default'].cursor() as cursor:
-
-                start_time = time.time()
-
-                # copy data into table using postgres COPY feature
-                cursor.copy_from(f, NsemPsaData._meta.db_table, columns=columns, sep=',', null=NULL_REPRESENT)
-
-                elapsed_time_copy = time.time() - start_time
-
-        logger.info('{dataset}: finished saving psa data for {variable} at {date} (copy time={time_copy:.2f}s)'.format(
-            dataset=self.psa_manifest_dataset, variable=psa_variable, date=date, time_copy=elapsed_time_copy))
+    def _psa_time_series_chunks(self, da: xr.DataArray, store_writer: PsaStoreWriter) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        # lazily read every date of the data array in chunks of nodes
+        for nodes, values in self.mesh.iter_chunks(da, settings.CWWED_PSA_INGEST_CHUNK_SIZE):
+            # only include nodes within the storm's geo which have any values
+            mask = self.mesh.storm_mask[nodes] & ~np.all(np.isnan(values), axis=0)
+            store_writer.write(self.store.time_series_arrays(np.arange(nodes.start, nodes.stop)[mask], values[:, mask]))
+            yield self.node_ids[nodes][mask], values[:, mask]
 
     def _color_bar_values(self, nsem_psa_variable: NsemPsaVariable, z_min: float, z_max: float):
         # build color bar values
@@ -344,6 +604,42 @@ class PsaDatasetProcessor:
 
         return color_values
 
+    @staticmethod
+    def variable_statistics(da: xr.DataArray) -> dict:
+        """
+        min, max, null counts and approximate percentiles for a variable in a single pass over chunks of dates
+        (percentiles are estimated from an evenly strided sample of the valid values)
+        """
+
+        stride = max(1, da.size // STATISTICS_SAMPLE_SIZE)
+        time_size = da.sizes.get('time', 1)
+
+        z_min, z_max = np.inf, -np.inf
+        count = null_count = 0
+        samples = []
+
+        for i in range(0, time_size, STATISTICS_TIME_CHUNK):
+            values = (da.isel(time=slice(i, i + STATISTICS_TIME_CHUNK)) if 'time' in da.dims else da).values.ravel()
+            valid = values[~np.isnan(values)]
+            null_count += values.size - valid.size
+            count += valid.size
+            if valid.size:
+                z_min = min(z_min, float(valid.min()))
+                z_max = max(z_max, float(valid.max()))
+                samples.append(valid[::stride])
+
+        sample = np.concatenate(samples) if samples else np.array([])
+
+        return {
+            'min': z_min if count else None,
+            'max': z_max if count else None,
+            'count': count,
+            'null_count': null_count,
+            'percentiles': {
+                str(p): float(v) for p, v in zip(STATISTICS_PERCENTILES, np.percentile(sample, STATISTICS_PERCENTILES))
+            } if sample.size else {},
+        }
+
     @staticmethod
     def _get_color_map(psa_variable: NsemPsaVariable):
         color_map_name = psa_variable.get_attribute('color_map')
@@ -361,16 +657,72 @@ class PsaDatasetProcessor:
         return np.cross(ring, v2).sum() / 2.0
 
     @classmethod
-    def classify_polygons(cls, polygons) -> Tuple[List[geos.Polygon], List[geos.LinearRing]]:
-        # classify polygons based on their area
-        exteriors = []
-        interiors = []
-        for p in polygons:
-            if cls.signed_area(p) >= 0:
-                exteriors.append(geos.Polygon(p, srid=4326))
-            else:
-                interiors.append(geos.LinearRing(p))
-        return exteriors, interiors
+    def classify_rings(cls, rings) -> Tuple[List[np.ndarray], np.ndarray, List[np.ndarray]]:
+        # classify rings as exteriors or interiors based on their signed area and return the exterior areas
+        areas = np.array([cls.signed_area(ring) for ring in rings])
+        exteriors = [ring for ring, area in zip(rings, areas) if area >= 0]
+        interiors = [ring for ring, area in zip(rings, areas) if area < 0]
+        return exteriors, areas[areas >= 0], interiors
+
+    @classmethod
+    def build_polygons(cls, rings) -> List[geos.Polygon]:
+        """
+        builds polygons from unordered exterior and interior rings by assigning each interior ring (hole) to
+        the smallest exterior that contains it, which handles nested rings (i.e an island inside a hole).
+        candidate exteriors are found using an STR-tree over the exterior bounding boxes so this scales
+        near-linearly with the number of rings
+        """
+
+        exteriors, exterior_areas, interiors = cls.classify_rings(rings)
+
+        if not exteriors:
+            return []
+
+        exterior_polygons = [geometry.Polygon(exterior) for exterior in exteriors]
+        # shapely < 2 returns geometries from the tree which are mapped back to their exteriors by their wkb rather
+        # than their identity since not every version returns the originals (identical exteriors share a key) while
+        # shapely >= 2 returns the exteriors' indexes
+        exterior_indexes = {}
+        for i, polygon in enumerate(exterior_polygons):
+            exterior_indexes.setdefault(polygon.wkb, []).append(i)
+        exterior_prepared = {}
+        exterior_interiors = [[] for _ in exteriors]
+
+        tree = STRtree(exterior_polygons)
+
+        for interior in interiors:
+            interior_ring = geometry.LinearRing(interior)
+            owner = None
+            # exteriors whose bounding box intersects the interior ring
+            candidates = [
+                i for candidate in tree.query(interior_ring)
+                for i in ([int(candidate)] if isinstance(candidate, (int, np.integer)) else exterior_indexes[candidate.wkb])
+            ]
+            for i in candidates:
+                # skip larger exteriors since a smaller containing exterior takes precedence
+                if owner is not None and exterior_areas[i] >= exterior_areas[owner]:
+                    continue
+                if i not in exterior_prepared:
+                    exterior_prepared[i] = prep(exterior_polygons[i])
+                if exterior_prepared[i].contains(interior_ring):
+                    owner = i
+            if owner is not None:
+                exterior_interiors[owner].append(interior)
+
+        return [geos.Polygon(exterior, *holes, srid=4326) for exterior, holes in zip(exteriors, exterior_interiors)]
+
+    @staticmethod
+    def decimate_points(lons: np.ndarray, lats: np.ndarray, cell_size: float) -> np.ndarray:
+        """
+        returns the (sorted) positions of the points nearest the center of every grid cell (degrees) containing points
+        """
+        cells_x, cells_y = np.floor(lons / cell_size), np.floor(lats / cell_size)
+        distances = (lons - (cells_x + .5) * cell_size) ** 2 + (lats - (cells_y + .5) * cell_size) ** 2
+        # order by cell and then distance so the first point of each cell is it's nearest
+        order = np.lexsort((distances, cells_y, cells_x))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (cells_x[order][1:] != cells_x[order][:-1]) | (cells_y[order][1:] != cells_y[order][:-1])
+        return np.sort(order[first])
 
     @staticmethod
     def datetime64_to_datetime(dt64):
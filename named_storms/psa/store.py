@@ -0,0 +1,215 @@
+import os
+import json
+import shutil
+import logging
+import tempfile
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pytz
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from named_storms.models import NsemPsaManifestDataset
+from named_storms.utils import named_storm_nsem_version_store_path, create_directory
+
+
+logger = logging.getLogger('cwwed')
+
+STORE_COMPRESSION = 'snappy'
+STORE_DATE_ROW_GROUP_SIZE = 1000000  # nodes per row group when reading every node at a date
+STORE_TIME_SERIES_ROW_GROUP_SIZE = 10000  # nodes per row group when reading every date at a node
+STORE_MAX_VALUES_KEY = 'max-values'
+STORE_WIND_BARBS_KEY = 'wind-barbs'
+STORE_VARIABLE_ATTRIBUTES_KEY = 'variable-attributes'
+STORE_STAGING_SUFFIX = '.staging'  # store written while reingesting a psa which replaces the current store once it's complete
+
+
+class PsaStoreWriter:
+    """
+    writes chunks of a parquet file to a temporary path and moves it into place once it's complete
+    """
+
+    def __init__(self, path: str, schema: pa.Schema, row_group_size: int):
+        self.path = path
+        self.schema = schema
+        self.row_group_size = row_group_size
+        create_directory(os.path.dirname(path))
+        fd, self._tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        os.close(fd)
+        self._writer = pq.ParquetWriter(self._tmp_path, schema, compression=STORE_COMPRESSION)
+
+    def write(self, arrays: list):
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema), row_group_size=self.row_group_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._writer.close()
+        if exc_type is None:
+            os.replace(self._tmp_path, self.path)
+        else:
+            os.remove(self._tmp_path)
+
+
+class PsaStore:
+    """
+    Parquet sidecar of a psa dataset's data which is stored next to the psa and laid out for both access patterns:
+
+    - every node's value for a variable at a date (one file per variable/date with large row groups)
+    - every date's value for a variable at a node (one node-major file per variable with small row groups
+      so a single node only reads it's own row group)
+
+    Nodes are referenced by their index in the dataset's mesh so the store doesn't depend on the database.
+    Reingesting a psa writes a separate staging store which is swapped in once the whole psa has been ingested.
+    """
+
+    DATE_SCHEMA = pa.schema([
+        ('node', pa.int32()),
+        ('value', pa.float64()),
+    ])
+
+    WIND_BARBS_SCHEMA = pa.schema([
+        ('lon', pa.float32()),
+        ('lat', pa.float32()),
+        ('direction', pa.float32()),
+        ('speed', pa.float32()),
+    ])
+
+    def __init__(self, psa_manifest_dataset: NsemPsaManifestDataset, staging: bool = False):
+        self.psa_manifest_dataset = psa_manifest_dataset
+        self.path = os.path.join(
+            named_storm_nsem_version_store_path(psa_manifest_dataset.nsem),
+            str(psa_manifest_dataset.id),
+        )
+        self.staging_path = self.path + STORE_STAGING_SUFFIX
+        if staging:
+            self.path = self.staging_path
+
+    def date_path(self, variable: str, date: datetime = None) -> str:
+        return os.path.join(self.path, variable, 'dates', '{}.parquet'.format(self.date_key(date)))
+
+    def time_series_path(self, variable: str) -> str:
+        return os.path.join(self.path, variable, 'time-series.parquet')
+
+    def wind_barbs_path(self, cell_size: float, date: datetime) -> str:
+        return os.path.join(self.path, STORE_WIND_BARBS_KEY, str(cell_size), '{}.parquet'.format(self.date_key(date)))
+
+    def variable_attributes_path(self, variable: str) -> str:
+        return os.path.join(self.path, STORE_VARIABLE_ATTRIBUTES_KEY, '{}.json'.format(variable))
+
+    def date_writer(self, variable: str, date: datetime = None) -> PsaStoreWriter:
+        """
+        writer for (node indexes, values) chunks of a variable at a date ("max-values" variables don't have a date)
+        """
+        return PsaStoreWriter(self.date_path(variable, date), self.DATE_SCHEMA, STORE_DATE_ROW_GROUP_SIZE)
+
+    def time_series_writer(self, variable: str, dates_count: int) -> PsaStoreWriter:
+        """
+        writer for (node indexes, (time, node) values) chunks of a variable's full time-series
+        """
+        schema = pa.schema([
+            ('node', pa.int32()),
+            ('values', pa.list_(pa.float64(), dates_count)),
+        ])
+        return PsaStoreWriter(self.time_series_path(variable), schema, STORE_TIME_SERIES_ROW_GROUP_SIZE)
+
+    def wind_barbs_writer(self, cell_size: float, date: datetime) -> PsaStoreWriter:
+        """
+        writer for paired (lons, lats, directions, speeds) wind barbs of a decimation level (grid cell size) at a date
+        """
+        return PsaStoreWriter(self.wind_barbs_path(cell_size, date), self.WIND_BARBS_SCHEMA, STORE_DATE_ROW_GROUP_SIZE)
+
+    @staticmethod
+    def date_arrays(indexes: np.ndarray, values: np.ndarray) -> list:
+        return [pa.array(indexes, pa.int32()), pa.array(values, pa.float64())]
+
+    @staticmethod
+    def time_series_arrays(indexes: np.ndarray, values: np.ndarray) -> list:
+        # node-major fixed size lists with nulls for absent values
+        flat_values = pa.array(values.T.ravel(), pa.float64(), from_pandas=True)
+        return [pa.array(indexes, pa.int32()), pa.FixedSizeListArray.from_arrays(flat_values, values.shape[0])]
+
+    def read_date(self, variable: str, date: datetime = None, indexes: Iterable[int] = None) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        returns the (node indexes, values) of a variable at a date, optionally only for specific nodes,
+        or None if the store doesn't exist
+        """
+        path = self.date_path(variable, date)
+        if not os.path.exists(path):
+            return None
+        filters = [('node', 'in', set(int(i) for i in indexes))] if indexes is not None else None
+        table = pq.read_table(path, filters=filters)
+        return table.column('node').to_numpy(), table.column('value').to_numpy()
+
+    def read_wind_barbs(self, cell_size: float, date: datetime, bbox: Tuple[float, float, float, float]) -> Optional[Tuple[np.ndarray, ...]]:
+        """
+        returns the (lons, lats, directions, speeds) of a decimation level's wind barbs at a date within a bounding box
+        (west, south, east, north) or None if they haven't been precomputed
+        """
+        path = self.wind_barbs_path(cell_size, date)
+        if not os.path.exists(path):
+            return None
+        west, south, east, north = bbox
+        table = pq.read_table(path, filters=[('lon', '>=', west), ('lon', '<=', east), ('lat', '>=', south), ('lat', '<=', north)])
+        return tuple(table.column(name).to_numpy() for name in self.WIND_BARBS_SCHEMA.names)
+
+    def read_time_series_nodes(self, variable: str, indexes: Iterable[int]) -> Optional[Dict[int, list]]:
+        """
+        returns a variable's values (ordered by the psa's dates) for many nodes in a single read keyed by node index
+        (nodes without any values are absent) or None if the store doesn't exist
+        """
+        path = self.time_series_path(variable)
+        if not os.path.exists(path):
+            return None
+        table = pq.read_table(path, filters=[('node', 'in', set(int(i) for i in indexes))])
+        return dict(zip(table.column('node').to_pylist(), table.column('values').to_pylist()))
+
+    def write_variable_attributes(self, variable: str, attributes: dict):
+        """
+        saves a variable's attributes (i.e statistics and color bar) while reingesting so they're only applied to the
+        psa variable once the reingested data is swapped in
+        """
+        path = self.variable_attributes_path(variable)
+        create_directory(os.path.dirname(path))
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(attributes, fh)
+        os.replace(tmp_path, path)
+
+    def read_variable_attributes(self, variable: str) -> Optional[dict]:
+        """
+        returns a variable's saved attributes or None if they haven't been saved
+        """
+        path = self.variable_attributes_path(variable)
+        if not os.path.exists(path):
+            return None
+        with open(path) as fh:
+            return json.load(fh)
+
+    def delete(self, variable: str = None):
+        shutil.rmtree(os.path.join(self.path, variable) if variable else self.path, ignore_errors=True)
+
+    def swap_staging(self):
+        """
+        replaces the store with it's completed staging store (if one exists)
+        """
+        if self.path == self.staging_path or not os.path.exists(self.staging_path):
+            return
+        retired_path = self.path + '.retired'
+        shutil.rmtree(retired_path, ignore_errors=True)
+        if os.path.exists(self.path):
+            os.replace(self.path, retired_path)
+        os.replace(self.staging_path, self.path)
+        shutil.rmtree(retired_path, ignore_errors=True)
+
+    def delete_staging(self):
+        shutil.rmtree(self.staging_path, ignore_errors=True)
+
+    @staticmethod
+    def date_key(date: datetime = None) -> str:
+        if date is None:
+            return STORE_MAX_VALUES_KEY
+        return date.astimezone(pytz.utc).strftime('%Y-%m-%dT%H%M%SZ')
@@ -0,0 +1,213 @@
+import time
+import logging
+from datetime import datetime
+from typing import Iterable, Iterator, Tuple
+
+import numpy as np
+from django.db import connections
+
+from named_storms.models import NsemPsaData, NsemPsaNode, NsemPsaNodeTimeSeries, NsemPsaVariable
+
+
+logger = logging.getLogger('cwwed')
+
+COPY_NULL = rb'\N'
+COPY_ARRAY_NULL = b'NULL'
+COPY_CHUNK_ROWS = 100000  # number of rows to serialize at a time
+COPY_BUFFER_SIZE = 1024 * 1024  # number of bytes the database driver reads from the stream at a time
+
+# little-endian extended wkb point including an srid
+# https://github.com/postgis/postgis/blob/master/doc/ZMSgeoms.txt
+EWKB_POINT_DTYPE = np.dtype([('byte_order', 'u1'), ('type', '<u4'), ('srid', '<u4'), ('x', '<f8'), ('y', '<f8')])
+EWKB_POINT_TYPE = 0x20000001  # point type with the srid flag
+EWKB_HEX = np.array(['{:02X}'.format(i).encode() for i in range(256)])  # hex lookup for every possible byte
+
+
+def ewkb_points_hex(lons: np.ndarray, lats: np.ndarray, srid=4326) -> np.ndarray:
+    """
+    builds hex encoded extended wkb points directly from coordinate arrays which postgis parses natively
+    (no wkt round trip) and returns them as a fixed-width bytes array
+    """
+    points = np.empty(len(lons), dtype=EWKB_POINT_DTYPE)
+    points['byte_order'] = 1
+    points['type'] = EWKB_POINT_TYPE
+    points['srid'] = srid
+    points['x'] = lons
+    points['y'] = lats
+    # map every byte to its two hex characters and join them back together per point
+    hex_bytes = EWKB_HEX[points.view(np.uint8).reshape(-1, EWKB_POINT_DTYPE.itemsize)]
+    return hex_bytes.view('S{}'.format(2 * EWKB_POINT_DTYPE.itemsize)).ravel()
+
+
+class CopyStream:
+    """
+    file-like object that lazily reads from an iterator of byte chunks so COPY data never has to be
+    written to a temporary file or fully held in memory
+    """
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = chunks
+        self._chunk = b''
+        self._position = 0
+
+    def read(self, size=-1) -> bytes:
+        parts = []
+        remaining = size
+        while size < 0 or remaining > 0:
+            # move to the next chunk once the current one has been consumed
+            if self._position >= len(self._chunk):
+                self._chunk = next(self._chunks, b'')
+                self._position = 0
+                if not self._chunk:
+                    break
+            end = len(self._chunk) if size < 0 else self._position + remaining
+            part = self._chunk[self._position:end]
+            self._position += len(part)
+            remaining -= len(part)
+            parts.append(part)
+        return b''.join(parts)
+
+    def readline(self, size=-1) -> bytes:
+        # not used by COPY FROM but part of the file interface psycopg2 expects
+        return self.read(size)
+
+
+class PsaCopyWriter:
+    """
+    streams rows built from numpy arrays into postgres via it's COPY mechanism
+    https://www.postgresql.org/docs/12/sql-copy.html
+    https://www.psycopg.org/docs/cursor.html#cursor.copy_expert
+    """
+
+    table: str = None
+    columns: list = None
+
+    def __init__(self, table: str = None, chunk_rows: int = COPY_CHUNK_ROWS):
+        self.table = table or self.table
+        self.chunk_rows = chunk_rows
+
+    def copy(self, rows: Iterator[bytes], counter: dict) -> Tuple[int, float]:
+        """
+        copies the generated chunks of rows and returns the number of rows written and the elapsed time
+        """
+
+        sql = 'COPY {table} ({columns}) FROM STDIN'.format(
+            table=self.table,
+            columns=', '.join(self.columns),
+        )
+
+        start_time = time.time()
+
+        with connections['default'].cursor() as cursor:
+            cursor.copy_expert(sql, CopyStream(rows), size=COPY_BUFFER_SIZE)
+
+        elapsed_time = time.time() - start_time
+
+        logger.info('copied {rows} rows into {table} in {time:.2f}s ({rate:.0f} rows/sec)'.format(
+            rows=counter['rows'], table=self.table, time=elapsed_time, rate=counter['rows'] / elapsed_time if elapsed_time else 0))
+
+        return counter['rows'], elapsed_time
+
+
+class PsaNodeCopyWriter(PsaCopyWriter):
+    """
+    copies a psa dataset's mesh nodes with their points encoded as hex ewkb
+    """
+
+    table = NsemPsaNode._meta.db_table
+    columns = [
+        NsemPsaNode._meta.pk.attname,
+        NsemPsaNode.nsem_psa_manifest_dataset.field.attname,
+        NsemPsaNode.index.field.attname,
+        NsemPsaNode.point.field.attname,
+    ]
+
+    def write(self, psa_manifest_dataset_id: int, ids: np.ndarray, indexes: np.ndarray, lons: np.ndarray, lats: np.ndarray) -> Tuple[int, float]:
+        counter = {'rows': len(ids)}
+        return self.copy(self._rows(psa_manifest_dataset_id, ids, indexes, lons, lats), counter)
+
+    def _rows(self, psa_manifest_dataset_id: int, ids: np.ndarray, indexes: np.ndarray, lons: np.ndarray, lats: np.ndarray) -> Iterator[bytes]:
+        # generates chunks of tab delimited rows in postgres' text COPY format
+
+        dataset = '\t{}\t'.format(psa_manifest_dataset_id).encode()
+
+        for i in range(0, len(ids), self.chunk_rows):
+            chunk = slice(i, i + self.chunk_rows)
+            points = ewkb_points_hex(lons[chunk], lats[chunk])
+            yield b''.join([
+                node_id + dataset + index + b'\t' + point + b'\n'
+                for node_id, index, point in zip(ids[chunk].astype(bytes), indexes[chunk].astype(bytes), points)])
+
+
+class PsaDataCopyWriter(PsaCopyWriter):
+    """
+    copies psa data values which reference their mesh nodes by id (the table is usually the psa's partition or staging table)
+    """
+
+    table = NsemPsaData._meta.db_table
+    columns = [
+        NsemPsaData.nsem.field.attname,
+        NsemPsaData.nsem_psa_variable.field.attname,
+        NsemPsaData.node.field.attname,
+        NsemPsaData.value.field.attname,
+        NsemPsaData.date.field.attname,
+    ]
+
+    def write_chunks(self, psa_variable: NsemPsaVariable, chunks: Iterable[Tuple[np.ndarray, np.ndarray]], date: datetime = None) -> Tuple[int, float]:
+        """
+        copies (node ids, values) chunks of rows in a single COPY as they're generated and returns the number
+        of rows written and the elapsed time
+        """
+        counter = {'rows': 0}
+        return self.copy(self._rows(psa_variable, chunks, date, counter), counter)
+
+    def _rows(self, psa_variable: NsemPsaVariable, chunks: Iterable[Tuple[np.ndarray, np.ndarray]], date: datetime, counter: dict) -> Iterator[bytes]:
+        # generates chunks of tab delimited rows in postgres' text COPY format
+
+        prefix = '{}\t{}\t'.format(psa_variable.nsem_id, psa_variable.id).encode()
+        suffix = b'\t' + (date.isoformat().encode() if date is not None else COPY_NULL) + b'\n'
+
+        for node_ids, values in chunks:
+            counter['rows'] += len(values)
+            for i in range(0, len(values), self.chunk_rows):
+                chunk = slice(i, i + self.chunk_rows)
+                # shortest round-trip representation of each value
+                yield b''.join([
+                    prefix + node_id + b'\t' + value + suffix
+                    for node_id, value in zip(node_ids[chunk].astype(bytes), values[chunk].astype(bytes))])
+
+
+class PsaNodeTimeSeriesCopyWriter(PsaCopyWriter):
+    """
+    copies every node's full time-series for a variable as a single array row
+    """
+
+    table = NsemPsaNodeTimeSeries._meta.db_table
+    columns = [
+        NsemPsaNodeTimeSeries.nsem_psa_variable.field.attname,
+        NsemPsaNodeTimeSeries.node.field.attname,
+        NsemPsaNodeTimeSeries.values.field.attname,
+    ]
+
+    def write_chunks(self, psa_variable_id: int, chunks: Iterable[Tuple[np.ndarray, np.ndarray]]) -> Tuple[int, float]:
+        """
+        copies (node ids, (time, node) values) chunks and returns the number of rows written and the elapsed time
+        """
+        counter = {'rows': 0}
+        return self.copy(self._rows(psa_variable_id, chunks, counter), counter)
+
+    def _rows(self, psa_variable_id: int, chunks: Iterable[Tuple[np.ndarray, np.ndarray]], counter: dict) -> Iterator[bytes]:
+        # generates chunks of tab delimited rows in postgres' text COPY format with array literals, i.e {1.5,NULL,2}
+
+        prefix = '{}\t'.format(psa_variable_id).encode()
+
+        for node_ids, values in chunks:
+            counter['rows'] += len(node_ids)
+            for i in range(0, len(node_ids), self.chunk_rows):
+                chunk = slice(i, i + self.chunk_rows)
+                # node-major values with nulls for absent values
+                chunk_values = values[:, chunk].T
+                chunk_bytes = np.where(np.isnan(chunk_values), COPY_ARRAY_NULL, chunk_values.astype(bytes))
+                yield b''.join([
+                    prefix + node_id + b'\t{' + b','.join(node_values) + b'}\n'
+                    for node_id, node_values in zip(node_ids[chunk].astype(bytes), chunk_bytes)])
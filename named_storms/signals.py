@@ -1,11 +1,47 @@
 from django.conf import settings
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_delete
 from rest_framework.authtoken.models import Token
 
+from named_storms.models import NsemPsa
+from named_storms.psa.artifacts import PsaContourArtifacts
+from named_storms.psa.store import PsaStore
+from named_storms.sql import create_psa_partitions_query, drop_psa_partitions_query
+
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     """Automatically create API Tokens for new users"""
     if created:
         Token.objects.create(user=instance)
+
+
+@receiver(post_save, sender=NsemPsa)
+def create_psa_partitions(sender, instance: NsemPsa = None, created=False, **kwargs):
+    """Create the partitions for a new psa's data and contours"""
+    if created:
+        create_psa_partitions_query(instance.id)
+
+
+@receiver(pre_delete, sender=NsemPsa)
+def drop_psa_partitions(sender, instance: NsemPsa = None, **kwargs):
+    """
+    Drop a psa's data and contour partitions before the cascading delete so it doesn't have to delete every row
+    (the nodes are bulk deleted by NsemPsa.delete() since they're collected before this signal is sent)
+    """
+    drop_psa_partitions_query(instance.id)
+
+
+@receiver(pre_delete, sender=NsemPsa)
+def delete_psa_contour_artifacts(sender, instance: NsemPsa = None, **kwargs):
+    """Delete a psa's pre-rendered contours"""
+    PsaContourArtifacts(instance.named_storm_id, instance.id).delete()
+
+
+@receiver(pre_delete, sender=NsemPsa)
+def delete_psa_stores(sender, instance: NsemPsa = None, **kwargs):
+    """Delete a psa's data stores (and any staging stores from an unfinished reingest)"""
+    for psa_manifest_dataset in instance.nsempsamanifestdataset_set.all():
+        store = PsaStore(psa_manifest_dataset)
+        store.delete()
+        store.delete_staging()
@@ -1,26 +1,51 @@
 from django.contrib.gis import geos
-from django.db import connection
+from django.db import connection, transaction
 from datetime import datetime
-from named_storms.models import NsemPsaVariable
+from typing import List
+from named_storms.models import NsemPsaVariable, NsemPsaData, NsemPsaContour, NsemPsaContourLevel, NsemPsaNodeTimeSeries
 
 
-def wind_barbs_query(psa_id: int, date: datetime, center: geos.Point, step=10):
+# tables which are list partitioned by psa (nsem) so a psa's rows can be dropped or swapped as a whole
+PSA_PARTITIONED_TABLES = (
+    NsemPsaData._meta.db_table,
+    NsemPsaContour._meta.db_table,
+    NsemPsaContourLevel._meta.db_table,
+)
+
+# tables which aren't partitioned but are still staged while reingesting a psa and replaced by variable when swapped in
+PSA_STAGED_TABLES = (
+    NsemPsaNodeTimeSeries._meta.db_table,
+)
+
+
+def wind_barbs_expand_distance(step: int) -> float:
+    # show more spatial distance (degrees) of wind barbs when zoomed out
+    return .2 if step == 1 else .8
+
+
+def wind_barbs_query(psa_id: int, date: datetime, center: geos.Point, step=10, node_ids: List[int] = None):
+    """
+    wind directions and speeds around a center point, or at specific nodes (i.e from the psa's node indexes)
+    """
 
     with connection.cursor() as cursor:
         sql = '''
             SELECT
-               ST_AsText(d1.point),
+               ST_AsText(node.point),
                d1.value AS direction,
                d2.value AS speed
             FROM named_storms_nsempsadata d1
                 INNER JOIN named_storms_nsempsavariable v1 ON (
                     v1.nsem_id = %(psa_id)s AND
                     v1.name = %(wind_direction)s AND
+                    d1.nsem_id = %(psa_id)s AND
                     d1.date = %(date)s AND
                     d1.nsem_psa_variable_id = v1.id
                 )
+                INNER JOIN named_storms_nsempsanode node ON node.id = d1.node_id
                 INNER JOIN named_storms_nsempsadata d2 ON (
-                        d1.point = d2.point AND
+                        d2.nsem_id = %(psa_id)s AND
+                        d1.node_id = d2.node_id AND
                         d2.date = %(date)s AND
                         d1.id != d2.id
                 )
@@ -32,9 +57,12 @@ def wind_barbs_query(psa_id: int, date: datetime, center: geos.Point, step=10):
                 INNER JOIN named_storms_nsempsa nsn ON nsn.id = v1.nsem_id
                 INNER JOIN named_storms_namedstorm n ON n.id = nsn.named_storm_id
             WHERE
-                 ST_Within(d1.point::geometry, ST_Expand(ST_GeomFromText(%(center)s, 4326), %(expand_distance)s)) AND
+                 {nodes_condition} AND
                  d1.id %% %(step)s = 0
-        '''
+        '''.format(
+            nodes_condition='d1.node_id = ANY(%(node_ids)s)' if node_ids is not None else
+            'ST_Within(node.point::geometry, ST_Expand(ST_GeomFromText(%(center)s, 4326), %(expand_distance)s))',
+        )
 
         params = {
             'psa_id': psa_id,
@@ -43,10 +71,343 @@ def wind_barbs_query(psa_id: int, date: datetime, center: geos.Point, step=10):
             'wind_speed': NsemPsaVariable.VARIABLE_DATASET_WIND_SPEED,
             'step': step,
             'center': center.wkt,
-            # show more spatial distance of wind barbs when zoomed out
-            'expand_distance': .2 if step == 1 else .8,
+            'expand_distance': wind_barbs_expand_distance(step),
+            'node_ids': [int(node_id) for node_id in node_ids] if node_ids is not None else None,
+        }
+
+        cursor.execute(sql, params)
+
+        return cursor.fetchall()
+
+
+def nearest_psa_nodes_query(psa_id: int, points: List[geos.Point], distance: float) -> list:
+    """
+    returns the (point position, node id, psa dataset id, node index) of the nearest node to every point in each of a
+    psa's datasets within a distance (meters). each dataset's nearest node to a point is found with a KNN (<->)
+    index scan which stops at the first node, and every point is resolved in a single query
+    """
+
+    with connection.cursor() as cursor:
+        sql = '''
+            WITH points AS (
+                SELECT p.position - 1 AS position, ST_SetSRID(ST_MakePoint(p.lon, p.lat), 4326)::geography AS geog
+                FROM unnest(%(lons)s::float8[], %(lats)s::float8[]) WITH ORDINALITY AS p(lon, lat, position)
+            )
+            SELECT points.position, node.id, ds.id, node.index
+            FROM points
+                CROSS JOIN named_storms_nsempsamanifestdataset ds
+                CROSS JOIN LATERAL (
+                    SELECT n.id, n.index, n.point
+                    FROM named_storms_nsempsanode n
+                    WHERE n.nsem_psa_manifest_dataset_id = ds.id
+                    ORDER BY n.point <-> points.geog
+                    LIMIT 1
+                ) node
+            WHERE
+                ds.nsem_id = %(psa_id)s AND
+                ST_DWithin(node.point, points.geog, %(distance)s)
+            ORDER BY points.position, ds.id
+        '''
+
+        params = {
+            'psa_id': psa_id,
+            'lons': [point.x for point in points],
+            'lats': [point.y for point in points],
+            'distance': distance,
         }
 
         cursor.execute(sql, params)
 
         return cursor.fetchall()
+
+
+def psa_contour_tile_query(psa_id: int, nsem_psa_variable_id: int, date: datetime, z: int, x: int, y: int,
+                           extent=4096, buffer=64) -> bytes:
+    """
+    mapbox vector tile of a psa variable's contours at a date (or without a date for "max-values" variables)
+    """
+
+    with connection.cursor() as cursor:
+        sql = '''
+            WITH bounds AS (
+                SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS geom
+            ),
+            tile AS (
+                SELECT
+                    ST_AsMVTGeom(ST_Transform(c.geo::geometry, 3857), bounds.geom, %(extent)s, %(buffer)s, true) AS geom,
+                    c.value,
+                    c.color AS fill,
+                    c.color AS stroke
+                FROM named_storms_nsempsacontour c
+                    CROSS JOIN bounds
+                WHERE
+                    c.nsem_id = %(psa_id)s AND
+                    c.nsem_psa_variable_id = %(nsem_psa_variable_id)s AND
+                    {date_condition} AND
+                    c.geo && ST_Transform(bounds.geom, 4326)::geography
+            )
+            SELECT ST_AsMVT(tile.*, %(layer)s, %(extent)s, 'geom')
+            FROM tile
+            WHERE tile.geom IS NOT NULL
+        '''.format(
+            date_condition='c.date = %(date)s' if date is not None else 'c.date IS NULL',
+        )
+
+        params = {
+            'psa_id': psa_id,
+            'nsem_psa_variable_id': nsem_psa_variable_id,
+            'date': date,
+            'z': z,
+            'x': x,
+            'y': y,
+            'extent': extent,
+            'buffer': buffer,
+            'layer': 'contours',
+        }
+
+        cursor.execute(sql, params)
+
+        return bytes(cursor.fetchone()[0] or b'')
+
+
+def save_contours_query(nsem_id: int, nsem_psa_variable_id: int, date: datetime, named_storm_id: int, polygons: list, values: list, colors: list,
+                        table: str = NsemPsaContour._meta.db_table) -> int:
+    """
+    bulk inserts contour polygons in a single statement while fixing any self-intersecting "bow ties"
+    and trimming them to the storm's geo, skipping empty results.  Returns the number of inserted contours.
+    the table can be a psa's staging table when reingesting
+    """
+
+    with connection.cursor() as cursor:
+        sql = '''
+            WITH storm AS (
+                SELECT geo::geometry AS geom
+                FROM named_storms_namedstorm
+                WHERE id = %(named_storm_id)s
+            ), contours AS (
+                SELECT
+                    CASE WHEN ST_IsValid(c.geom) THEN c.geom ELSE ST_Buffer(c.geom, 0) END AS geom,
+                    c.value,
+                    c.color
+                FROM (
+                    SELECT ST_GeomFromWKB(wkb, 4326) AS geom, value, color
+                    FROM unnest(%(polygons)s::bytea[], %(values)s::float8[], %(colors)s::varchar[]) AS t(wkb, value, color)
+                ) c
+            ), clipped AS (
+                SELECT ST_Intersection(contours.geom, storm.geom) AS geom, contours.value, contours.color
+                FROM contours
+                    CROSS JOIN storm
+                WHERE ST_Intersects(contours.geom, storm.geom)
+            )
+            INSERT INTO {table} (nsem_id, nsem_psa_variable_id, date, geo, value, color)
+            SELECT %(nsem_id)s, %(nsem_psa_variable_id)s, %(date)s::timestamptz, clipped.geom::geography, clipped.value, clipped.color
+            FROM clipped
+            WHERE NOT ST_IsEmpty(clipped.geom)
+        '''.format(table=table)
+
+        params = {
+            'nsem_id': nsem_id,
+            'nsem_psa_variable_id': nsem_psa_variable_id,
+            'date': date,
+            'named_storm_id': named_storm_id,
+            'polygons': [bytes(polygon.wkb) for polygon in polygons],
+            'values': [float(value) for value in values],
+            'colors': list(colors),
+        }
+
+        cursor.execute(sql, params)
+
+        return cursor.rowcount
+
+
+def save_contour_levels_query(nsem_psa_variable_id: int, date: datetime, tolerances: List[float],
+                              contour_table: str = NsemPsaContour._meta.db_table, table: str = NsemPsaContourLevel._meta.db_table) -> int:
+    """
+    saves a variable/date's contours simplified to every level of detail (tolerance in degrees) from it's saved contours.
+    the simplification preserves each polygon's topology so they stay valid and are never collapsed/dropped.
+    the tables can be a psa's staging tables when reingesting.  Returns the number of inserted contours
+    """
+
+    with connection.cursor() as cursor:
+        sql = '''
+            INSERT INTO {table} (nsem_id, nsem_psa_variable_id, date, tolerance, geo, value, color)
+            SELECT c.nsem_id, c.nsem_psa_variable_id, c.date, t.tolerance,
+                ST_SimplifyPreserveTopology(c.geo::geometry, t.tolerance)::geography, c.value, c.color
+            FROM {contour_table} c
+                CROSS JOIN unnest(%(tolerances)s::float8[]) AS t(tolerance)
+            WHERE c.nsem_psa_variable_id = %(nsem_psa_variable_id)s AND {date_condition}
+        '''.format(table=table, contour_table=contour_table, date_condition='c.date IS NULL' if date is None else 'c.date = %(date)s')
+
+        cursor.execute(sql, {'nsem_psa_variable_id': nsem_psa_variable_id, 'date': date, 'tolerances': [float(t) for t in tolerances]})
+
+        return cursor.rowcount
+
+
+def delete_psa_nodes_query(nsem_id: int, nsem_psa_manifest_dataset_id: int):
+    """
+    deletes a psa dataset's nodes along with all the data referencing them in bulk (vs django's per-object cascade).
+    the psa's id restricts the data delete to the psa's partition
+    """
+
+    with connection.cursor() as cursor:
+        sql = '''
+            WITH nodes AS (
+                SELECT id FROM named_storms_nsempsanode
+                WHERE nsem_psa_manifest_dataset_id = %(nsem_psa_manifest_dataset_id)s
+            ), data AS (
+                DELETE FROM named_storms_nsempsadata
+                WHERE nsem_id = %(nsem_id)s AND node_id IN (SELECT id FROM nodes)
+            ), time_series AS (
+                DELETE FROM named_storms_nsempsanodetimeseries
+                WHERE node_id IN (SELECT id FROM nodes)
+            )
+            DELETE FROM named_storms_nsempsanode
+            WHERE id IN (SELECT id FROM nodes)
+        '''
+
+        cursor.execute(sql, {'nsem_id': nsem_id, 'nsem_psa_manifest_dataset_id': nsem_psa_manifest_dataset_id})
+
+
+def reserve_ids_query(table: str, count: int) -> int:
+    """
+    reserves a contiguous block of primary keys from a table's sequence and returns the first id.
+    the table is locked (until the end of the transaction) so concurrent reservations can't interleave
+    """
+
+    with connection.cursor() as cursor:
+        sql = '''
+            LOCK TABLE {table} IN EXCLUSIVE MODE;
+            SELECT setval(pg_get_serial_sequence(%(table)s, 'id'), nextval(pg_get_serial_sequence(%(table)s, 'id')) + %(count)s - 1);
+        '''.format(table=table)
+
+        cursor.execute(sql, {'table': table, 'count': count})
+
+        return cursor.fetchone()[0] - count + 1
+
+
+def psa_partition_table(table: str, nsem_id: int) -> str:
+    return '{}_psa_{}'.format(table, int(nsem_id))
+
+
+def create_psa_partitions_query(nsem_id: int):
+    """
+    creates a psa's partition of every psa partitioned table (if they don't already exist)
+    """
+
+    with connection.cursor() as cursor:
+        for table in PSA_PARTITIONED_TABLES:
+            cursor.execute('CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table} FOR VALUES IN ({nsem_id})'.format(
+                partition=psa_partition_table(table, nsem_id), table=table, nsem_id=int(nsem_id)))
+
+
+def drop_psa_partitions_query(nsem_id: int):
+    """
+    drops a psa's partition (and any staging table) of every psa partitioned table which removes all of it's rows at once (vs deleting them)
+    """
+
+    with connection.cursor() as cursor:
+        for table in PSA_PARTITIONED_TABLES:
+            cursor.execute('DROP TABLE IF EXISTS {partition}, {staging}'.format(
+                partition=psa_partition_table(table, nsem_id), staging=psa_staging_table(table, nsem_id)))
+        for table in PSA_STAGED_TABLES:
+            cursor.execute('DROP TABLE IF EXISTS {staging}'.format(staging=psa_staging_table(table, nsem_id)))
+
+
+def psa_staging_table(table: str, nsem_id: int) -> str:
+    return '{}_staging'.format(psa_partition_table(table, nsem_id))
+
+
+def delete_psa_variable_date_query(table: str, nsem_psa_variable_id: int, date: datetime = None):
+    """
+    deletes a variable's rows at a date (or without a date for "max-values" variables) from a psa partition or staging table
+    """
+
+    with connection.cursor() as cursor:
+        # separate null/equality conditions (vs "IS NOT DISTINCT FROM") so the (variable, date) index can be used
+        sql = '''
+            DELETE FROM {table}
+            WHERE nsem_psa_variable_id = %(nsem_psa_variable_id)s AND {date_condition}
+        '''.format(table=table, date_condition='date IS NULL' if date is None else 'date = %(date)s')
+
+        cursor.execute(sql, {'nsem_psa_variable_id': nsem_psa_variable_id, 'date': date})
+
+
+def delete_psa_variable_query(table: str, nsem_psa_variable_id: int):
+    """
+    deletes all of a variable's rows from a table (or it's psa staging table)
+    """
+
+    with connection.cursor() as cursor:
+        sql = 'DELETE FROM {table} WHERE nsem_psa_variable_id = %(nsem_psa_variable_id)s'.format(table=table)
+        cursor.execute(sql, {'nsem_psa_variable_id': nsem_psa_variable_id})
+
+
+def psa_staging_tables_exist_query(nsem_id: int) -> bool:
+    """
+    whether a psa is being reingested into staging tables
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [psa_staging_table(PSA_PARTITIONED_TABLES[0], nsem_id)])
+        return cursor.fetchone()[0]
+
+
+def create_psa_staging_tables_query(nsem_id: int):
+    """
+    creates empty staging tables for a psa reingest which can be swapped in as the psa's partitions once they're complete.
+    they're created like their table (columns, defaults, indexes) along with it's foreign keys and, for partitioned tables,
+    a check constraint for the psa so attaching them later doesn't have to scan or validate their rows
+    """
+
+    with connection.cursor() as cursor:
+        for table in PSA_PARTITIONED_TABLES + PSA_STAGED_TABLES:
+            staging = psa_staging_table(table, nsem_id)
+            cursor.execute('DROP TABLE IF EXISTS {staging}'.format(staging=staging))
+            cursor.execute('CREATE TABLE {staging} (LIKE {table} INCLUDING ALL)'.format(staging=staging, table=table))
+            if table in PSA_PARTITIONED_TABLES:
+                cursor.execute('ALTER TABLE {staging} ADD CONSTRAINT psa_partition_check CHECK (nsem_id = {nsem_id})'.format(
+                    staging=staging, nsem_id=int(nsem_id)))
+            cursor.execute('''
+                SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+                WHERE conrelid = %s::regclass AND contype = 'f'
+            ''', [table])
+            for name, definition in cursor.fetchall():
+                cursor.execute('ALTER TABLE {staging} ADD CONSTRAINT {name} {definition}'.format(
+                    staging=staging, name=name, definition=definition))
+
+
+def drop_psa_staging_tables_query(nsem_id: int):
+    """
+    drops a psa's staging tables, i.e when a reingest failed
+    """
+
+    with connection.cursor() as cursor:
+        for table in PSA_PARTITIONED_TABLES + PSA_STAGED_TABLES:
+            cursor.execute('DROP TABLE IF EXISTS {staging}'.format(staging=psa_staging_table(table, nsem_id)))
+
+
+def swap_psa_staging_tables_query(nsem_id: int):
+    """
+    swaps a psa's completed staging tables in as it's partitions and drops the previous partitions (and replaces the
+    psa variables' rows of the staged tables) in a single transaction so readers either see the previous psa data or the new data
+    """
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for table in PSA_PARTITIONED_TABLES:
+            partition = psa_partition_table(table, nsem_id)
+            cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [partition])
+            if cursor.fetchone()[0]:
+                cursor.execute('ALTER TABLE {table} DETACH PARTITION {partition}'.format(table=table, partition=partition))
+                cursor.execute('DROP TABLE {partition}'.format(partition=partition))
+            cursor.execute('ALTER TABLE {staging} RENAME TO {partition}'.format(
+                staging=psa_staging_table(table, nsem_id), partition=partition))
+            cursor.execute('ALTER TABLE {table} ATTACH PARTITION {partition} FOR VALUES IN ({nsem_id})'.format(
+                table=table, partition=partition, nsem_id=int(nsem_id)))
+        for table in PSA_STAGED_TABLES:
+            staging = psa_staging_table(table, nsem_id)
+            cursor.execute('''
+                DELETE FROM {table}
+                WHERE nsem_psa_variable_id IN (SELECT id FROM {variable_table} WHERE nsem_id = %(nsem_id)s)
+            '''.format(table=table, variable_table=NsemPsaVariable._meta.db_table), {'nsem_id': nsem_id})
+            cursor.execute('INSERT INTO {table} SELECT * FROM {staging}'.format(table=table, staging=staging))
+            cursor.execute('DROP TABLE {staging}'.format(staging=staging))
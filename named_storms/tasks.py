@@ -7,6 +7,7 @@ import xarray as xr
 import boto3
 import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from celery.utils.log import get_task_logger
 from cfchecker import cfchecks
 from botocore.client import Config as BotoCoreConfig
@@ -14,10 +15,10 @@ from datetime import datetime, timedelta
 from django.contrib.auth.models import User
 from django.conf import settings
 from django.contrib.gis.db.models import Collect, GeometryField, Func, F
-from django.contrib.gis.db.models.functions import Intersection, MakeValid, AsKML, GeoHash
+from django.contrib.gis.db.models.functions import Intersection, MakeValid, AsKML
 from django.core.exceptions import EmptyResultSet
 from django.core.mail import send_mail
-from django.db import connection
+from django.db import connection, transaction
 from django.db.models import CharField
 from django.db.models.functions import Cast
 from django.http import Http404
@@ -29,16 +30,21 @@ from geopandas import GeoDataFrame
 from cwwed.celery import app
 from cwwed.storage_backends import S3ObjectStoragePrivate
 from named_storms.data.processors import ProcessorData
+from named_storms.psa.artifacts import PsaContourArtifacts
 from named_storms.psa.processor import PsaDatasetProcessor
+from named_storms.psa.store import PsaStore
 from named_storms.models import (
     NamedStorm, CoveredDataProvider, CoveredData, NamedStormCoveredDataLog, NsemPsa, NsemPsaUserExport,
     NsemPsaContour, NsemPsaVariable, NamedStormCoveredDataSnapshot, NsemPsaManifestDataset, NsemPsaData)
 from named_storms.psa.validator import PsaDatasetValidator
+from named_storms.sql import (
+    psa_staging_tables_exist_query, swap_psa_staging_tables_query, drop_psa_staging_tables_query, psa_contour_tile_query,
+)
 from named_storms.utils import (
     processor_class, copy_path_to_default_storage, get_superuser_emails,
     named_storm_nsem_version_path, root_data_path, create_directory,
-    get_geojson_feature_collection_from_psa_qs, named_storm_path,
-    named_storm_covered_data_current_path)
+    iter_geojson_feature_collection_from_psa_qs, named_storm_path,
+    named_storm_covered_data_current_path, get_tiles_within_extent)
 
 # celery logger
 logger = get_task_logger(__name__)
@@ -530,30 +536,33 @@ def create_psa_user_export_task(nsem_psa_user_export_id: int):
 
             ds_out_path = os.path.join(tmp_user_export_path, psa_dataset.path)  # dataset extension is expected to already be .nc
 
-            # filter points within the user's bounding box
-            all_data = NsemPsaData.objects.annotate(
-                geo_hash=GeoHash('point'),
+            # filter nodes within the user's bounding box
+            nodes = psa_dataset.nsempsanode_set.annotate(
                 geom_point=Cast('point', GeometryField()),
             ).filter(
-                nsem_psa_variable__name__in=psa_dataset.variables,
-                nsem_psa_variable__nsem=nsem_psa,
                 geom_point__within=nsem_psa_user_export.bbox,
-            ).distinct(
-                'geo_hash',
             ).order_by(
-                'geo_hash',
+                'index',
             ).only(
+                'index',
                 'point',
             )
 
             # export's bounding box didn't contain any points/data
-            if not all_data.exists():
+            if not nodes.exists():
                 continue
 
-            all_points = [d.point for d in all_data]
+            nodes = list(nodes)
+
+            # position of each node in the export
+            node_positions = {node.id: i for i, node in enumerate(nodes)}
+            node_index_positions = {node.index: i for i, node in enumerate(nodes)}
+
+            # columnar store of the psa dataset's data
+            store = PsaStore(psa_dataset)
 
             # build the dataset coordinates
-            coords = np.array([p.coords for p in all_points])
+            coords = np.array([node.point.coords for node in nodes])
             ds_coords = {
                 'time': (['time'], dates_to_export),
                 'lon': (['node'], coords[:, 0]),
@@ -567,43 +576,31 @@ def create_psa_user_export_task(nsem_psa_user_export_id: int):
             )
             for psa_variable in psa_dataset.nsem.nsempsavariable_set.filter(**variable_kwargs):
 
-                # build results for data in each date in the psa
-                results = []
-                for date in dates_to_export:
-                    variable_data = psa_variable.nsempsadata_set.annotate(
-                        geo_hash=GeoHash('point'),
-                    ).filter(
-                        geo_hash__in=[d.geo_hash for d in all_data],
+                # build results for data in each date in the psa with NaN for absent values
+                results = np.full((len(dates_to_export), len(nodes)), np.nan)
+                for i, date in enumerate(dates_to_export):
+
+                    # read from the store if it exists
+                    stored = store.read_date(psa_variable.name, date, indexes=node_index_positions.keys())
+                    if stored is not None:
+                        for index, value in zip(*stored):
+                            results[i, node_index_positions[index]] = value
+                        continue
+
+                    variable_data = psa_variable.nsempsadata_set.filter(
+                        nsem_id=psa_variable.nsem_id,
+                        node__in=list(node_positions),
                         date=date,
-                    ).only(
+                    ).values_list(
+                        'node_id',
                         'value',
-                        'point',
-                    ).order_by(
-                        'geo_hash',
                     )
-                    variable_data = list(variable_data)
-                    variable_points = [d.point for d in variable_data]
-                    result = []
-
-                    # iterate over point/data list and insert NaN for absent values
-                    for point in all_points:
-                        try:
-                            idx = variable_points.index(point)
-                        # no value at this point
-                        except ValueError:
-                            result.append(np.nan)
-                        # insert value for this located point
-                        else:
-                            result.append(variable_data[idx].value)
-                            # remove found object from lists
-                            variable_data.pop(idx)
-                            variable_points.pop(idx)
-
-                    results.append(result)
+                    for node_id, value in variable_data:
+                        results[i, node_positions[node_id]] = value
 
                 # add the data array to the dataset
                 ds_out[psa_variable.name] = xr.DataArray(
-                    np.array(results),
+                    results,
                     coords=ds_coords,
                     dims=['time', 'node'],
                     attrs=psa_variable.meta,
@@ -666,6 +663,7 @@ def create_psa_user_export_task(nsem_psa_user_export_id: int):
 
             # fetch the ids of the psa data for this psa variable and that intersects the export's requested bbox
             kwargs = dict(
+                nsem_id=psa_geom_variable.nsem_id,
                 nsem_psa_variable__id=psa_geom_variable.id,
                 geo__intersects=nsem_psa_user_export.bbox,
             )
@@ -681,7 +679,7 @@ def create_psa_user_export_task(nsem_psa_user_export_id: int):
             # cast to CharField for GeoPandas
             # use ST_MakeValid due to ring self-intersections which ST_Intersection chokes on
             # use ST_CollectionHomogenize to guarantee we only get (multi)geometries
-            qs = NsemPsaContour.objects.filter(id__in=data_ids)
+            qs = NsemPsaContour.objects.filter(nsem_id=psa_geom_variable.nsem_id, id__in=data_ids)
             qs = qs.values('value')
             qs = qs.annotate(
                 geom=Cast(
@@ -709,6 +707,7 @@ def create_psa_user_export_task(nsem_psa_user_export_id: int):
 
         for psa_variable in nsem_psa_user_export.nsem.nsempsavariable_set.all():
             data_kwargs = dict(
+                nsem_id=psa_variable.nsem_id,
                 geo__intersects=nsem_psa_user_export.bbox,
             )
             # only include date if it's a time series variable
@@ -738,7 +737,7 @@ def create_psa_user_export_task(nsem_psa_user_export_id: int):
             elif nsem_psa_user_export.format == NsemPsaUserExport.FORMAT_GEOJSON:
                 # write geojson to file
                 with open(os.path.join(tmp_user_export_path, '{}.json'.format(psa_variable.name)), 'w') as fh:
-                    fh.write(get_geojson_feature_collection_from_psa_qs(qs))
+                    fh.writelines(iter_geojson_feature_collection_from_psa_qs(qs))
 
     # no data found in the export's bounding box
     if len(os.listdir(tmp_user_export_path)) == 0:
@@ -854,46 +853,125 @@ def email_psa_user_export_task(nsem_psa_user_export_id: int):
 
 
 @app.task(**TASK_ARGS_RETRY, queue=settings.CWWED_QUEUE_PROCESS_PSA)
-def cache_psa_contour_task(storm_id: int):
+def write_psa_contour_artifacts_task(nsem_psa_id: int):
     """
-    Automatically creates cached responses for a storm's PSA contour results by crawling every api endpoint
+    Pre-renders a psa's contour geojson for every polygon variable/date and level of detail as compressed static
+    artifacts which the contour endpoint serves directly
     """
 
-    nsem = NsemPsa.get_last_valid_psa(storm_id=storm_id)  # type: NsemPsa
-    if not nsem:
-        logger.exception('There is not a valid PSA for storm id {}'.format(storm_id))
-        raise
+    nsem_psa = get_object_or_404(NsemPsa, pk=nsem_psa_id)
+    artifacts = PsaContourArtifacts(nsem_psa.named_storm_id, nsem_psa.id)
 
-    logger.info('Caching psa geojson for nsem psa {}'.format(nsem))
+    logger.info('Writing psa contour artifacts for nsem psa {}'.format(nsem_psa))
 
-    # loop through every polygon variable
-    for psa_variable in nsem.nsempsavariable_set.filter(geo_type=NsemPsaVariable.GEO_TYPE_POLYGON):  # type: NsemPsaVariable
-        url = '{scheme}://{host}:{port}{path}'.format(
-            scheme=settings.CWWED_SCHEME,
-            host=settings.CWWED_HOST,
-            port=settings.CWWED_PORT,
-            path=reverse('psa-contour', args=[storm_id]),
-        )
-        # request every date of the PSA for time-series variables
+    # tiles seeded from a previous ingest of this psa are stale
+    artifacts.delete_tiles()
+
+    # full resolution and every simplified level of detail
+    tolerances = [None] + list(settings.CWWED_PSA_CONTOUR_TOLERANCES)
+    # total payload size of each level of detail by content encoding
+    level_sizes = {tolerance: {} for tolerance in tolerances}
+    stats = {'hits': 0, 'misses': 0, 'bytes_written': 0}
+
+    # every polygon variable's dates (once for max-values variables) and levels of detail
+    renders = []
+    for psa_variable in nsem_psa.nsempsavariable_set.filter(geo_type=NsemPsaVariable.GEO_TYPE_POLYGON):  # type: NsemPsaVariable
+        dates = nsem_psa.dates if psa_variable.data_type == NsemPsaVariable.DATA_TYPE_TIME_SERIES else [None]
+        for date in dates:
+            for tolerance in tolerances:
+                renders.append((psa_variable, date, tolerance))
+
+    def render(psa_variable: NsemPsaVariable, date: datetime, tolerance: float):
+        try:
+            return artifacts.render(nsem_psa, psa_variable, date, tolerance)
+        finally:
+            # every thread opens it's own database connection
+            connection.close()
+
+    # render concurrently since the time is spent querying the database and compressing
+    with ThreadPoolExecutor(max_workers=settings.CWWED_PSA_CONTOUR_ARTIFACT_WORKERS) as executor:
+        for (psa_variable, date, tolerance), (hit, written, sizes) in zip(renders, executor.map(lambda args: render(*args), renders)):
+            stats['hits' if hit else 'misses'] += 1
+            if written:
+                stats['bytes_written'] += sum(size for encoding, size in sizes.items() if encoding != 'geojson')
+            for encoding, size in sizes.items():
+                level_sizes[tolerance][encoding] = level_sizes[tolerance].get(encoding, 0) + size
+            logger.info('{} {} contours for {} (tolerance={}): {}'.format('Skipped' if hit else 'Rendered', psa_variable.name, date, tolerance, sizes))
+
+    for tolerance, sizes in level_sizes.items():
+        logger.info('{}: contour level of detail (tolerance={}) payload sizes: {}'.format(nsem_psa, tolerance, sizes))
+    logger.info('{}: contour artifacts hits={hits}, misses={misses}, bytes written={bytes_written}'.format(nsem_psa, **stats))
+
+    # this psa's artifacts are served from now on
+    artifacts.delete_other_psas()
+
+
+@app.task(**TASK_ARGS_RETRY, queue=settings.CWWED_QUEUE_PROCESS_PSA)
+def seed_psa_contour_tiles_task(nsem_psa_id: int):
+    """
+    Pre-seeds a psa's contour vector tiles for every polygon variable/date over the storm's extent
+    up to the configured zoom level (if enabled)
+    """
+
+    max_zoom = settings.CWWED_PSA_CONTOUR_TILE_SEED_MAX_ZOOM
+    if not max_zoom:
+        return
+
+    nsem_psa = get_object_or_404(NsemPsa, pk=nsem_psa_id)
+    artifacts = PsaContourArtifacts(nsem_psa.named_storm_id, nsem_psa.id)
+    extent = nsem_psa.named_storm.geo.extent
+
+    logger.info('Seeding psa contour tiles for nsem psa {} through zoom {}'.format(nsem_psa, max_zoom))
+
+    for psa_variable in nsem_psa.nsempsavariable_set.filter(geo_type=NsemPsaVariable.GEO_TYPE_POLYGON):  # type: NsemPsaVariable
+        # every date of the PSA for time-series variables and once for max-values variables
         if psa_variable.data_type == NsemPsaVariable.DATA_TYPE_TIME_SERIES:
-            data = {
-                'nsem_psa_variable': psa_variable.name,
-                '_cacheId': nsem.id,  # using psa as cache busting parameter
-            }
-            for nsem_date in nsem.dates:  # type: datetime
-                data['date'] = nsem_date.strftime('%Y-%m-%dT%H:%M:%SZ')  # uses "Z" for zulu/UTC
-                # send the raw query string so the date format doesn't get url encoded
-                query = '&'.join(['{}={}'.format(key, value) for key, value in data.items()])
-                r = requests.get('{}?{}'.format(url, query))
-                logger.info('Cached {} with status {}'.format(r.url, r.status_code))
-        # request once for max-values variable
-        elif psa_variable.data_type == NsemPsaVariable.DATA_TYPE_MAX_VALUES:
-            data = {
-                'nsem_psa_variable': psa_variable.name,
-            }
-            r = requests.get(url, data)
-            logger.info('Cached {} with status {}'.format(r.url, r.status_code))
-            logger.info(r.status_code)
+            dates = nsem_psa.dates
+        else:
+            dates = [None]
+        for date in dates:
+            tiles = 0
+            for z in range(max_zoom + 1):
+                for x, y in get_tiles_within_extent(extent, z):
+                    tile = psa_contour_tile_query(nsem_psa.id, psa_variable.id, date, z, x, y)
+                    artifacts.write_tile(psa_variable.name, date, z, x, y, tile)
+                    tiles += 1
+            logger.info('Seeded {} {} tiles for {}'.format(tiles, psa_variable.name, date))
+
+
+@app.task(**TASK_ARGS_RETRY, **TASK_ARGS_ACK_LATE, queue=settings.CWWED_QUEUE_PROCESS_PSA)
+def ingest_nsem_psa_statistics_task(nsem_psa_id: int):
+    """
+    Computes global statistics for every NSEM PSA variable once before the variables are ingested
+    """
+    nsem_psa = get_object_or_404(NsemPsa, pk=nsem_psa_id)
+    for dataset_manifest in nsem_psa.nsempsamanifestdataset_set.all():  # type: NsemPsaManifestDataset
+        processor = PsaDatasetProcessor(psa_manifest_dataset=dataset_manifest)
+        for variable in dataset_manifest.variables:
+            processor.ingest_variable_statistics(variable)
+    logger.info('{}: statistics have been successfully ingested'.format(nsem_psa))
+
+
+@app.task(**TASK_ARGS_RETRY, **TASK_ARGS_ACK_LATE, queue=settings.CWWED_QUEUE_PROCESS_PSA)
+def ingest_nsem_psa_nodes_task(nsem_psa_id: int):
+    """
+    Saves every NSEM PSA Dataset's mesh nodes once before the variables are ingested
+    """
+    nsem_psa = get_object_or_404(NsemPsa, pk=nsem_psa_id)
+    for dataset_manifest in nsem_psa.nsempsamanifestdataset_set.all():  # type: NsemPsaManifestDataset
+        PsaDatasetProcessor(psa_manifest_dataset=dataset_manifest).ingest_nodes()
+    logger.info('{}: nodes have been successfully ingested'.format(nsem_psa))
+
+
+@app.task(**TASK_ARGS_RETRY, **TASK_ARGS_ACK_LATE, queue=settings.CWWED_QUEUE_PROCESS_PSA)
+def ingest_nsem_psa_wind_barbs_task(nsem_psa_id: int):
+    """
+    Precomputes every NSEM PSA Dataset's decimated wind barbs once the variables have been ingested
+    """
+    nsem_psa = get_object_or_404(NsemPsa, pk=nsem_psa_id)
+    for dataset_manifest in nsem_psa.nsempsamanifestdataset_set.all():  # type: NsemPsaManifestDataset
+        PsaDatasetProcessor(psa_manifest_dataset=dataset_manifest).ingest_wind_barbs()
+    logger.info('{}: wind barbs have been successfully ingested'.format(nsem_psa))
 
 
 @app.task(**TASK_ARGS_RETRY, **TASK_ARGS_ACK_LATE, queue=settings.CWWED_QUEUE_PROCESS_PSA)
@@ -907,12 +985,71 @@ def ingest_nsem_psa_dataset_variable_task(psa_dataset_id: int, variable: str, da
     logger.info('{}: {} variable (date={}) has been successfully ingested'.format(dataset_manifest, variable, date))
 
 
+@app.task(**TASK_ARGS_RETRY, **TASK_ARGS_ACK_LATE, queue=settings.CWWED_QUEUE_PROCESS_PSA)
+def ingest_nsem_psa_dataset_variable_dates_task(psa_dataset_id: int, variable: str, dates: list):
+    """
+    Ingests an NSEM PSA Dataset time-series variable for many dates in a single pass
+    """
+    dataset_manifest = get_object_or_404(NsemPsaManifestDataset, pk=psa_dataset_id)
+    assert variable in dataset_manifest.variables, 'Variable not found in {}'.format(dataset_manifest)
+    PsaDatasetProcessor(psa_manifest_dataset=dataset_manifest).ingest_variable_dates(variable, dates)
+    logger.info('{}: {} variable ({} dates) has been successfully ingested'.format(dataset_manifest, variable, len(dates)))
+
+
+@app.task(**TASK_ARGS_RETRY, **TASK_ARGS_ACK_LATE, queue=settings.CWWED_QUEUE_PROCESS_PSA)
+def ingest_nsem_psa_dataset_variable_time_series_task(psa_dataset_id: int, variable: str):
+    """
+    Ingests an NSEM PSA Dataset time-series variable's full time-series for every node
+    """
+    dataset_manifest = get_object_or_404(NsemPsaManifestDataset, pk=psa_dataset_id)
+    assert variable in dataset_manifest.variables, 'Variable not found in {}'.format(dataset_manifest)
+    PsaDatasetProcessor(psa_manifest_dataset=dataset_manifest).ingest_variable_time_series(variable)
+    logger.info('{}: {} variable time-series has been successfully ingested'.format(dataset_manifest, variable))
+
+
+@app.task(**TASK_ARGS_RETRY, queue=settings.CWWED_QUEUE_PROCESS_PSA)
+def swap_nsem_psa_staging_task(nsem_psa_id: int):
+    """
+    Swaps a reingested NSEM PSA's staging tables (and stores) in once the whole PSA has been ingested
+    """
+    nsem_psa = get_object_or_404(NsemPsa, pk=nsem_psa_id)
+
+    # not a reingest
+    if not psa_staging_tables_exist_query(nsem_psa.id):
+        return
+
+    psa_processors = [PsaDatasetProcessor(psa_manifest_dataset) for psa_manifest_dataset in nsem_psa.nsempsamanifestdataset_set.all()]
+
+    # swap in the data and the variable attributes derived from it together
+    with transaction.atomic():
+        swap_psa_staging_tables_query(nsem_psa.id)
+        for psa_processor in psa_processors:
+            psa_processor.apply_staged_variable_attributes()
+
+    for psa_processor in psa_processors:
+        psa_processor.finish_reingest()
+
+    # the psa's contour artifacts are stale so they're served from the database until they've been rewritten
+    PsaContourArtifacts(nsem_psa.named_storm_id, nsem_psa.id).delete()
+
+    logger.info('{}: staging tables have been swapped in'.format(nsem_psa))
+
+
 @app.task(**TASK_ARGS_RETRY, queue=settings.CWWED_QUEUE_PROCESS_PSA)
 def postprocess_psa_ingest_task(nsem_psa_id: int, success: bool):
     """
     Update the psa as processed and email the "nsem" user indicating the PSA has been ingested
     """
     nsem_psa = get_object_or_404(NsemPsa, pk=nsem_psa_id)
+
+    # a failed reingest (at any step since this is the whole ingest chain's error callback) discards it's staging
+    # tables and stores, so later ingests don't write to them, and leaves the current psa data in place
+    reingest_failed = not success and psa_staging_tables_exist_query(nsem_psa.id)
+    if reingest_failed:
+        drop_psa_staging_tables_query(nsem_psa.id)
+        for psa_manifest_dataset in nsem_psa.nsempsamanifestdataset_set.all():
+            PsaStore(psa_manifest_dataset).delete_staging()
+
     nsem_user = User.objects.get(username=settings.CWWED_NSEM_USER)
     nsem_psa_api_url = "{}://{}:{}{}".format(
         settings.CWWED_SCHEME, settings.CWWED_HOST, settings.CWWED_PORT, reverse('nsempsa-detail', args=[nsem_psa.id]))
@@ -926,10 +1063,11 @@ def postprocess_psa_ingest_task(nsem_psa_id: int, success: bool):
         psa_manifest_dataset.meta_lon = psa_processor.get_variable_metadata('lon')
         psa_manifest_dataset.save()
 
-    # save psa as processed
-    nsem_psa.processed = success
-    nsem_psa.date_processed = timezone.now()
-    nsem_psa.save()
+    # save psa as processed (unless a reingest failed since the psa's previous data is still in place)
+    if not reingest_failed:
+        nsem_psa.processed = success
+        nsem_psa.date_processed = timezone.now()
+        nsem_psa.save()
 
     msg = 'PSA {psa} {msg}'.format(
         msg='has been successfully ingested' if success else 'failed during ingestion',
@@ -1,11 +1,40 @@
+import os
+import json
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 import xarray as xr
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 from cfchecker import cfchecks
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.gis import geos
+from django.db import connection
+from django.db.models import Max
+from django.test.utils import CaptureQueriesContext
 from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError, NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
 
+from named_storms.api.arrow import PSA_DATA_SCHEMA, record_batches, iter_arrow_stream, write_parquet
+from named_storms.api.filters import NsemPsaDataFilter
+from named_storms.api.pagination import PsaDataKeysetPagination
+from named_storms.api.permissions import DjangoModelPermissionsOrAnonReadOnlyBatch
+from named_storms.api.viewsets import NsemPsaViewSet, NsemPsaTimeSeriesViewSet, NsemPsaContourViewSet, NsemPsaContourTileViewSet
+from named_storms.models import NsemPsaContour, NsemPsaContourLevel, NsemPsaData, NsemPsaNode
+from named_storms.tasks import postprocess_psa_ingest_task
 from named_storms.tests.base import BaseTest
+from named_storms.psa.artifacts import PsaContourArtifacts
+from named_storms.psa.contour import ContourEngine
+from named_storms.psa.node_index import PsaNodeIndex
+from named_storms.psa.processor import PsaDatasetProcessor
+from named_storms.psa.store import PsaStore
 from named_storms.psa.validator import PsaDatasetValidator
+from named_storms.psa.writer import ewkb_points_hex, PsaNodeTimeSeriesCopyWriter
+from named_storms.utils import (
+    get_tiles_within_extent, get_tile_xy, get_psa_contour_qs, get_psa_contour_tolerance, iter_geojson_feature_collection, iter_ndjson, iter_chunks,
+)
 
 
 class PSATest(BaseTest):
@@ -76,11 +105,270 @@ class PSATest(BaseTest):
         self.assertTrue(validator.is_valid_unstructured_topology('element'), 'missing element')
         self.assertTrue(validator.is_valid_unstructured_start_index('element'), 'missing start_index')
 
+    def test_ewkb_points(self):
+        # vectorized ewkb should match geos' encoding
+        lons = np.array([-74.5, 1.0])
+        lats = np.array([39.25, 2.0])
+        for point, lon, lat in zip(ewkb_points_hex(lons, lats), lons, lats):
+            self.assertEqual(point, geos.Point(lon, lat, srid=4326).hexewkb)
+
+    def test_time_series_copy_rows(self):
+        node_ids = np.array([7, 8])
+        values = np.array([[1.5, np.nan], [2, 3.25]])  # (time, node)
+        rows = b''.join(PsaNodeTimeSeriesCopyWriter()._rows(1, [(node_ids, values)], {'rows': 0}))
+        self.assertEqual(rows, b'1\t7\t{1.5,2.0}\n1\t8\t{NULL,3.25}\n')
+
+    def test_build_polygons(self):
+        # an exterior with a hole containing an island which has its own hole
+        rings = [
+            self._square(0, 0, 10, 10),
+            self._square(1, 1, 9, 9)[::-1],  # interior rings are clockwise
+            self._square(2, 2, 8, 8),
+            self._square(3, 3, 7, 7)[::-1],
+        ]
+        polygons = PsaDatasetProcessor.build_polygons(rings)
+        self.assertEqual(len(polygons), 2, 'Expected two exteriors')
+        self.assertEqual(sorted(p.area for p in polygons), [20, 36], 'Interior rings assigned to the wrong exterior')
+        self.assertTrue(all(len(p) == 2 for p in polygons), 'Expected a single hole per polygon')
+
+    def test_contour_engine(self):
+        x, y = np.arange(20, dtype=float), np.arange(10, dtype=float)
+        z = np.add.outer(y, x)
+        z[0, 0] = np.nan
+        serial = ContourEngine(10).contour_grid(x, y, z)
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            threaded = ContourEngine(10, executor=executor, workers=3).contour_grid(x, y, z)
+        self.assertEqual(len(serial.paths), len(serial.levels) - 1, 'Expected paths for every level')
+        self.assertTrue(np.array_equal(serial.levels, threaded.levels), 'Threaded levels differ')
+        for serial_paths, threaded_paths in zip(serial.paths, threaded.paths):
+            self.assertEqual(
+                [p.vertices.tolist() for p in serial_paths],
+                [p.vertices.tolist() for p in threaded_paths],
+                'Threaded contours differ')
+        # every value is null
+        empty = ContourEngine(10).contour_grid(x, y, np.full_like(z, np.nan))
+        self.assertFalse(any(empty.paths), 'Expected no contours')
+
+    def test_variable_statistics(self):
+        values = np.arange(30, dtype=float).reshape(15, 2)
+        values[3] = np.nan
+        da = xr.DataArray(values, dims=['time', 'node'])
+        statistics = PsaDatasetProcessor.variable_statistics(da)
+        self.assertEqual(statistics['min'], 0)
+        self.assertEqual(statistics['max'], 29)
+        self.assertEqual(statistics['count'], 28)
+        self.assertEqual(statistics['null_count'], 2)
+        self.assertEqual(statistics['percentiles']['50'], np.nanpercentile(values, 50))
+
+    def test_time_series_batch_points(self):
+        viewset = NsemPsaTimeSeriesViewSet()
+        coordinates = [[-74.0, 39.0], [-73.0, 40.0]]
+        expected = [(-74.0, 39.0), (-73.0, 40.0)]
+        self.assertEqual([p.coords for p in viewset._batch_points(coordinates)], expected)
+        self.assertEqual([p.coords for p in viewset._batch_points({'type': 'MultiPoint', 'coordinates': coordinates})], expected)
+        # transect sampled along the line
+        transect = {'type': 'Feature', 'geometry': {'type': 'LineString', 'coordinates': coordinates}, 'samples': 3}
+        self.assertEqual([p.coords for p in viewset._batch_points(transect)], [(-74.0, 39.0), (-73.5, 39.5), (-73.0, 40.0)])
+        self.assertRaises(ValidationError, viewset._batch_points, {'type': 'Polygon', 'coordinates': []})
+        self.assertRaises(ValidationError, viewset._batch_points, [])
+        # samples are bounded before interpolating
+        for samples in (0, -1, viewset.MAX_POINTS + 1):
+            self.assertRaises(ValidationError, viewset._batch_points, dict(transect, samples=samples))
+        # coordinates are bounded before the nearest node lookups
+        for coordinates in ([[-181, 39]], [[-74, 91]], [[float('nan'), 39]]):
+            self.assertRaises(ValidationError, viewset._batch_points, coordinates)
+
+    def test_time_series_batch_permissions(self):
+        permission = DjangoModelPermissionsOrAnonReadOnlyBatch()
+        request = APIRequestFactory().post('/')
+        request.user = AnonymousUser()
+        # anyone can post a (read-only) batch but no other writes
+        self.assertTrue(permission.has_permission(request, NsemPsaTimeSeriesViewSet(action='batch')))
+        self.assertFalse(permission.has_permission(request, NsemPsaTimeSeriesViewSet(action='create')))
+
+    def test_node_index(self):
+        lons = np.array([-74.0, -73.0, -72.0])
+        lats = np.array([39.0, 40.0, 41.0])
+        node_index = PsaNodeIndex(ids=[10, 11, 12], indexes=[0, 1, 2], lons=lons, lats=lats)
+        # nearest node within ~1km
+        positions, found = node_index.nearest([-73.001, -60.0], [40.001, 30.0], 1000)
+        self.assertEqual(found.tolist(), [True, False])
+        self.assertEqual(node_index.ids[positions[found]].tolist(), [11])
+        # nodes within a bounding box
+        self.assertEqual(node_index.within_bbox(-74.5, 38.5, -72.5, 40.5).tolist(), [0, 1])
+        # positions of mesh indexes (which were saved with the psa)
+        node_index = PsaNodeIndex(ids=[10, 11, 12], indexes=[7, 2, 9], lons=lons, lats=lats)
+        positions, found = node_index.positions([2, 3, 9, 10])
+        self.assertEqual(found.tolist(), [True, False, True, False])
+        self.assertEqual(node_index.ids[positions[found]].tolist(), [11, 12])
+        # coordinates are kept at the saved nodes' (double) precision
+        node_index = PsaNodeIndex(ids=[10], indexes=[0], lons=[-73.123456789], lats=[40.123456789])
+        self.assertEqual((node_index.lons[0], node_index.lats[0]), (-73.123456789, 40.123456789))
+
+    def test_contour_artifacts(self):
+        with tempfile.TemporaryDirectory() as data_dir, self.settings(CWWED_DATA_DIR=data_dir):
+            artifacts = PsaContourArtifacts(self.nsem_psa.named_storm_id, self.nsem_psa.id)
+            date = self.nsem_psa.dates[0]
+            geojson = ['{"type": "FeatureCollection", ', '"features": []}']
+            etag, written, size = artifacts.write('water_level', date, geojson)
+            self.assertTrue(written)
+            self.assertEqual(size, len(''.join(geojson)))
+            # identical artifacts aren't rewritten
+            self.assertEqual(artifacts.write('water_level', date, geojson)[:2], (etag, False))
+            # served in the preferred encoding
+            path, encoding, artifact_etag = artifacts.read('water_level', date, 'gzip, deflate, br')
+            self.assertEqual((encoding, artifact_etag), ('br', '"{}-br"'.format(etag)))
+            path, encoding, artifact_etag = artifacts.read('water_level', date, 'gzip')
+            self.assertEqual((encoding, artifact_etag), ('gzip', '"{}-gzip"'.format(etag)))
+            self.assertIsNone(artifacts.read('water_level', None, 'gzip'))
+            # other psas' artifacts are removed once this psa's have been written
+            other_artifacts = PsaContourArtifacts(self.nsem_psa.named_storm_id, self.nsem_psa.id + 1)
+            other_artifacts.write('water_level', date, geojson)
+            artifacts.delete_other_psas()
+            self.assertIsNone(other_artifacts.read('water_level', date, 'gzip'))
+            self.assertIsNotNone(artifacts.read('water_level', date, 'gzip'))
+
+    def test_contour_artifacts_render(self):
+        with tempfile.TemporaryDirectory() as data_dir, self.settings(CWWED_DATA_DIR=data_dir):
+            artifacts = PsaContourArtifacts(self.nsem_psa.named_storm_id, self.nsem_psa.id)
+            psa_variable = self.nsem_psa.nsempsavariable_set.first()
+            hit, written, sizes = artifacts.render(self.nsem_psa, psa_variable, None)
+            self.assertEqual((hit, written), (False, True))
+            # artifacts rendered from the same ingest are skipped without querying the contours
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(artifacts.render(self.nsem_psa, psa_variable, None), (True, False, sizes))
+            self.assertEqual(len(queries), 0)
+            # and rendered again once the psa is reingested
+            self.nsem_psa.date_processed = parse_datetime('2020-01-01T00:00:00Z')
+            self.assertEqual(artifacts.render(self.nsem_psa, psa_variable, None)[:2], (False, False))
+
+    def test_staged_variable_attributes(self):
+        with tempfile.TemporaryDirectory() as data_dir, self.settings(CWWED_DATA_DIR=data_dir):
+            psa_manifest_dataset = self.nsem_psa.nsempsamanifestdataset_set.first()
+            store = PsaStore(psa_manifest_dataset, staging=True)
+            self.assertIsNone(store.read_variable_attributes('water_level'))
+            attributes = {'statistics': {'min': 0, 'max': 1}, 'color_bar': [], 'meta': {}}
+            store.write_variable_attributes('water_level', attributes)
+            self.assertEqual(store.read_variable_attributes('water_level'), attributes)
+            # the current store doesn't see the staged attributes until it's swapped in
+            self.assertIsNone(PsaStore(psa_manifest_dataset).read_variable_attributes('water_level'))
+            PsaStore(psa_manifest_dataset).swap_staging()
+            self.assertEqual(PsaStore(psa_manifest_dataset).read_variable_attributes('water_level'), attributes)
+
+    def test_data_filter_point(self):
+        data_filter = NsemPsaDataFilter(queryset=NsemPsaData.objects.none())
+        self.assertRaises(ValidationError, data_filter.filter_point, NsemPsaData.objects.none(), 'point', 'not a point')
+        self.assertRaises(ValidationError, data_filter.filter_point, NsemPsaData.objects.none(), 'point', 'LINESTRING(0 0, 1 1)')
+
+    def test_delete_psa_nodes_in_bulk(self):
+        psa_manifest_dataset = self.nsem_psa.nsempsamanifestdataset_set.first()
+        start = (psa_manifest_dataset.nsempsanode_set.aggregate(index=Max('index'))['index'] or 0) + 1
+        NsemPsaNode.objects.bulk_create([
+            NsemPsaNode(nsem_psa_manifest_dataset=psa_manifest_dataset, index=start + i, point=geos.Point(-74, 39 + i / 100))
+            for i in range(100)])
+        with CaptureQueriesContext(connection) as queries:
+            self.nsem_psa.delete()
+        self.assertFalse(NsemPsaNode.objects.filter(nsem_psa_manifest_dataset_id=psa_manifest_dataset.id).exists())
+        # the nodes were deleted before django collected the cascade so it never cascaded to their data by node id
+        self.assertFalse([query for query in queries.captured_queries if '"node_id" IN' in query['sql']])
+        self.assertLess(len(queries), 50)
+
+    def test_delete_psa_stores(self):
+        with tempfile.TemporaryDirectory() as data_dir, self.settings(CWWED_DATA_DIR=data_dir):
+            psa_manifest_dataset = self.nsem_psa.nsempsamanifestdataset_set.first()
+            store, staging_store = PsaStore(psa_manifest_dataset), PsaStore(psa_manifest_dataset, staging=True)
+            store.write_variable_attributes('water_level', {})
+            staging_store.write_variable_attributes('water_level', {})
+            self.nsem_psa.delete()
+            # the stores aren't left behind
+            self.assertFalse(os.path.exists(store.path))
+            self.assertFalse(os.path.exists(staging_store.path))
+
+    def test_ingest_psa_chain_failure(self):
+        # every step (including the statistics and nodes tasks before the chord) reports a failure which
+        # marks the psa as failed and discards a reingest's staging tables and stores
+        ingest_chain = NsemPsaViewSet.get_ingest_psa_chain(self.nsem_psa.id)
+        errback = postprocess_psa_ingest_task.si(self.nsem_psa.id, False)
+        for task in ingest_chain.tasks:
+            self.assertIn(errback, task.options.get('link_error', []))
+
+    def test_tiles_within_extent(self):
+        self.assertEqual(list(get_tiles_within_extent((-180, -90, 180, 90), 0)), [(0, 0)])
+        self.assertEqual(get_tile_xy(-74, 40.7, 10), (301, 385))
+        # an extent straddling tiles at zoom 1
+        self.assertEqual(sorted(get_tiles_within_extent((-10, -10, 10, 10), 1)), [(0, 0), (0, 1), (1, 0), (1, 1)])
+
+    def test_contour_tolerance(self):
+        with self.settings(CWWED_PSA_CONTOUR_TOLERANCES=[0.0005, 0.002, 0.008]):
+            self.assertIsNone(get_psa_contour_tolerance())
+            self.assertIsNone(get_psa_contour_tolerance(zoom=14))  # pixels are smaller than every level
+            self.assertEqual(get_psa_contour_tolerance(zoom=8), 0.002)
+            self.assertEqual(get_psa_contour_tolerance(zoom=2), 0.008)
+            self.assertEqual(get_psa_contour_tolerance(tolerance=0.001), 0.0005)
+            # excessive zoom levels are clamped
+            self.assertIsNone(get_psa_contour_tolerance(zoom=10 ** 9))
+            # and rejected by the contour endpoint
+            self.assertIs(NsemPsaContourViewSet._artifact_tolerance({'zoom': str(NsemPsaContourTileViewSet.MAX_ZOOM + 1)}), False)
+            self.assertEqual(NsemPsaContourViewSet._artifact_tolerance({'zoom': '8'}), 0.002)
+
+    def test_contour_levels(self):
+        psa_variable = self.nsem_psa.nsempsavariable_set.first()
+        # psas without saved levels are simplified on the fly (preserving topology so slivers aren't dropped)
+        self.assertIs(get_psa_contour_qs(self.nsem_psa, 0.008).model, NsemPsaContour)
+        sliver = geos.Polygon(((-74, 39), (-73, 39), (-73, 39.0001), (-74, 39.0001), (-74, 39)), srid=4326)
+        NsemPsaContour.objects.create(nsem=self.nsem_psa, nsem_psa_variable=psa_variable, geo=sliver, value=-999, color='#ffffff')
+        contour = get_psa_contour_qs(self.nsem_psa, 0.008).filter(nsem_psa_variable=psa_variable, value=-999).get()
+        self.assertFalse(contour['geom'].empty)
+        # otherwise the level saved at ingest is used
+        NsemPsaContourLevel.objects.create(
+            nsem=self.nsem_psa, nsem_psa_variable=psa_variable, tolerance=0.008, geo=sliver, value=-999, color='#ffffff')
+        self.assertIs(get_psa_contour_qs(self.nsem_psa, 0.008).model, NsemPsaContourLevel)
+        self.assertIs(get_psa_contour_qs(self.nsem_psa).model, NsemPsaContour)
+
+    def test_decimate_points(self):
+        lons = np.array([0.1, 0.45, 0.9, 1.5, -0.5])
+        lats = np.array([0.1, 0.55, 0.9, 0.5, 0.5])
+        # the point nearest the center of each (1 degree) grid cell
+        self.assertEqual(PsaDatasetProcessor.decimate_points(lons, lats, 1).tolist(), [1, 3, 4])
+
+    def test_streamed_geojson(self):
+        features = ['{"type": "Feature", "id": %d}' % i for i in range(3)]
+        collection = ''.join(iter_geojson_feature_collection(iter(features)))
+        self.assertEqual([f['id'] for f in json.loads(collection)['features']], [0, 1, 2])
+        self.assertEqual(''.join(iter_geojson_feature_collection([])), '{"type": "FeatureCollection", "features": []}')
+        self.assertEqual(''.join(iter_ndjson(features)).splitlines(), features)
+        # small strings are buffered into chunks
+        self.assertEqual(list(iter_chunks(['ab', 'cd', 'e'], chunk_size=3)), ['abcd', 'e'])
+
+    def test_keyset_cursor(self):
+        pagination = PsaDataKeysetPagination()
+        date = parse_datetime('2018-09-14T01:00:00Z')
+        for cursor in [(date, 10), (None, 10)]:
+            request = Request(APIRequestFactory().get('/', {'cursor': pagination.encode_cursor(*cursor)}))
+            self.assertEqual(pagination.decode_cursor(request), cursor)
+        self.assertIsNone(pagination.decode_cursor(Request(APIRequestFactory().get('/'))))
+        self.assertRaises(NotFound, pagination.decode_cursor, Request(APIRequestFactory().get('/', {'cursor': 'invalid'})))
+
+    def test_arrow_stream(self):
+        date = parse_datetime('2018-09-14T01:00:00Z')
+        rows = [(i, 'water_level', date, float(i), -74.0, 39.0) for i in range(5)]
+        batches = list(record_batches(iter(rows), PSA_DATA_SCHEMA, batch_size=2))
+        self.assertEqual([batch.num_rows for batch in batches], [2, 2, 1])
+        table = pa.ipc.open_stream(b''.join(iter_arrow_stream(PSA_DATA_SCHEMA, batches))).read_all()
+        self.assertEqual(table.column('value').to_pylist(), [0.0, 1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(table.column('date')[0].as_py(), date)
+        self.assertEqual(pq.read_table(write_parquet(PSA_DATA_SCHEMA, batches)).num_rows, 5)
+
     def _cf_check_results(self, ds_path: str):
         cf_check = cfchecks.CFChecker(silent=True)
         cf_check.checker(ds_path)
         return cf_check.results
 
+    @staticmethod
+    def _square(x_min, y_min, x_max, y_max) -> np.ndarray:
+        # counter-clockwise closed ring
+        return np.array([[x_min, y_min], [x_max, y_min], [x_max, y_max], [x_min, y_max], [x_min, y_min]], dtype=float)
+
     def _save_ds(self, ds: xr.Dataset) -> str:
         with tempfile.NamedTemporaryFile(suffix='.nc', delete=False) as fh:
             ds.to_netcdf(fh.name)
@@ -1,9 +1,13 @@
 import json
+import math
 import os
 import errno
 import shutil
+from typing import Iterable, Iterator, Optional, Tuple
 from urllib import parse
-from django.db.models import QuerySet
+from django.contrib.gis.db.models import Collect, GeometryField
+from django.db.models import QuerySet, Func, Value
+from django.db.models.functions import Cast
 from django.http.request import HttpRequest
 from django.contrib.auth.models import User
 from django.conf import settings
@@ -13,9 +17,14 @@ from cwwed import slack
 from named_storms.models import (
     CoveredDataProvider, NamedStorm, NsemPsa, CoveredData, PROCESSOR_DATA_SOURCE_FILE_GENERIC,
     PROCESSOR_DATA_SOURCE_FILE_BINARY, PROCESSOR_DATA_SOURCE_DAP, PROCESSOR_DATA_SOURCE_FILE_HDF,
-    NamedStormCoveredDataSnapshot,
+    NamedStormCoveredDataSnapshot, NsemPsaContour, NsemPsaContourLevel,
 )
 
+MERCATOR_MAX_LATITUDE = 85.0511287798066  # web mercator's latitude bounds
+MAX_ZOOM = 20  # deepest (256px tile) zoom level
+STREAM_CHUNK_SIZE = 64 * 1024  # minimum size (characters) of each chunk of a streamed response
+STREAM_QUERYSET_CHUNK_SIZE = 100  # rows fetched at a time by a streamed queryset's server-side cursor
+
 
 def slack_channel(message: str, channel='#errors'):
     slack.chat.post_message(channel, message)
@@ -145,6 +154,26 @@ def named_storm_nsem_version_path(nsem: NsemPsa) -> str:
         str(nsem.id))
 
 
+def named_storm_nsem_version_cache_path(nsem: NsemPsa) -> str:
+    """
+    Returns a path to a storm's NsemPsa product's version derived/cached artifacts (i.e meshes and indexes)
+    """
+    return os.path.join(
+        named_storm_nsem_version_path(nsem),
+        settings.CWWED_NSEM_CACHE_DIR_NAME,
+    )
+
+
+def named_storm_nsem_version_store_path(nsem: NsemPsa) -> str:
+    """
+    Returns a path to a storm's NsemPsa product's version columnar data store
+    """
+    return os.path.join(
+        named_storm_nsem_version_path(nsem),
+        settings.CWWED_NSEM_STORE_DIR_NAME,
+    )
+
+
 def copy_path_to_default_storage(source_path: str, destination_path: str):
     """
     Copies source to destination using object storage and returns the path
@@ -215,15 +244,53 @@ def get_opendap_url_covered_data_snapshot(request: HttpRequest, covered_data_sna
     )
 
 
-def get_geojson_feature_collection_from_psa_qs(queryset: QuerySet) -> str:
+def get_psa_contour_qs(nsem: NsemPsa, tolerance: float = None) -> QuerySet:
+    """
+    - group all of a psa's contour geometries together (st_collect) by same variable & value
+    - optionally at a simplified level of detail (tolerance in degrees) which are saved at ingest with a topology
+      preserving simplification (st_simplifypreservetopology) so polygons are never collapsed or dropped.
+      psas ingested before the levels existed (or without the requested level) are simplified the same way on the fly
+    """
+    geom = Cast('geo', GeometryField())
+    if tolerance and NsemPsaContourLevel.objects.filter(nsem=nsem, tolerance=tolerance).exists():
+        qs = NsemPsaContourLevel.objects.filter(nsem=nsem, tolerance=tolerance)
+    else:
+        qs = NsemPsaContour.objects.filter(nsem=nsem)
+        if tolerance:
+            geom = Func(geom, Value(tolerance), function='ST_SimplifyPreserveTopology', output_field=GeometryField())
+    qs = qs.values(*[
+        'value', 'color', 'date', 'nsem_psa_variable__name', 'nsem_psa_variable__data_type',
+        'nsem_psa_variable__display_name', 'nsem_psa_variable__units',
+    ])
+    qs = qs.annotate(geom=Collect(geom))
+    qs = qs.order_by('nsem_psa_variable__name')
+    return qs
+
+
+def get_psa_contour_tolerance(zoom: int = None, tolerance: float = None) -> Optional[float]:
+    """
+    Returns the coarsest contour level of detail (simplification tolerance) which doesn't exceed a requested tolerance
+    or the size of a (256px tile) pixel at a zoom level, or None for full resolution
+    """
+    if zoom is not None:
+        # deeper zoom levels are clamped since their pixels are already smaller than every level of detail
+        tolerance = 360 / (256 * 2 ** min(zoom, MAX_ZOOM))
+    if tolerance is None:
+        return None
+    tolerances = [t for t in settings.CWWED_PSA_CONTOUR_TOLERANCES if t <= tolerance]
+    return max(tolerances) if tolerances else None
+
+
+def iter_geojson_feature_collection_from_psa_qs(queryset: QuerySet) -> Iterator[str]:
     # NOTE: this expects a very specific psa/data queryset
-    # returns a string vs serialized data for performance reasons
+    # streams the feature collection in chunks while iterating the results with a server-side cursor
+    return iter_geojson_feature_collection(_iter_psa_contour_features(queryset))
 
-    features = []
 
+def _iter_psa_contour_features(queryset: QuerySet) -> Iterator[str]:
     # NOTE: we're not serializing the geojson from the database because it's too expensive.
     # instead, just swap in the raw json string value into the feature string
-    for data in queryset:
+    for data in queryset.iterator(chunk_size=STREAM_QUERYSET_CHUNK_SIZE):
         feature = json.dumps({
             "type": "Feature",
             "properties": {
@@ -238,7 +305,65 @@ def get_geojson_feature_collection_from_psa_qs(queryset: QuerySet) -> str:
             },
             "geometry": "@@geometry@@",  # placeholder to swap since we're not serializing the geo json data
         })
-        # swap geo json in and append to feature list
-        features.append(feature.replace('"@@geometry@@"', data['geom'].json))
+        # swap geo json in
+        yield feature.replace('"@@geometry@@"', data['geom'].json)
+
+
+def iter_geojson_feature_collection(features: Iterable[str]) -> Iterator[str]:
+    """
+    Streams a geojson feature collection of (json string) features in chunks of roughly the same size
+    """
+    def collection():
+        yield '{"type": "FeatureCollection", "features": ['
+        for i, feature in enumerate(features):
+            yield ',' + feature if i else feature
+        yield ']}'
+    return iter_chunks(collection())
+
+
+def iter_ndjson(features: Iterable[str]) -> Iterator[str]:
+    """
+    Streams newline delimited (json string) features in chunks of roughly the same size
+    """
+    return iter_chunks(feature + '\n' for feature in features)
 
-    return '{{"type": "FeatureCollection", "features": [{features}]}}'.format(features=','.join(features))
+
+def iter_chunks(strings: Iterable[str], chunk_size: int = None) -> Iterator[str]:
+    """
+    Joins strings into chunks of at least a minimum size so streamed (and incrementally compressed) responses
+    aren't flushed for every small string
+    """
+    chunk_size = chunk_size or STREAM_CHUNK_SIZE
+    buffer = []
+    size = 0
+    for string in strings:
+        buffer.append(string)
+        size += len(string)
+        if size >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def get_tile_xy(lon: float, lat: float, z: int) -> Tuple[int, int]:
+    """
+    Returns the (x, y) of the web mercator (xyz) tile containing a point at a zoom level
+    """
+    lat = max(min(lat, MERCATOR_MAX_LATITUDE), -MERCATOR_MAX_LATITUDE)
+    n = 2 ** z
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def get_tiles_within_extent(extent: tuple, z: int) -> Iterator[Tuple[int, int]]:
+    """
+    Yields the (x, y) of every web mercator (xyz) tile covering an extent (xmin, ymin, xmax, ymax) at a zoom level
+    """
+    x_min, y_min = get_tile_xy(extent[0], extent[3], z)  # tile rows increase southward
+    x_max, y_max = get_tile_xy(extent[2], extent[1], z)
+    for x in range(x_min, x_max + 1):
+        for y in range(y_min, y_max + 1):
+            yield x, y
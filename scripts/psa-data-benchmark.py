@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+import io
+import json
+import argparse
+from time import perf_counter
+from urllib import parse
+import requests
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+API_ROOT_LOCAL = 'http://localhost:8000/api/'
+
+DESCRIPTION = """
+Benchmarks downloading a named storm's PSA data (a variable at a date) as json vs arrow/parquet:
+    - bytes transferred (uncompressed)
+    - download time
+    - decode time
+"""
+
+
+def fetch_json(url: str, params: dict, session: requests.Session):
+    # follow every page of the paginated json results
+    content = []
+    params = dict(params, limit=10000)
+    while url:
+        response = session.get(url, params=params)
+        response.raise_for_status()
+        content.append(response.content)
+        url = response.json()['next']
+        params = None  # included in the next url
+    return content
+
+
+def decode_json(content: list):
+    rows = []
+    for page in content:
+        rows.extend(json.loads(page)['results'])
+    return len(rows)
+
+
+def decode_geojson(content: list):
+    return len(json.loads(content[0])['features'])
+
+
+def decode_arrow(content: list):
+    return pa.ipc.open_stream(content[0]).read_all().num_rows
+
+
+def decode_parquet(content: list):
+    return pq.read_table(io.BytesIO(content[0])).num_rows
+
+
+def fetch(url: str, params: dict, session: requests.Session):
+    response = session.get(url, params=params)
+    response.raise_for_status()
+    return [response.content]
+
+
+FORMATS = {
+    'json': (fetch_json, decode_json),
+    'geojson': (fetch, decode_geojson),
+    'arrow': (fetch, decode_arrow),
+    'parquet': (fetch, decode_parquet),
+}
+
+
+def benchmark(api_root: str, storm_id: int, variable: str, date: str = None, formats: list = None, repeat: int = 1):
+    url = parse.urljoin(api_root, 'named-storm/{}/psa/data/'.format(storm_id))
+    session = requests.Session()
+    # compare the formats' own encodings rather than gzip
+    session.headers['Accept-Encoding'] = 'identity'
+
+    print('{:<10}{:>12}{:>14}{:>14}{:>12}'.format('format', 'rows', 'bytes', 'download (s)', 'decode (s)'))
+    for name in formats or FORMATS.keys():
+        fetcher, decoder = FORMATS[name]
+        params = {'nsem_psa_variable': variable}
+        if date:
+            params['date'] = date
+        if name != 'json':
+            params['format'] = name
+        download_time = decode_time = 0
+        for _ in range(repeat):
+            start = perf_counter()
+            content = fetcher(url, params, session)
+            download_time += perf_counter() - start
+            start = perf_counter()
+            rows = decoder(content)
+            decode_time += perf_counter() - start
+        print('{:<10}{:>12}{:>14}{:>14.3f}{:>12.3f}'.format(
+            name, rows, sum(len(c) for c in content), download_time / repeat, decode_time / repeat))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=DESCRIPTION, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--api-root', default=API_ROOT_LOCAL)
+    parser.add_argument('--storm-id', type=int, required=True)
+    parser.add_argument('--variable', required=True, help='psa variable name, i.e "water_level"')
+    parser.add_argument('--date', help='psa date, i.e "2018-09-14T01:00:00Z" (omit for max-values variables)')
+    parser.add_argument('--format', action='append', choices=FORMATS.keys(), help='formats to benchmark (defaults to all)')
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    benchmark(args.api_root, args.storm_id, args.variable, args.date, args.format, args.repeat)